@@ -0,0 +1,186 @@
+import math
+import time
+import itertools
+import threading
+from contextlib import contextmanager
+from metrics import REGISTRY
+
+# リクエスト種別ごとの優先度（小さいほど優先）
+DEFAULT_PRIORITIES = {
+    'search': 0,
+    'query': 1
+}
+
+ADMITTED_METRIC = 'rag_admission_admitted_total'
+REJECTED_METRIC = 'rag_admission_rejected_total'
+QUEUE_METRIC = 'rag_admission_queue_depth'
+WAIT_METRIC = 'rag_admission_wait_seconds'
+
+
+class AdmissionRejected(Exception):
+    """過負荷のためリクエストを受け付けなかった"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    同時実行数の上限と短い待ち行列によるアドミッション制御
+
+    上限に達している間は優先度順に待機させ、締め切りまでに実行枠が空かない場合や
+    待ち行列が満杯の場合は AdmissionRejected を送出する（呼び出し側で503を返す）。
+    待ち行列が満杯のときに優先度の高いリクエストが来た場合は、最も優先度の低い待機中の
+    リクエストを押し出す。
+    """
+
+    def __init__(self, max_in_flight=8, max_queue=16, queue_timeout=2.0, class_limits=None,
+                 priorities=None):
+        """
+        Args:
+            max_in_flight (int): 全体の同時実行数の上限
+            max_queue (int): 待ち行列の長さの上限
+            queue_timeout (float): 待ち行列で待機する最大秒数
+            class_limits (dict, optional): 種別ごとの同時実行数の上限（例: {'query': 6}）
+            priorities (dict, optional): 種別 → 優先度
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.class_limits = dict(class_limits or {})
+        self.priorities = dict(DEFAULT_PRIORITIES)
+        self.priorities.update(priorities or {})
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._class_in_flight = {}
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._service_time = {}
+
+    def _can_run(self, kind):
+        if self._in_flight >= self.max_in_flight:
+            return False
+        limit = self.class_limits.get(kind)
+        return limit is None or self._class_in_flight.get(kind, 0) < limit
+
+    def _next_runnable(self):
+        for waiter in self._waiters:
+            if self._can_run(waiter['kind']):
+                return waiter
+        return None
+
+    def _retry_after(self, kind):
+        # 平均処理時間と待ち行列の長さから再試行までの目安を算出
+        service_time = self._service_time.get(kind, 1.0)
+        backlog = len(self._waiters) + 1
+        return max(1, math.ceil(service_time * backlog / max(1, self.max_in_flight)))
+
+    def _reject(self, kind, reason):
+        REGISTRY.inc(REJECTED_METRIC, labels={'kind': kind, 'reason': reason},
+                     help_text='Requests shed by admission control')
+        raise AdmissionRejected(f"過負荷のためリクエストを受け付けられません（{reason}）",
+                                self._retry_after(kind))
+
+    def _publish_queue_depth(self):
+        REGISTRY.set_gauge(QUEUE_METRIC, len(self._waiters),
+                           help_text='Requests waiting for an admission slot')
+
+    def _acquire(self, kind):
+        priority = self.priorities.get(kind, max(self.priorities.values()) + 1)
+        start = time.monotonic()
+        with self._cond:
+            ahead = any(w['priority'] <= priority and self._can_run(w['kind']) for w in self._waiters)
+            if not ahead and self._can_run(kind):
+                self._start(kind)
+                return
+
+            if len(self._waiters) >= self.max_queue:
+                # 優先度の低い待機中リクエストを押し出して場所を空ける（待ち行列なしの設定では即座に拒否）
+                if not self._waiters:
+                    self._reject(kind, 'queue_full')
+                lowest = max(self._waiters, key=lambda w: (w['priority'], w['sequence']))
+                if lowest['priority'] <= priority:
+                    self._reject(kind, 'queue_full')
+                lowest['evicted'] = True
+                self._waiters.remove(lowest)
+                self._cond.notify_all()
+
+            waiter = {
+                'kind': kind,
+                'priority': priority,
+                'sequence': next(self._sequence),
+                'evicted': False
+            }
+            self._waiters.append(waiter)
+            self._waiters.sort(key=lambda w: (w['priority'], w['sequence']))
+            self._publish_queue_depth()
+
+            deadline = start + self.queue_timeout
+            try:
+                while True:
+                    if waiter['evicted']:
+                        self._reject(kind, 'evicted')
+                    if self._next_runnable() is waiter:
+                        self._waiters.remove(waiter)
+                        self._start(kind)
+                        # 後続の待機者にも実行可能か確認させる
+                        self._cond.notify_all()
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._reject(kind, 'timeout')
+                    self._cond.wait(remaining)
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                self._publish_queue_depth()
+
+        REGISTRY.observe(WAIT_METRIC, time.monotonic() - start, {'kind': kind},
+                         help_text='Time spent waiting for an admission slot')
+
+    def _start(self, kind):
+        self._in_flight += 1
+        self._class_in_flight[kind] = self._class_in_flight.get(kind, 0) + 1
+        REGISTRY.inc(ADMITTED_METRIC, labels={'kind': kind},
+                     help_text='Requests admitted by admission control')
+
+    def _release(self, kind, elapsed):
+        with self._cond:
+            self._in_flight -= 1
+            self._class_in_flight[kind] -= 1
+            previous = self._service_time.get(kind, elapsed)
+            self._service_time[kind] = 0.8 * previous + 0.2 * elapsed
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, kind):
+        """
+        実行枠を確保し、ブロックを抜けるまで保持
+
+        Args:
+            kind (str): リクエストの種別（'search' または 'query'）
+
+        Raises:
+            AdmissionRejected: 過負荷で受け付けられない場合
+        """
+        self._acquire(kind)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(kind, time.monotonic() - start)
+
+    def status(self):
+        """
+        現在の状態を取得
+
+        Returns:
+            dict: 実行中の数、種別ごとの実行中の数、待ち行列の長さ
+        """
+        with self._cond:
+            return {
+                'in_flight': self._in_flight,
+                'class_in_flight': dict(self._class_in_flight),
+                'queued': len(self._waiters)
+            }
@@ -1,5 +1,11 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, g
 from rag_system import FireworksRAGSystem
+from metrics import REGISTRY, track_request
+from admission import AdmissionController, AdmissionRejected
+from profiler import RequestProfiler, format_collapsed, MIN_INTERVAL
+from memory_report import rag_memory_report, publish_memory_metrics
+from metadata_filter import validate_where
+from tfidf_search import validate_vectorizer_params
 import os
 
 # テンプレートディレクトリのパスを設定
@@ -7,6 +13,45 @@ template_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'te
 app = Flask(__name__, template_folder=template_dir)
 rag_system = FireworksRAGSystem()
 
+# アドミッション制御（/search を /query より優先し、過負荷時は503を返す）
+admission = AdmissionController(
+    max_in_flight=int(os.getenv('ADMISSION_MAX_IN_FLIGHT', '8')),
+    max_queue=int(os.getenv('ADMISSION_MAX_QUEUE', '16')),
+    queue_timeout=float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '2.0')),
+    class_limits={'query': int(os.getenv('ADMISSION_MAX_QUERY_IN_FLIGHT', '6'))}
+)
+
+# プロファイリング（PROFILE_SAMPLE_RATE の割合のリクエストだけスタックを採取。既定は無効）
+profiler = RequestProfiler.from_env()
+PROFILED_ENDPOINTS = ('query', 'search')
+
+# ライブプロファイル用のエンドポイントを有効にするか
+PROFILE_ENDPOINT_ENABLED = os.getenv('PROFILE_ENDPOINT_ENABLED') == '1'
+
+# インデックスの管理用エンドポイント（再構築）を有効にするか
+INDEX_ADMIN_ENABLED = os.getenv('INDEX_ADMIN_ENABLED') == '1'
+
+@app.before_request
+def start_profile():
+    # JSONの整形まで含めるため、ビュー関数の外側で採取を開始・終了する
+    if request.endpoint in PROFILED_ENDPOINTS and profiler.should_sample():
+        g.profiled = True
+        profiler.begin()
+
+@app.teardown_request
+def finish_profile(exc=None):
+    if g.pop('profiled', False):
+        profiler.end(request.endpoint)
+
+def overloaded(e):
+    # 過負荷時はRetry-After付きの503を返す
+    response = jsonify({
+        'error': '現在混み合っています。しばらくしてから再度お試しください。'
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -22,10 +67,22 @@ def query():
                 'error': 'クエリが空です。'
             }), 400
         
+        # メタデータによる絞り込み条件（不正な場合は400を返す）
+        where = data.get('filter')
+        if where:
+            validate_where(where)
+        
         # クエリの処理
-        result = rag_system.process_query(query_text)
+        with admission.admit('query'), track_request('query'):
+            result = rag_system.process_query(query_text, where=where)
         return jsonify(result)
     
+    except AdmissionRejected as e:
+        return overloaded(e)
+    except ValueError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
     except Exception as e:
         print(f"エラーが発生しました: {str(e)}")
         return jsonify({
@@ -38,19 +95,31 @@ def search():
         data = request.get_json()
         query_text = data.get('query', '').strip()
         count = data.get('count', 3)
+        where = data.get('filter')
+        domains = data.get('domains')
         
         if not query_text:
             return jsonify({
                 'error': '検索キーワードが空です。'
             }), 400
         
+        if domains is not None and not rag_system.domains:
+            raise ValueError("ドメインが設定されていないため domains は指定できません")
+        
         # TF-IDF検索の実行
-        results = rag_system.search_system.search(query_text, n_results=count)
+        with admission.admit('search'), track_request('search'), \
+                rag_system.index_manager.acquire() as index:
+            if domains is not None:
+                # 検索するドメインを明示した場合はルーターを使わない
+                results = index.search(query_text, n_results=count, where=where, domains=domains)
+            else:
+                results = index.search(query_text, n_results=count, where=where)
         
         # 結果の整形
         formatted_results = []
         for result in results:
             formatted_results.append({
+                'domain': result['metadata'].get('domain'),
                 'source': result['metadata']['source'],
                 'score': f"{(result['score'] * 100):.2f}%",
                 'content': result['content']
@@ -58,11 +127,77 @@ def search():
         
         return jsonify({'results': formatted_results})
     
+    except AdmissionRejected as e:
+        return overloaded(e)
+    except ValueError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
     except Exception as e:
         print(f"検索中にエラーが発生しました: {str(e)}")
         return jsonify({
             'error': '検索中にエラーが発生しました。'
         }), 500
 
+@app.route('/index/rebuild', methods=['POST'])
+def rebuild_index():
+    # インデックスをバックグラウンドで再構築し、完成後に参照の差し替えで公開
+    if not INDEX_ADMIN_ENABLED:
+        return jsonify({'error': 'インデックスの管理用エンドポイントは無効です。'}), 404
+    data = request.get_json(silent=True) or {}
+    params = {}
+    if data.get('vectorizer_params'):
+        try:
+            vectorizer_params = validate_vectorizer_params(data['vectorizer_params'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        params = {'vectorizer_params': vectorizer_params}
+        if not rag_system.domains:
+            params['collection'] = rag_system.collection
+    started = rag_system.index_manager.rebuild_async(**params)
+    status = rag_system.index_manager.status()
+    status['started'] = started
+    return jsonify(status), 202 if started else 409
+
+@app.route('/index/status')
+def index_status():
+    return jsonify(rag_system.index_manager.status())
+
+@app.route('/index/memory')
+def index_memory():
+    # インデックスとキャッシュのメモリ内訳（?sample=N で大きなコンテナを標本から推定）
+    if not INDEX_ADMIN_ENABLED:
+        return jsonify({'error': 'インデックスの管理用エンドポイントは無効です。'}), 404
+    sample = request.args.get('sample', type=int)
+    if sample is not None and sample <= 0:
+        return jsonify({'error': 'sample は正の整数で指定してください。'}), 400
+    report = rag_memory_report(rag_system, sample=sample)
+    publish_memory_metrics(report)
+    return jsonify(report)
+
+@app.route('/debug/profile', methods=['POST'])
+def live_profile():
+    # 稼働中のプロセス全体を指定秒数だけプロファイルし、折りたたみスタックを返す
+    if not PROFILE_ENDPOINT_ENABLED:
+        return jsonify({'error': 'プロファイル用のエンドポイントは無効です。'}), 404
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval = request.args.get('interval')
+        result = profiler.profile_process(seconds, float(interval) if interval else None)
+    except ValueError:
+        return jsonify({'error': f'seconds は正の数、interval は{MIN_INTERVAL}秒以上の数で指定してください。'}), 400
+    if result is None:
+        return jsonify({'error': '別のプロファイルを実行中です。'}), 409
+    stacks, path = result
+    response = Response(format_collapsed(stacks), mimetype='text/plain')
+    if path:
+        response.headers['X-Profile-Path'] = path
+    return response
+
+@app.route('/metrics')
+def metrics():
+    # Prometheusのテキスト形式でメトリクスを出力
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
@@ -3,17 +3,14 @@ import json
 from datetime import datetime
 from rag_system import FireworksRAGSystem
 import os
-import chromadb
-from chromadb.config import Settings
 
 class BatchQuestionProcessor:
     def __init__(self):
         self.rag_system = FireworksRAGSystem()
-        self.DB_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'fireworks_db')
         
-        # ChromaDBの初期化
-        self.client = chromadb.PersistentClient(path=self.DB_DIR)
-        self.unanswered_collection = self.client.get_or_create_collection(name="unanswered_questions")
+        # ChromaDBはRAGシステムと同じ共有クライアントを使用
+        self.DB_DIR = self.rag_system.DB_DIR
+        self.unanswered_collection = self.rag_system.unanswered_collection
         
         # 結果保存用のディレクトリ
         self.results_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'question_results')
@@ -42,7 +39,8 @@ class BatchQuestionProcessor:
                 print(f"抽出されたキーワード: {keywords}")
                 
                 # RAGシステムで質問を処理
-                response = self.rag_system.process_query(row['質問'])
+                # （未回答の質問はペルソナ付きで下で保存するため、ここでは保存しない）
+                response = self.rag_system.process_query(row['質問'], save_unanswered=False)
                 
                 # 結果を保存
                 result = {
@@ -65,15 +63,10 @@ class BatchQuestionProcessor:
                 
                 # 未回答の場合、unanswered_questionsコレクションに追加
                 if not result['is_answered']:
-                    self.unanswered_collection.add(
-                        documents=[row['質問']],
-                        metadatas=[{
-                            'persona': json.dumps(result['persona']),
-                            'keywords': json.dumps(keywords),
-                            'timestamp': datetime.now().isoformat(),
-                            'is_updated': False
-                        }],
-                        ids=[f"unanswered_{datetime.now().timestamp()}"]
+                    self.rag_system.save_unanswered_question(
+                        row['質問'],
+                        keywords,
+                        {'persona': json.dumps(result['persona'])}
                     )
                     unanswered_questions += 1
                     print(f"未回答の質問を保存しました: {row['質問']}")
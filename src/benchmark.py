@@ -0,0 +1,400 @@
+import os
+import io
+import csv
+import gc
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import resource
+from contextlib import redirect_stdout
+from datetime import datetime
+import numpy as np
+from tfidf_search import TFIDFSearch
+from llm_provider import FakeLLMProvider, KEYWORD_TOKEN_PATTERN
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+
+# クエリの元にする質問ファイル
+DEFAULT_QUESTIONS_PATH = os.path.join(BASE_DIR, 'data', 'persona_question', 'questions.csv')
+
+# 結果の保存先
+DEFAULT_RESULTS_DIR = os.path.join(BASE_DIR, 'data', 'benchmarks')
+
+# 既定のコーパスサイズ（チャンク数）
+DEFAULT_SIZES = (10000, 100000)
+
+# 1チャンクあたりの語数
+CHUNK_WORDS = (40, 120)
+
+# 合成語彙に加える語数（語彙の裾野を再現する）
+SYNTHETIC_VOCABULARY_SIZE = 20000
+
+# コーパスに混ぜる花火・旅行関連の語
+DOMAIN_TERMS = [
+    '花火', '花火大会', '打ち上げ', '尺玉', 'スターマイン', '仕掛け花火', '線香花火', '浴衣', '屋台',
+    '会場', '観覧席', '有料席', '交通規制', '最寄り駅', '混雑', '日程', '開催', '中止', '雨天',
+    '東京', '隅田川', '長岡', '大曲', '諏訪湖', '熊野', '夏祭り', '夜景', '旅行', '宿泊', 'ホテル',
+    '予約', '料金', 'アクセス', 'シャトルバス', '歴史', '江戸', '鍵屋', '玉屋', '安全', '規則'
+]
+
+# 合成語の材料（カタカナの音節）
+SYLLABLES = list('アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワン')
+
+# 遅延のパーセンタイル
+PERCENTILES = (50, 95, 99)
+
+# ベースラインとの比較で悪化とみなす割合
+REGRESSION_TOLERANCE = 0.1
+
+
+def load_questions(path=DEFAULT_QUESTIONS_PATH):
+    """
+    ペルソナ質問ファイルから質問文を読み込む
+
+    Args:
+        path (str): questions.csv のパス
+
+    Returns:
+        list: 質問文のリスト
+    """
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        return [row['質問'] for row in csv.DictReader(f) if row.get('質問')]
+
+
+def build_query_set(questions):
+    """
+    質問文から検索クエリの集合を作成
+
+    インデックスのトークナイザーは空白区切りの語を前提とするため、質問文から漢字・カタカナの
+    語を取り出して空白で連結する（FakeLLMProviderのキーワード抽出と同じ規則）。
+
+    Args:
+        questions (list): 質問文のリスト
+
+    Returns:
+        list: 検索クエリのリスト
+    """
+    queries = []
+    for question in questions:
+        terms = KEYWORD_TOKEN_PATTERN.findall(question)
+        if terms:
+            queries.append(' '.join(terms))
+    return queries
+
+
+def generate_corpus(size, questions, seed=0):
+    """
+    合成した日本語コーパスを生成
+
+    語彙は質問文の語・花火関連の語・カタカナの合成語からなり、出現頻度はZipf分布に従う。
+
+    Args:
+        size (int): チャンク数
+        questions (list): 語彙に加える質問文
+        seed (int): 乱数シード
+
+    Returns:
+        tuple: (ドキュメントのリスト, メタデータのリスト, IDのリスト)
+    """
+    rng = random.Random(seed)
+    vocabulary = list(DOMAIN_TERMS)
+    for question in questions:
+        vocabulary.extend(KEYWORD_TOKEN_PATTERN.findall(question))
+    vocabulary = list(dict.fromkeys(vocabulary))
+    synthetic = set()
+    while len(synthetic) < SYNTHETIC_VOCABULARY_SIZE:
+        synthetic.add(''.join(rng.choices(SYLLABLES, k=rng.randint(2, 5))))
+    vocabulary.extend(sorted(synthetic))
+
+    # 頻出語ほど先頭に来るようにZipf分布の重みを付ける
+    weights = np.cumsum(1.0 / np.arange(1, len(vocabulary) + 1))
+    weights = list(weights / weights[-1])
+    hosts = [f'https://example{i}.jp' for i in range(50)]
+
+    documents, metadatas, ids = [], [], []
+    for i in range(size):
+        words = rng.choices(vocabulary, cum_weights=weights, k=rng.randint(*CHUNK_WORDS))
+        documents.append(' '.join(words) + '。')
+        metadatas.append({
+            'source': f'{rng.choice(hosts)}/page{i // 10}',
+            'chunk_index': i % 10,
+            'modified_at': float(i)
+        })
+        ids.append(f'bench_{i}')
+    return documents, metadatas, ids
+
+
+def current_rss():
+    """
+    現在の常駐メモリ（バイト）
+
+    Linuxでは /proc から読み、それ以外では最大常駐メモリで代用する。
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def matrix_nbytes(matrix):
+    """CSR行列のデータ・列インデックス・行ポインタの合計バイト数"""
+    if hasattr(matrix, 'row_scale'):
+        return matrix.nbytes
+    return int(matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes)
+
+
+def latency_summary(latencies, elapsed):
+    """
+    遅延の集計値を算出
+
+    Args:
+        latencies (list): 1件ごとの遅延（秒）
+        elapsed (float): 全体の経過時間（秒）
+
+    Returns:
+        dict: 件数・平均・パーセンタイル（ミリ秒）・QPS
+    """
+    values = np.array(latencies) * 1000
+    summary = {'count': len(latencies), 'mean_ms': float(values.mean())}
+    for p in PERCENTILES:
+        summary[f'p{p}_ms'] = float(np.percentile(values, p))
+    summary['qps'] = len(latencies) / elapsed if elapsed > 0 else 0.0
+    return summary
+
+
+def benchmark_search(documents, metadatas, ids, queries, iterations=1000, n_results=3):
+    """
+    インデックスの構築と検索を計測
+
+    Args:
+        documents, metadatas, ids: コーパス
+        queries (list): 検索クエリ
+        iterations (int): 検索の実行回数（クエリを巡回して使用）
+        n_results (int): 返す結果の数
+
+    Returns:
+        tuple: (計測結果, 構築した検索システム)
+    """
+    gc.collect()
+    rss_before = current_rss()
+    start = time.perf_counter()
+    index = TFIDFSearch.from_documents(documents, metadatas, ids)
+    build_seconds = time.perf_counter() - start
+    rss_after = current_rss()
+
+    # 初回呼び出しの影響を除く
+    for query in queries[:5]:
+        index.search(query, n_results)
+
+    latencies = []
+    hits = 0
+    start = time.perf_counter()
+    for i in range(iterations):
+        query = queries[i % len(queries)]
+        t0 = time.perf_counter()
+        results = index.search(query, n_results)
+        latencies.append(time.perf_counter() - t0)
+        hits += bool(results)
+    elapsed = time.perf_counter() - start
+
+    result = {
+        'build_seconds': build_seconds,
+        'memory': {
+            'rss_delta_bytes': max(0, rss_after - rss_before),
+            'matrix_bytes': matrix_nbytes(index.tfidf_matrix),
+            'store_bytes': sum(index.store.memory_usage().values()),
+            'vocabulary_size': len(index.vectorizer.vocabulary_),
+            'nnz': int(index.tfidf_matrix.nnz)
+        },
+        'search': latency_summary(latencies, elapsed),
+        'hit_rate': hits / iterations if iterations else 0.0
+    }
+    return result, index
+
+
+def benchmark_pipeline(index, queries, iterations=200, llm_latency='fixed:0'):
+    """
+    FakeLLMProviderを使ってprocess_queryをエンドツーエンドで計測
+
+    ChromaDBは一時ディレクトリに作成し、検索インデックスは計測済みのものを共有する。
+    同じ質問を繰り返し実行しても、キーワード抽出と回答生成は毎回疑似LLMを呼び出す。
+
+    Args:
+        index (TFIDFSearch): 検索システム
+        queries (list): 質問文
+        iterations (int): 実行回数
+        llm_latency (str): 疑似LLMの遅延分布の指定
+
+    Returns:
+        dict: 計測結果
+    """
+    # rag_systemはChromaDBを読み込むため、パイプラインを計測する場合のみ読み込む
+    from rag_system import FireworksRAGSystem
+    from chroma_store import ChromaStore
+
+    db_dir = tempfile.mkdtemp(prefix='rag_benchmark_')
+    store = ChromaStore.get(db_dir)
+    rag_system = None
+    try:
+        with redirect_stdout(io.StringIO()):
+            rag_system = FireworksRAGSystem(
+                llm_provider=FakeLLMProvider(latency=llm_latency, seed=0),
+                store=store,
+                index_builder=lambda **params: index
+            )
+
+        latencies = []
+        answered = 0
+        start = time.perf_counter()
+        for i in range(iterations):
+            query = queries[i % len(queries)]
+            t0 = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                result = rag_system.process_query(query, save_unanswered=False)
+            latencies.append(time.perf_counter() - t0)
+            answered += bool(result['relevant_docs'])
+        elapsed = time.perf_counter() - start
+
+        summary = latency_summary(latencies, elapsed)
+        summary['answer_rate'] = answered / iterations if iterations else 0.0
+        summary['llm_latency'] = llm_latency
+        return summary
+    finally:
+        if rag_system is not None:
+            rag_system.close()
+        store.close()
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+
+def compare_with_baseline(results, baseline):
+    """
+    ベースラインの結果と比較
+
+    Args:
+        results (dict): 今回の結果
+        baseline (dict): 比較対象の結果
+
+    Returns:
+        list: (コーパスサイズ, 項目, ベースライン, 今回, 変化率, 悪化したか) のリスト
+    """
+    rows = []
+    baseline_runs = {run['size']: run for run in baseline.get('runs', [])}
+    for run in results['runs']:
+        previous = baseline_runs.get(run['size'])
+        if previous is None:
+            continue
+        pairs = [
+            ('build_seconds', previous['build_seconds'], run['build_seconds'], False),
+            ('search_p95_ms', previous['search']['p95_ms'], run['search']['p95_ms'], False),
+            ('search_qps', previous['search']['qps'], run['search']['qps'], True),
+            ('matrix_bytes', previous['memory']['matrix_bytes'], run['memory']['matrix_bytes'], False)
+        ]
+        if 'pipeline' in run and 'pipeline' in previous:
+            pairs.append(('pipeline_p95_ms', previous['pipeline']['p95_ms'], run['pipeline']['p95_ms'], False))
+        for name, before, after, higher_is_better in pairs:
+            change = (after - before) / before if before else 0.0
+            regressed = -change > REGRESSION_TOLERANCE if higher_is_better else change > REGRESSION_TOLERANCE
+            rows.append((run['size'], name, before, after, change, regressed))
+    return rows
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, iterations=1000, pipeline_iterations=200, llm_latency='fixed:0',
+                   questions_path=DEFAULT_QUESTIONS_PATH, seed=0):
+    """
+    コーパスサイズごとにベンチマークを実行
+
+    Returns:
+        dict: 実行条件と計測結果
+    """
+    questions = load_questions(questions_path)
+    queries = build_query_set(questions)
+    results = {
+        'created_at': datetime.now().isoformat(),
+        'config': {
+            'sizes': list(sizes),
+            'iterations': iterations,
+            'pipeline_iterations': pipeline_iterations,
+            'llm_latency': llm_latency,
+            'queries': len(queries),
+            'seed': seed
+        },
+        'runs': []
+    }
+
+    for size in sizes:
+        print(f"\n=== コーパスサイズ {size:,} チャンク ===")
+        start = time.perf_counter()
+        documents, metadatas, ids = generate_corpus(size, questions, seed)
+        print(f"コーパスを生成しました（{time.perf_counter() - start:.1f}秒）")
+
+        run, index = benchmark_search(documents, metadatas, ids, queries, iterations)
+        run['size'] = size
+        print(f"構築: {run['build_seconds']:.2f}秒, 行列: {run['memory']['matrix_bytes'] / 2**20:.1f}MiB, "
+              f"RSS増分: {run['memory']['rss_delta_bytes'] / 2**20:.1f}MiB")
+        print(f"検索: p50 {run['search']['p50_ms']:.2f}ms, p95 {run['search']['p95_ms']:.2f}ms, "
+              f"p99 {run['search']['p99_ms']:.2f}ms, {run['search']['qps']:.1f} QPS")
+
+        if pipeline_iterations:
+            run['pipeline'] = benchmark_pipeline(index, questions, pipeline_iterations, llm_latency)
+            print(f"process_query: p50 {run['pipeline']['p50_ms']:.2f}ms, "
+                  f"p95 {run['pipeline']['p95_ms']:.2f}ms, p99 {run['pipeline']['p99_ms']:.2f}ms, "
+                  f"回答率 {run['pipeline']['answer_rate']:.0%}")
+
+        results['runs'].append(run)
+        del documents, metadatas, ids, index
+        gc.collect()
+
+    return results
+
+
+def save_results(results, results_dir=DEFAULT_RESULTS_DIR):
+    """
+    結果をJSONファイルに保存
+
+    Returns:
+        str: 保存したファイルのパス
+    """
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='検索とRAGパイプラインのオフラインベンチマーク')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help='コーパスサイズ（チャンク数、例: 10000 100000 1000000）')
+    parser.add_argument('--iterations', type=int, default=1000, help='検索の実行回数')
+    parser.add_argument('--pipeline-iterations', type=int, default=200,
+                        help='process_queryの実行回数（0でスキップ）')
+    parser.add_argument('--llm-latency', default='fixed:0', help='疑似LLMの遅延分布（例: lognormal:0.8,0.5）')
+    parser.add_argument('--questions', default=DEFAULT_QUESTIONS_PATH, help='クエリの元にする質問ファイル')
+    parser.add_argument('--seed', type=int, default=0, help='コーパス生成の乱数シード')
+    parser.add_argument('--baseline', help='比較するベースラインの結果ファイル')
+    parser.add_argument('--output-dir', default=DEFAULT_RESULTS_DIR, help='結果の保存先')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.iterations, args.pipeline_iterations, args.llm_latency,
+                             args.questions, args.seed)
+    path = save_results(results, args.output_dir)
+    print(f"\n結果を保存しました: {path}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows = compare_with_baseline(results, baseline)
+        print("\n=== ベースラインとの比較 ===")
+        for size, name, before, after, change, regressed in rows:
+            mark = ' ← 悪化' if regressed else ''
+            print(f"{size:>9,} {name:<16} {before:>14.3f} → {after:>14.3f} ({change:+.1%}){mark}")
+        if any(row[5] for row in rows):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
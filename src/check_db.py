@@ -1,14 +1,8 @@
-import chromadb
-from chromadb.config import Settings
+from chroma_store import ChromaStore
 
 def check_database():
-    # ChromaDBの初期化
-    client = chromadb.Client(Settings(
-        persist_directory="data/fireworks_db"
-    ))
-    
-    # コレクションの取得
-    collection = client.get_collection(name="fireworks_information")
+    # コレクションの取得（プロセス全体で共有するクライアントを使用）
+    collection = ChromaStore.get().get_collection("fireworks_information")
     
     # コレクション内のドキュメント数を取得
     count = collection.count()
@@ -30,13 +24,8 @@ def check_database():
         print("-" * 50)
 
 def search_documents(query, n_results=3):
-    # ChromaDBの初期化
-    client = chromadb.Client(Settings(
-        persist_directory="data/fireworks_db"
-    ))
-    
-    # コレクションの取得
-    collection = client.get_collection(name="fireworks_information")
+    # コレクションの取得（プロセス全体で共有するクライアントを使用）
+    collection = ChromaStore.get().get_collection("fireworks_information")
     
     # クエリに基づいて類似ドキュメントを検索
     results = collection.query(
@@ -0,0 +1,180 @@
+import os
+import threading
+
+# データベースの保存ディレクトリ（既定。環境変数 CHROMA_DB_DIR で上書き可能）
+DEFAULT_DB_DIR = os.getenv(
+    'CHROMA_DB_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'fireworks_db')
+)
+
+# 書き込みを直列化するコレクションのメソッド
+WRITE_METHODS = ('add', 'update', 'upsert', 'delete', 'modify')
+
+
+class StoreCollection:
+    """
+    ChromaStoreが払い出すコレクション
+
+    読み取りはそのまま委譲し、書き込みはストアの書き込みロックで直列化する。
+    """
+
+    def __init__(self, store, collection):
+        self._store = store
+        self._collection = collection
+
+    @property
+    def raw(self):
+        """ラップしているChromaDBのコレクション"""
+        return self._collection
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name in WRITE_METHODS and callable(attr):
+            def serialized(*args, **kwargs):
+                with self._store.write_lock:
+                    return attr(*args, **kwargs)
+            return serialized
+        return attr
+
+
+class ChromaStore:
+    """
+    プロセス全体で共有するChromaDBの永続クライアント
+
+    保存ディレクトリごとにクライアントを1つだけ開き、コレクションの払い出し、
+    書き込みの直列化、クライアントの破棄を一元管理する。
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path=DEFAULT_DB_DIR):
+        self.path = path
+        self.write_lock = threading.RLock()
+        self._client = None
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, path=DEFAULT_DB_DIR):
+        """
+        保存ディレクトリに対応する共有ストアを取得
+
+        Args:
+            path (str): ChromaDBの保存ディレクトリ
+
+        Returns:
+            ChromaStore: 共有ストア
+        """
+        path = os.path.abspath(path)
+        with cls._instances_lock:
+            store = cls._instances.get(path)
+            if store is None:
+                store = cls._instances[path] = cls(path)
+            return store
+
+    @property
+    def client(self):
+        """永続クライアント（初回アクセス時に開く）"""
+        with self._lock:
+            if self._client is None:
+                # 保存ディレクトリの既定値だけを使うモジュール（負荷試験など）がchromadbなしで動くよう、ここで読み込む
+                import chromadb
+
+                os.makedirs(self.path, exist_ok=True)
+                self._client = chromadb.PersistentClient(path=self.path)
+                print(f"ChromaDBを開きました: {self.path}")
+            return self._client
+
+    def get_collection(self, name, create=False):
+        """
+        コレクションを取得
+
+        Args:
+            name (str): コレクション名
+            create (bool): 存在しない場合に作成するか
+
+        Returns:
+            StoreCollection: コレクション
+        """
+        with self._lock:
+            cached = self._collections.get(name)
+        if cached is not None:
+            return cached
+
+        client = self.client
+        with self.write_lock:
+            if create:
+                collection = client.get_or_create_collection(name=name)
+            else:
+                collection = client.get_collection(name=name)
+
+        wrapped = StoreCollection(self, collection)
+        with self._lock:
+            return self._collections.setdefault(name, wrapped)
+
+    def delete_collection(self, name):
+        """
+        コレクションを削除（存在しない場合は何もしない）
+
+        Args:
+            name (str): コレクション名
+        """
+        with self._lock:
+            self._collections.pop(name, None)
+        with self.write_lock:
+            try:
+                self.client.delete_collection(name=name)
+            except ValueError:
+                pass
+
+    def close(self):
+        """クライアントと払い出したコレクションを破棄"""
+        with self._lock:
+            client = self._client
+            self._client = None
+            self._collections = {}
+        if client is not None and hasattr(client, 'clear_system_cache'):
+            client.clear_system_cache()
+
+    @classmethod
+    def close_all(cls):
+        """すべての共有ストアを破棄"""
+        with cls._instances_lock:
+            stores = list(cls._instances.values())
+            cls._instances = {}
+        for store in stores:
+            store.close()
+
+
+def iter_collection(collection, page_size=500, include=('documents', 'metadatas'), where=None, offset=0,
+                    limit=None):
+    """
+    コレクションをページ単位で読み出し、1件ずつ返す
+
+    Args:
+        collection: ChromaDBのコレクション
+        page_size (int): 1回に読み出す件数
+        include (tuple): 読み出す項目（'documents', 'metadatas', 'embeddings'）
+        where (dict, optional): メタデータの絞り込み条件
+        offset (int): 読み出しを始める位置
+        limit (int, optional): 読み出す最大件数（未指定の場合は末尾まで）
+
+    Yields:
+        dict: id と include で指定した項目（単数形のキー）を含むレコード
+    """
+    end = offset + limit if limit is not None else None
+    while end is None or offset < end:
+        size = page_size if end is None else min(page_size, end - offset)
+        page = collection.get(limit=size, offset=offset, include=list(include), where=where)
+        ids = page['ids']
+        if not ids:
+            return
+        for i, record_id in enumerate(ids):
+            record = {'id': record_id}
+            for field in include:
+                values = page.get(field)
+                record[field[:-1]] = values[i] if values is not None else None
+            yield record
+        if len(ids) < size:
+            return
+        offset += len(ids)
@@ -0,0 +1,124 @@
+import re
+from text_chunker import split_sentences
+
+# プロンプトに含める参考情報の既定の上限（推定トークン数）
+DEFAULT_MAX_CONTEXT_TOKENS = 2000
+
+# 1ドキュメントから採用する文の上限
+DEFAULT_MAX_SENTENCES_PER_DOC = 6
+
+# 重複とみなす文どうしのコサイン類似度
+DEFAULT_DEDUP_THRESHOLD = 0.9
+
+# ドキュメントの検索スコアを文のスコアに加味する重み
+DOC_SCORE_WEIGHT = 0.1
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def estimate_tokens(text):
+    """
+    テキストのトークン数を推定（日本語は1文字≒1トークン、英数字は4文字≒1トークン）
+
+    Args:
+        text (str): 対象のテキスト
+
+    Returns:
+        int: 推定トークン数
+    """
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+class ContextPacker:
+    def __init__(self, max_tokens=DEFAULT_MAX_CONTEXT_TOKENS,
+                 max_sentences_per_doc=DEFAULT_MAX_SENTENCES_PER_DOC,
+                 dedup_threshold=DEFAULT_DEDUP_THRESHOLD):
+        self.max_tokens = max_tokens
+        self.max_sentences_per_doc = max_sentences_per_doc
+        self.dedup_threshold = dedup_threshold
+
+    def _collect_sentences(self, relevant_docs):
+        """関連ドキュメントを文に分割し、正規化したテキストで完全一致の重複を除去"""
+        sentences = []
+        seen = set()
+        for doc_index, doc in enumerate(relevant_docs):
+            for sentence in split_sentences(doc['content']):
+                normalized = WHITESPACE_PATTERN.sub('', sentence)
+                if not normalized or normalized in seen:
+                    continue
+                seen.add(normalized)
+                sentences.append({
+                    'text': sentence,
+                    'doc_index': doc_index,
+                    'doc_score': doc.get('score', 0.0),
+                    'source': doc.get('metadata', {}).get('source', '')
+                })
+        return sentences
+
+    def select(self, query, relevant_docs, vectorizer):
+        """
+        クエリに関連する文を予算内で選択
+
+        Args:
+            query (str): スコアリングに使用するクエリ
+            relevant_docs (list): 関連ドキュメントのリスト
+            vectorizer: 検索インデックスの学習済みTF-IDFベクトライザー
+
+        Returns:
+            list: 選択された文のリスト（スコアの降順）
+        """
+        sentences = self._collect_sentences(relevant_docs)
+        if not sentences:
+            return []
+
+        # 文とクエリをまとめてベクトル化（TF-IDFベクトルはL2正規化済みのため内積がコサイン類似度）
+        sentence_vectors = vectorizer.transform([s['text'] for s in sentences])
+        query_vector = vectorizer.transform([query])
+        similarities = (sentence_vectors @ query_vector.T).toarray().ravel()
+
+        for sentence, similarity in zip(sentences, similarities):
+            sentence['score'] = float(similarity) + DOC_SCORE_WEIGHT * sentence['doc_score']
+
+        order = sorted(range(len(sentences)), key=lambda i: sentences[i]['score'], reverse=True)
+
+        selected = []
+        selected_indices = []
+        per_doc = {}
+        used_tokens = 0
+        for i in order:
+            sentence = sentences[i]
+            key = sentence['doc_index']
+            if per_doc.get(key, 0) >= self.max_sentences_per_doc:
+                continue
+
+            tokens = estimate_tokens(sentence['text'])
+            if used_tokens + tokens > self.max_tokens:
+                continue
+
+            # 既に選択した文とほぼ同じ内容の文は除外
+            if selected_indices:
+                overlap = (sentence_vectors[selected_indices] @ sentence_vectors[i].T).toarray()
+                if overlap.size and overlap.max() >= self.dedup_threshold:
+                    continue
+
+            selected.append(sentence)
+            selected_indices.append(i)
+            per_doc[key] = per_doc.get(key, 0) + 1
+            used_tokens += tokens
+
+        return selected
+
+    def pack(self, query, relevant_docs, vectorizer):
+        """
+        関連ドキュメントを予算内の参考情報テキストに圧縮
+
+        Args:
+            query (str): スコアリングに使用するクエリ
+            relevant_docs (list): 関連ドキュメントのリスト
+            vectorizer: 検索インデックスの学習済みTF-IDFベクトライザー
+
+        Returns:
+            str: プロンプトに埋め込む参考情報
+        """
+        return "\n".join(sentence['text'] for sentence in self.select(query, relevant_docs, vectorizer))
@@ -0,0 +1,296 @@
+import sys
+import mmap
+import tempfile
+import numpy as np
+
+# 欠損を表す値（文字列列のコード・真偽値列）
+MISSING_CODE = -1
+
+# メタデータの列の型
+INT_COLUMN = 'int'
+FLOAT_COLUMN = 'float'
+BOOL_COLUMN = 'bool'
+STRING_COLUMN = 'string'
+# 型が混在する列・int64 に収まらない整数の列（元の値をそのまま保持する）
+OBJECT_COLUMN = 'object'
+
+# int64 の範囲
+INT64_MIN = -2**63
+INT64_MAX = 2**63 - 1
+
+
+class _StringBuffer:
+    """UTF-8で連結したバッファとオフセットで文字列の列を保持"""
+
+    def __init__(self, values):
+        encoded = [value.encode('utf-8') for value in values]
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=self.offsets[1:])
+        self.buffer = b''.join(encoded)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].decode('utf-8')
+
+    @property
+    def nbytes(self):
+        return len(self.buffer) + int(self.offsets.nbytes)
+
+
+class MmapStringBuffer:
+    """
+    文字列の列を一時ファイルに書き出し、メモリマップで読む
+
+    append() で1件ずつ書き込み、finish() 以降は _StringBuffer と同じように参照できる。
+    一時ファイルは閉じると削除され、本文はページキャッシュに置かれるため常駐メモリを圧迫しない。
+    """
+
+    def __init__(self, directory=None):
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._lengths = []
+        self._mmap = None
+        self.offsets = None
+
+    def append(self, value):
+        encoded = value.encode('utf-8')
+        self._file.write(encoded)
+        self._lengths.append(len(encoded))
+
+    def finish(self):
+        self._file.flush()
+        self.offsets = np.zeros(len(self._lengths) + 1, dtype=np.int64)
+        np.cumsum(self._lengths, out=self.offsets[1:])
+        self._lengths = None
+        if self.offsets[-1] > 0:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        if start == end:
+            return ''
+        return self._mmap[start:end].decode('utf-8')
+
+    @property
+    def nbytes(self):
+        # 常駐するのはオフセットだけ（本文はマップしたファイル）
+        return int(self.offsets.nbytes)
+
+    @property
+    def mapped_bytes(self):
+        return int(self.offsets[-1])
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+
+class _InternedColumn:
+    """重複の多い値（文字列、または型の混在する値）を一意な値の表と int32 のコードで保持"""
+
+    def __init__(self, values):
+        table = {}
+        self.values = []
+        self.codes = np.full(len(values), MISSING_CODE, dtype=np.int32)
+        for i, value in enumerate(values):
+            if value is not None:
+                # True・1・1.0 は等しいとみなされるため、型も含めて区別する
+                code = table.setdefault((type(value), value), len(table))
+                if code == len(self.values):
+                    self.values.append(value)
+                self.codes[i] = code
+
+    def __getitem__(self, i):
+        code = self.codes[i]
+        return self.values[code] if code != MISSING_CODE else None
+
+    @property
+    def nbytes(self):
+        return int(self.codes.nbytes) + sys.getsizeof(self.values) + sum(sys.getsizeof(v) for v in self.values)
+
+
+class _TypedColumn:
+    """数値・真偽値を型付きの配列と欠損マスクで保持"""
+
+    def __init__(self, values, kind):
+        self.kind = kind
+        self.present = np.array([v is not None for v in values], dtype=bool)
+        dtype = {INT_COLUMN: np.int64, FLOAT_COLUMN: np.float64, BOOL_COLUMN: np.bool_}[kind]
+        self.values = np.array([v if v is not None else 0 for v in values], dtype=dtype)
+
+    def __getitem__(self, i):
+        if not self.present[i]:
+            return None
+        value = self.values[i]
+        if self.kind == INT_COLUMN:
+            return int(value)
+        if self.kind == FLOAT_COLUMN:
+            return float(value)
+        return bool(value)
+
+    @property
+    def nbytes(self):
+        return int(self.present.nbytes + self.values.nbytes)
+
+
+def _column_kind(values):
+    kinds = set()
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            kinds.add(BOOL_COLUMN)
+        elif isinstance(value, int):
+            kinds.add(INT_COLUMN if INT64_MIN <= value <= INT64_MAX else OBJECT_COLUMN)
+        elif isinstance(value, float):
+            kinds.add(FLOAT_COLUMN)
+        else:
+            kinds.add(STRING_COLUMN)
+    if len(kinds) == 1:
+        return kinds.pop()
+    # 型が混在する列は、ChromaDBから取得した場合と同じ型で返せるよう元の値を保持する
+    return OBJECT_COLUMN if kinds else STRING_COLUMN
+
+
+class _ColumnView:
+    """列を読み取り専用のシーケンスとして見せる（要素はアクセス時に生成）"""
+
+    def __init__(self, getter, length):
+        self._getter = getter
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._getter(j) for j in range(*i.indices(self._length))]
+        if i < 0:
+            i += self._length
+        if not 0 <= i < self._length:
+            raise IndexError(i)
+        return self._getter(int(i))
+
+    def __iter__(self):
+        for i in range(self._length):
+            yield self._getter(i)
+
+
+class CompactDocumentStore:
+    """
+    チャンクの本文・ID・メタデータを配列で保持するドキュメントストア
+
+    本文とIDはUTF-8で連結したバッファとオフセット、ソースURLなどの文字列のメタデータは
+    一意な値の表とコード、数値のメタデータは型付きの配列で保持する。
+    チャンクごとの str / dict は持たず、検索結果の上位k件だけをアクセス時に生成する。
+    本文（とメタデータ）を持たない場合は、呼び出し側がChromaDBなどから取得する。
+    """
+
+    def __init__(self, documents, metadatas, ids, text=None):
+        """
+        Args:
+            documents (list): ドキュメントのリスト（本文を持たない場合はNone）
+            metadatas (list): メタデータのリスト（メタデータを持たない場合はNone）
+            ids (list): ドキュメントIDのリスト
+            text (MmapStringBuffer, optional): documents の代わりに使う本文のバッファ
+        """
+        self._length = len(ids)
+        if text is not None:
+            self._documents = text
+        elif documents is not None:
+            self._documents = _StringBuffer(documents)
+        else:
+            self._documents = None
+        self._ids = _StringBuffer(ids)
+        self.has_content = self._documents is not None
+        self.has_metadata = metadatas is not None
+        metadatas = [m or {} for m in metadatas] if metadatas is not None else []
+
+        keys = list(dict.fromkeys(key for metadata in metadatas for key in metadata))
+        self._columns = {}
+        for key in keys:
+            values = [metadata.get(key) for metadata in metadatas]
+            kind = _column_kind(values)
+            if kind in (STRING_COLUMN, OBJECT_COLUMN):
+                self._columns[key] = _InternedColumn(values)
+            else:
+                self._columns[key] = _TypedColumn(values, kind)
+
+        self.documents = _ColumnView(self._documents.__getitem__, self._length) if self.has_content else None
+        self.ids = _ColumnView(self._ids.__getitem__, self._length)
+        self.metadatas = _ColumnView(self.metadata, self._length) if self.has_metadata else None
+
+    def __len__(self):
+        return self._length
+
+    def metadata(self, i):
+        """
+        i番目のチャンクのメタデータを辞書として生成
+
+        Args:
+            i (int): チャンクの位置
+
+        Returns:
+            dict: メタデータ（欠損しているキーは含めない）
+        """
+        metadata = {}
+        for key, column in self._columns.items():
+            value = column[i]
+            if value is not None:
+                metadata[key] = value
+        return metadata
+
+    def column(self, key):
+        """
+        メタデータの列を取得
+
+        Args:
+            key (str): メタデータのキー
+
+        Returns:
+            列（codes/values または values/present を持つ）。存在しない場合はNone
+        """
+        return self._columns.get(key)
+
+    def result(self, i, score):
+        """
+        検索結果の辞書を生成
+
+        Args:
+            i (int): チャンクの位置
+            score (float): スコア
+
+        Returns:
+            dict: id, score, metadata, content を含む検索結果
+        """
+        return {
+            'id': self._ids[i],
+            'score': float(score),
+            'metadata': self.metadata(i),
+            'content': self._documents[i]
+        }
+
+    def memory_usage(self):
+        """
+        構成要素ごとのバイト数
+
+        Returns:
+            dict: 構成要素 → バイト数
+        """
+        usage = {'store.ids': self._ids.nbytes}
+        if self._documents is not None:
+            usage['store.documents'] = self._documents.nbytes
+        for key, column in self._columns.items():
+            usage[f'store.metadata.{key}'] = column.nbytes
+        return usage
+
+    def close(self):
+        """メモリマップした本文を解放"""
+        if isinstance(self._documents, MmapStringBuffer):
+            self._documents.close()
@@ -0,0 +1,353 @@
+import os
+import re
+import json
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from chroma_store import ChromaStore
+from sharded_search import create_search_index
+from quantized_matrix import ScoringMatrix
+from metrics import timed
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+
+# 既定のドメイン定義（環境変数 DOMAINS_CONFIG でJSONファイルを指定すると置き換わる）
+# 花火以外のドメインは、コレクションを作成したうえで DOMAINS_CONFIG のファイルに追加する
+DEFAULT_DOMAINS = [
+    {
+        'name': 'fireworks',
+        'db_dir': os.path.join(BASE_DIR, 'data', 'fireworks_db'),
+        'collection': 'fireworks_information',
+        'keywords': ['花火', '花火大会', '打ち上げ', 'スターマイン', '尺玉', '浴衣', '屋台', '夏祭り'],
+        'default': True
+    }
+]
+
+# 各ドメインのインデックスからルーティング用に採用する語数（列の重みの大きい順）
+ROUTER_TERMS_PER_DOMAIN = 200
+
+# 最上位のドメインに対してこの割合以上のスコアを持つドメインにも振り分ける
+ROUTE_SCORE_RATIO = 0.5
+
+# 1つのクエリで検索するドメインの上限
+MAX_ROUTED_DOMAINS = 3
+
+# 設定したキーワードの重み（インデックスから抽出した語は0〜1）
+KEYWORD_WEIGHT = 1.0
+
+
+class Domain:
+    def __init__(self, name, collection, db_dir=None, keywords=None, default=False):
+        """
+        Args:
+            name (str): ドメイン名
+            collection (str): ChromaDBのコレクション名
+            db_dir (str, optional): ChromaDBの保存ディレクトリ（未指定の場合は既定のディレクトリ）
+            keywords (list, optional): このドメインに振り分けるキーワード
+            default (bool): どのドメインにも該当しない場合の振り分け先にするか
+        """
+        self.name = name
+        self.collection = collection
+        self.db_dir = db_dir
+        self.keywords = list(keywords or [])
+        self.default = default
+
+    def open_collection(self):
+        """ドメインのコレクションを取得"""
+        store = ChromaStore.get(self.db_dir) if self.db_dir else ChromaStore.get()
+        return store.get_collection(self.collection)
+
+
+def _column_weights(matrix):
+    """語ごとの重みの合計（ドメインのセントロイドに相当）"""
+    if isinstance(matrix, ScoringMatrix):
+        return matrix.column_sums()
+    return np.asarray(matrix.sum(axis=0)).ravel()
+
+
+class DomainRouter:
+    """
+    クエリを検索すべきドメインに振り分ける軽量なルーター
+
+    各ドメインの設定キーワードと、インデックスのセントロイドで重みの大きい語を1つの正規表現に
+    まとめておき、クエリ中に現れた語の重みの合計でドメインを選ぶ。
+    ルーティングの計算量はドメインのインデックスの大きさによらない。
+    """
+
+    def __init__(self, domains, indexes, terms_per_domain=ROUTER_TERMS_PER_DOMAIN,
+                 score_ratio=ROUTE_SCORE_RATIO, max_domains=MAX_ROUTED_DOMAINS):
+        """
+        Args:
+            domains (list): Domain のリスト
+            indexes (dict): ドメイン名 → 検索システム
+            terms_per_domain (int): インデックスから採用する語数
+            score_ratio (float): 振り分け先に含める最上位スコアに対する割合
+            max_domains (int): 振り分け先の上限
+        """
+        self.score_ratio = score_ratio
+        self.max_domains = max_domains
+        self.defaults = [d.name for d in domains if d.default] or [domains[0].name]
+        self.term_weights = {}
+        for domain in domains:
+            for term, weight in self._domain_terms(domain, indexes.get(domain.name), terms_per_domain).items():
+                self.term_weights.setdefault(term, {})[domain.name] = weight
+
+        # 長い語を優先して照合する（「花火大会」を「花火」より先に）
+        terms = sorted(self.term_weights, key=len, reverse=True)
+        self._pattern = re.compile('|'.join(re.escape(t) for t in terms)) if terms else None
+
+    @staticmethod
+    def _domain_terms(domain, index, limit):
+        terms = {}
+        if index is not None and limit:
+            # シャードに分けたインデックスは語彙が共通のため、シャードごとの重みを足し合わせる
+            matrices = [shard.tfidf_matrix for shard in index.shards] if hasattr(index, 'shards') else [index.tfidf_matrix]
+            weights = sum(_column_weights(matrix) for matrix in matrices)
+            if weights.size and weights.max() > 0:
+                vocabulary = index.vectorizer.get_feature_names_out()
+                top = np.argsort(weights)[::-1][:limit]
+                peak = weights[top[0]]
+                for i in top:
+                    term = vocabulary[i]
+                    # 1文字の語や数字だけの語はどのドメインにも現れやすいため使わない
+                    if len(term) >= 2 and not term.isdigit() and weights[i] > 0:
+                        terms[term] = float(weights[i] / peak)
+        for keyword in domain.keywords:
+            terms[keyword.lower()] = KEYWORD_WEIGHT
+        return terms
+
+    def scores(self, query):
+        """
+        ドメインごとのスコアを算出
+
+        Args:
+            query (str): 検索クエリ
+
+        Returns:
+            Counter: ドメイン名 → スコア
+        """
+        scores = Counter()
+        if self._pattern is None:
+            return scores
+        for match in self._pattern.finditer(query.lower()):
+            for name, weight in self.term_weights[match.group(0)].items():
+                scores[name] += weight
+        return scores
+
+    def route(self, query):
+        """
+        クエリを検索するドメインを選択
+
+        Args:
+            query (str): 検索クエリ
+
+        Returns:
+            list: ドメイン名のリスト（スコアの高い順。該当がない場合は既定のドメイン）
+        """
+        ranked = self.scores(query).most_common()
+        if not ranked:
+            return list(self.defaults)
+        top_score = ranked[0][1]
+        return [name for name, score in ranked if score >= top_score * self.score_ratio][:self.max_domains]
+
+
+class FederatedIndex:
+    """
+    ドメインごとのインデックスをまとめた検索システム
+
+    TFIDFSearch と同じ search() を持ち、振り分けたドメインだけを検索して結果をスコア順に統合する。
+    各結果のメタデータには 'domain' を付ける。
+    """
+
+    def __init__(self, indexes, router, max_workers=MAX_ROUTED_DOMAINS):
+        self.indexes = indexes
+        self.router = router
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='domain-search')
+
+    @property
+    def vectorizer(self):
+        """既定のドメインのベクトライザー"""
+        return self.indexes[self.router.defaults[0]].vectorizer
+
+    def vectorizer_for(self, results):
+        """
+        検索結果の大半が属するドメインのベクトライザー（参考情報の文のスコアリング用）
+
+        Args:
+            results (list): search() の結果
+
+        Returns:
+            TfidfVectorizer: ベクトライザー
+        """
+        domains = Counter(r['metadata'].get('domain') for r in results if r.get('metadata'))
+        for name, _ in domains.most_common():
+            if name in self.indexes:
+                return self.indexes[name].vectorizer
+        return self.vectorizer
+
+    def validate_domains(self, domains):
+        """
+        検索するドメインの指定を検証
+
+        Args:
+            domains (list): ドメイン名のリスト
+
+        Returns:
+            list: 重複を除いたドメイン名のリスト
+
+        Raises:
+            ValueError: 空・リストでない・登録されていないドメインを含む場合
+        """
+        if not isinstance(domains, list) or not domains or not all(isinstance(d, str) for d in domains):
+            raise ValueError("domains はドメイン名のリストで指定してください")
+        unknown = [d for d in domains if d not in self.indexes]
+        if unknown:
+            raise ValueError(f"登録されていないドメインです: {', '.join(unknown)}"
+                             f"（使用できるドメイン: {', '.join(self.indexes)}）")
+        return list(dict.fromkeys(domains))
+
+    def search(self, query, n_results=3, hydrate=True, where=None, domains=None):
+        """
+        振り分けたドメインを検索し、結果をスコア順に統合
+
+        Args:
+            query (str): 検索クエリ
+            n_results (int): 返す結果の数
+            hydrate (bool): メタデータと本文を含めるか
+            where (dict, optional): メタデータによる絞り込み条件
+            domains (list, optional): 検索するドメイン（未指定の場合はルーターが選ぶ）
+
+        Returns:
+            list: 検索結果のリスト
+
+        Raises:
+            ValueError: domains が登録済みのドメイン名のリストでない場合
+        """
+        with timed('routing'):
+            names = self.validate_domains(domains) if domains is not None else [
+                name for name in self.router.route(query) if name in self.indexes
+            ]
+
+        def search_domain(name):
+            results = self.indexes[name].search(query, n_results, hydrate=hydrate, where=where)
+            for result in results:
+                result['domain'] = name
+                if 'metadata' in result:
+                    result['metadata'] = dict(result['metadata'], domain=name)
+            return results
+
+        if len(names) == 1:
+            merged = search_domain(names[0])
+        else:
+            merged = [r for results in self._executor.map(search_domain, names) for r in results]
+        merged.sort(key=lambda r: r['score'], reverse=True)
+        return merged[:n_results]
+
+    def hydrate(self, results):
+        """search(hydrate=False) の結果をドメインごとにまとめて取得"""
+        hydrated = []
+        for name in dict.fromkeys(r['domain'] for r in results):
+            for result in self.indexes[name].hydrate([r for r in results if r['domain'] == name]):
+                result['domain'] = name
+                result['metadata'] = dict(result['metadata'], domain=name)
+                hydrated.append(result)
+        hydrated.sort(key=lambda r: r['score'], reverse=True)
+        return hydrated
+
+    def close(self):
+        """スレッドプールと各ドメインのインデックスの資源を解放（スナップショットの解放時に呼ぶ）"""
+        self._executor.shutdown(wait=False)
+        for index in self.indexes.values():
+            index.close()
+
+
+class DomainRegistry:
+    """
+    トピックドメイン（コレクション）の登録簿
+
+    ドメインごとにインデックスを1つ構築し、ルーターと合わせて FederatedIndex にまとめる。
+    """
+
+    def __init__(self, domains=None):
+        """
+        Args:
+            domains (list, optional): Domain または設定の辞書のリスト（未指定の場合は DEFAULT_DOMAINS）
+        """
+        self.domains = {}
+        for domain in domains if domains is not None else DEFAULT_DOMAINS:
+            self.register(domain if isinstance(domain, Domain) else Domain(**domain))
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        JSONファイルからドメイン定義を読み込む
+
+        Args:
+            path (str): Domain の引数を並べたリストのJSONファイル
+
+        Returns:
+            DomainRegistry: 登録簿
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def from_env(cls):
+        """環境変数 DOMAINS_CONFIG のファイルから読み込む（未設定の場合はNone）"""
+        path = os.getenv('DOMAINS_CONFIG')
+        return cls.from_file(path) if path else None
+
+    def register(self, domain):
+        """
+        ドメインを登録
+
+        Args:
+            domain (Domain): ドメイン
+        """
+        self.domains[domain.name] = domain
+
+    def build_index(self, vectorizer_params=None, **params):
+        """
+        すべてのドメインのインデックスを構築して FederatedIndex にまとめる
+
+        コレクションを開けないドメインは除外し、除外したドメインをまとめて表示する。
+        IndexSnapshotManager の builder として使う。
+
+        Args:
+            vectorizer_params (dict, optional): 各ドメインの TfidfVectorizer の設定
+            **params: 検索システムに渡すその他の引数
+
+        Returns:
+            FederatedIndex: 統合した検索システム
+
+        Raises:
+            ValueError: すべてのドメインのコレクションを開けない場合
+        """
+        indexes = {}
+        missing = []
+        for domain in self.domains.values():
+            try:
+                collection = domain.open_collection()
+            except Exception as e:
+                print(f"ドメイン {domain.name} のコレクションを開けません: {str(e)}")
+                missing.append(f"{domain.name}（{domain.collection} @ {domain.db_dir or '既定のDB'}）")
+                continue
+            indexes[domain.name] = create_search_index(collection, vectorizer_params, **params)
+            print(f"ドメイン {domain.name} のインデックスを構築しました（{len(indexes[domain.name].ids)}件）")
+        if missing:
+            print(f"コレクションが見つからないため次のドメインを除外しました: {', '.join(missing)}")
+        if not indexes:
+            raise ValueError(f"検索可能なドメインがありません（除外: {', '.join(missing)}）")
+
+        available = [d for d in self.domains.values() if d.name in indexes]
+        return FederatedIndex(indexes, DomainRouter(available, indexes))
+
+
+if __name__ == "__main__":
+    # 使用例
+    registry = DomainRegistry.from_env() or DomainRegistry()
+    index = registry.build_index()
+    for query in ["握りずしの歴史", "隅田川花火大会の日程"]:
+        print(f"\n=== {query} → {index.router.route(query)} ===")
+        for result in index.search(query):
+            print(f"[{result['domain']}] {result['score']:.4f} {result['metadata'].get('source', '')}")
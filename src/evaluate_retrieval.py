@@ -0,0 +1,331 @@
+import os
+import gc
+import glob
+import json
+import time
+import argparse
+from datetime import datetime
+import numpy as np
+from tfidf_search import TFIDFSearch
+from sharded_search import create_search_index
+from domain_registry import DomainRegistry
+from memory_report import index_parts
+from benchmark import current_rss, matrix_nbytes, latency_summary
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+
+# 再生する過去のバッチ実行結果
+DEFAULT_RESULTS_PATTERN = os.path.join(BASE_DIR, 'data', 'question_results', 'question_results_*.json')
+
+# 評価レポートの保存先
+DEFAULT_REPORT_DIR = os.path.join(BASE_DIR, 'data', 'evaluations')
+
+# from_documents で構築できる設定（これ以外を含む場合はコレクションから create_search_index で構築する）
+IN_MEMORY_INDEX_PARAMS = ('vectorizer_params', 'matrix_dtype')
+
+# 評価する検索設定の既定値
+# index は検索システムの構築時の引数（vectorizer_params, matrix_dtype, shards, hydrate）、
+# where は検索時のメタデータによる絞り込み条件、domains は検索するドメインのリスト。
+# federated を指定した場合は DomainRegistry のすべてのドメインをまとめた検索システムを評価する
+DEFAULT_CONFIGS = [
+    {
+        'name': 'tfidf_float64',
+        'k': 3,
+        'index': {'matrix_dtype': 'float64'}
+    },
+    {
+        'name': 'tfidf_float32',
+        'k': 3,
+        'index': {'matrix_dtype': 'float32'}
+    },
+    {
+        'name': 'tfidf_uint8',
+        'k': 3,
+        'index': {'matrix_dtype': 'uint8'}
+    },
+    {
+        'name': 'tfidf_bigram',
+        'k': 3,
+        'index': {'vectorizer_params': {'ngram_range': [1, 2]}}
+    },
+    {
+        'name': 'sharded_4',
+        'k': 3,
+        'index': {'shards': 4}
+    },
+    {
+        'name': 'hydrate_mmap',
+        'k': 3,
+        'index': {'hydrate': 'mmap'}
+    }
+]
+
+# レポートの列（見出し, 値のキー, 書式）
+REPORT_COLUMNS = [
+    ('config', 'name', '{}'),
+    ('k', 'k', '{}'),
+    ('hit_rate', 'hit_rate', '{:.3f}'),
+    ('mrr', 'mrr', '{:.3f}'),
+    ('answer_rate', 'answer_rate', '{:.3f}'),
+    ('p50_ms', 'p50_ms', '{:.2f}'),
+    ('p95_ms', 'p95_ms', '{:.2f}'),
+    ('p99_ms', 'p99_ms', '{:.2f}'),
+    ('qps', 'qps', '{:.1f}'),
+    ('build_s', 'build_seconds', '{:.2f}'),
+    ('index_MiB', 'index_mib', '{:.1f}'),
+    ('rss_MiB', 'rss_mib', '{:.1f}')
+]
+
+
+def load_question_results(pattern=DEFAULT_RESULTS_PATTERN):
+    """
+    過去のバッチ実行結果を読み込む
+
+    Args:
+        pattern (str): 結果ファイルのglobパターン
+
+    Returns:
+        list: 質問・キーワード・正解（関連ドキュメントのIDとソース）を含むレコードのリスト
+    """
+    records = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, 'r', encoding='utf-8') as f:
+            for result in json.load(f):
+                relevant_docs = result.get('relevant_docs') or []
+                records.append({
+                    'file': os.path.basename(path),
+                    'question': result['question'],
+                    'keywords': result.get('keywords') or [],
+                    'relevant_ids': {doc['id'] for doc in relevant_docs if doc.get('id')},
+                    'relevant_sources': {
+                        (doc.get('metadata') or {}).get('source') for doc in relevant_docs
+                    } - {None, ''}
+                })
+    return records
+
+
+def load_corpus(collection_name='fireworks_information', page_size=500):
+    """
+    ChromaDBのコレクションから評価対象のコーパスを読み込む
+
+    Returns:
+        tuple: (ドキュメントのリスト, メタデータのリスト, IDのリスト)
+    """
+    from chroma_store import iter_collection
+
+    collection = open_collection(collection_name)
+    documents, metadatas, ids = [], [], []
+    for record in iter_collection(collection, page_size=page_size):
+        documents.append(record['document'])
+        metadatas.append(record['metadata'] or {})
+        ids.append(record['id'])
+    return documents, metadatas, ids
+
+
+def open_collection(collection_name='fireworks_information'):
+    """評価対象のChromaDBコレクションを開く"""
+    from chroma_store import ChromaStore
+
+    return ChromaStore.get().get_collection(collection_name)
+
+
+def build_index(config, corpus=None, collection=None):
+    """
+    検索設定から本番と同じ検索システムを構築
+
+    vectorizer_params と matrix_dtype だけの設定はメモリ上のコーパスから TFIDFSearch.from_documents で、
+    シャード数・取得方法を含む設定はコレクションから create_search_index で構築する。
+
+    Args:
+        config (dict): 検索設定
+        corpus (tuple, optional): load_corpus の結果
+        collection (optional): 評価対象のChromaDBコレクション
+
+    Returns:
+        TFIDFSearch, ShardedTFIDFSearch または FederatedIndex
+    """
+    params = dict(config.get('index') or {})
+    vectorizer_params = dict(params.pop('vectorizer_params', None) or {})
+    if 'ngram_range' in vectorizer_params:
+        # JSONの設定ファイルではリストになる
+        vectorizer_params['ngram_range'] = tuple(vectorizer_params['ngram_range'])
+
+    if config.get('federated'):
+        registry = DomainRegistry.from_env() or DomainRegistry()
+        return registry.build_index(vectorizer_params, **params)
+    if set(params) <= set(IN_MEMORY_INDEX_PARAMS) and corpus is not None:
+        documents, metadatas, ids = corpus
+        return TFIDFSearch.from_documents(documents, metadatas, ids, vectorizer_params=vectorizer_params,
+                                          matrix_dtype=params.get('matrix_dtype'))
+    # 環境変数ではなく設定の値で比較できるよう、未指定の項目は既定値に固定する
+    params.setdefault('shards', 1)
+    params.setdefault('hydrate', 'memory')
+    return create_search_index(collection, vectorizer_params, **params)
+
+
+def index_nbytes(index):
+    """検索システムのスコア行列の合計バイト数（シャード・ドメインに分けた場合はその合計）"""
+    return sum(matrix_nbytes(part.tfidf_matrix) for _, part in index_parts(index))
+
+
+def evaluate_config(config, corpus, records, use_question=False, collection=None):
+    """
+    1つの検索設定で過去の質問を再生して評価
+
+    hit_rate と mrr は正解（過去の関連ドキュメント）を持つ質問だけで、
+    answer_rate はすべての質問で算出する。
+
+    Args:
+        config (dict): 検索設定
+        corpus (tuple): load_corpus の結果
+        records (list): load_question_results の結果
+        use_question (bool): キーワードではなく質問文そのものを検索クエリにする
+        collection (optional): 評価対象のChromaDBコレクション
+
+    Returns:
+        dict: 評価結果
+    """
+    k = config.get('k', 3)
+    gc.collect()
+    rss_before = current_rss()
+    start = time.perf_counter()
+    index = build_index(config, corpus, collection)
+    build_seconds = time.perf_counter() - start
+    rss_after = current_rss()
+
+    search_params = {'where': config.get('where')}
+    if config.get('domains'):
+        search_params['domains'] = config['domains']
+
+    latencies = []
+    answered = 0
+    labeled = 0
+    hits = 0
+    reciprocal_ranks = 0.0
+    start = time.perf_counter()
+    for record in records:
+        # RAGシステムと同じくキーワードを空白で連結して検索
+        query = record['question'] if use_question or not record['keywords'] else ' '.join(record['keywords'])
+        t0 = time.perf_counter()
+        results = index.search(query, n_results=k, **search_params)
+        latencies.append(time.perf_counter() - t0)
+        answered += bool(results)
+
+        if not (record['relevant_ids'] or record['relevant_sources']):
+            continue
+        labeled += 1
+        for rank, result in enumerate(results, 1):
+            # 再取り込みでIDが変わっていても、同じソースのチャンクなら正解とみなす
+            source = (result['metadata'] or {}).get('source')
+            if result['id'] in record['relevant_ids'] or source in record['relevant_sources']:
+                hits += 1
+                reciprocal_ranks += 1.0 / rank
+                break
+    elapsed = time.perf_counter() - start
+    nbytes = index_nbytes(index)
+    close = getattr(index, 'close', None)
+    if close is not None:
+        close()
+
+    summary = latency_summary(latencies, elapsed) if latencies else {}
+    return {
+        'name': config['name'],
+        'k': k,
+        'config': config,
+        'questions': len(records),
+        'labeled': labeled,
+        'hit_rate': hits / labeled if labeled else float('nan'),
+        'mrr': reciprocal_ranks / labeled if labeled else float('nan'),
+        'answer_rate': answered / len(records) if records else float('nan'),
+        'p50_ms': summary.get('p50_ms', float('nan')),
+        'p95_ms': summary.get('p95_ms', float('nan')),
+        'p99_ms': summary.get('p99_ms', float('nan')),
+        'qps': summary.get('qps', 0.0),
+        'build_seconds': build_seconds,
+        'index_mib': nbytes / 2**20,
+        'rss_mib': max(0, rss_after - rss_before) / 2**20
+    }
+
+
+def format_report(rows):
+    """
+    評価結果を1つの表（Markdown形式）に整形
+
+    Args:
+        rows (list): evaluate_config の結果のリスト
+
+    Returns:
+        str: 表
+    """
+    header = [title for title, _, _ in REPORT_COLUMNS]
+    lines = ['| ' + ' | '.join(header) + ' |', '|' + '---|' * len(header)]
+    for row in rows:
+        cells = []
+        for _, key, fmt in REPORT_COLUMNS:
+            value = row[key]
+            cells.append('-' if isinstance(value, float) and np.isnan(value) else fmt.format(value))
+        lines.append('| ' + ' | '.join(cells) + ' |')
+    return '\n'.join(lines)
+
+
+def run_evaluation(configs=DEFAULT_CONFIGS, pattern=DEFAULT_RESULTS_PATTERN, collection_name='fireworks_information',
+                   use_question=False):
+    """
+    すべての検索設定を評価
+
+    Returns:
+        dict: 実行条件と評価結果
+    """
+    records = load_question_results(pattern)
+    if not records:
+        raise ValueError(f"評価に使う結果ファイルが見つかりません: {pattern}")
+    corpus = load_corpus(collection_name)
+    documents = corpus[0]
+    if not documents:
+        raise ValueError(f"コレクションにドキュメントがありません: {collection_name}")
+    collection = open_collection(collection_name)
+
+    rows = [evaluate_config(config, corpus, records, use_question, collection) for config in configs]
+    return {
+        'created_at': datetime.now().isoformat(),
+        'collection': collection_name,
+        'documents': len(documents),
+        'questions': len(records),
+        'labeled': rows[0]['labeled'] if rows else 0,
+        'query': 'question' if use_question else 'keywords',
+        'rows': rows
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='過去の質問結果を再生して検索の品質と速度を評価')
+    parser.add_argument('--results', default=DEFAULT_RESULTS_PATTERN, help='再生する結果ファイルのglobパターン')
+    parser.add_argument('--configs', help='検索設定のリストを記述したJSONファイル')
+    parser.add_argument('--collection', default='fireworks_information', help='評価対象のコレクション名')
+    parser.add_argument('--k', type=int, help='すべての設定の検索件数を上書きする')
+    parser.add_argument('--use-question', action='store_true', help='キーワードではなく質問文で検索する')
+    parser.add_argument('--output-dir', default=DEFAULT_REPORT_DIR, help='レポートの保存先')
+    args = parser.parse_args()
+
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs, 'r', encoding='utf-8') as f:
+            configs = json.load(f)
+    if args.k:
+        configs = [dict(config, k=args.k) for config in configs]
+
+    report = run_evaluation(configs, args.results, args.collection, args.use_question)
+    table = format_report(report['rows'])
+    print(f"\n質問 {report['questions']}件（正解あり {report['labeled']}件）, "
+          f"ドキュメント {report['documents']}件, クエリ: {report['query']}\n")
+    print(table)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"evaluation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(dict(report, table=table), f, ensure_ascii=False, indent=2, default=str)
+    print(f"\nレポートを保存しました: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,79 +1,656 @@
 import os
-import chromadb
-import pandas as pd
+import csv
+import gzip
+import json
+import heapq
+import argparse
+import tempfile
+from itertools import groupby
+from chroma_store import ChromaStore, iter_collection
 from datetime import datetime
 
+# ページ単位で読み出す件数
+DEFAULT_PAGE_SIZE = 500
+
+# CSVの列
+MAIN_COLUMNS = ['id', 'content', 'source', 'timestamp']
+UNANSWERED_COLUMNS = ['id', 'question', 'keywords', 'timestamp', 'hit_count']
+
+# 差分出力の列（変更時刻と削除の印を含む。削除されたレコードは id と deleted=1 だけの行になる）
+MAIN_DELTA_COLUMNS = MAIN_COLUMNS + ['modified_at', 'deleted']
+UNANSWERED_DELTA_COLUMNS = UNANSWERED_COLUMNS + ['modified_at', 'deleted']
+
+# 差分ファイルをまとめる際に、IDで並べ替えるために1度にメモリに載せる行数
+COMPACT_RUN_SIZE = 50000
+
+# 列指向形式（Parquet/Arrow）で出力する際の1行グループあたりの行数
+DEFAULT_ROW_GROUP_SIZE = 10000
+
+# 列指向形式の列定義（列名, 型, メタデータのキー）。型は pyarrow の型名
+# modified_at は差分出力のハイウォーターマークに使うため、復元後も保持する
+MAIN_ARROW_FIELDS = [
+    ('source', 'string', 'source'),
+    ('timestamp', 'timestamp', 'timestamp'),
+    ('original_question', 'string', 'original_question'),
+    ('chunk_index', 'int32', 'chunk_index'),
+    ('total_chunks', 'int32', 'total_chunks'),
+    ('modified_at', 'float64', 'modified_at')
+]
+UNANSWERED_ARROW_FIELDS = [
+    ('query', 'string', 'query'),
+    ('keywords', 'string', 'keywords'),
+    ('timestamp', 'timestamp', 'timestamp'),
+    ('last_seen', 'timestamp', 'last_seen'),
+    ('hit_count', 'int32', 'hit_count'),
+    ('is_updated', 'bool', 'is_updated'),
+    ('updated_at', 'timestamp', 'updated_at'),
+    ('persona', 'string', 'persona'),
+    ('modified_at', 'float64', 'modified_at')
+]
+
+# 列定義にないメタデータ（と型に変換できない値）をJSONで保持する列
+EXTRA_METADATA_COLUMN = 'extra_metadata'
+
+# コレクション名 → (本文の列名, 列定義)
+ARROW_LAYOUTS = {
+    'fireworks_information': ('content', MAIN_ARROW_FIELDS),
+    'unanswered_questions': ('question', UNANSWERED_ARROW_FIELDS)
+}
+
+
+def _require_pyarrow():
+    # pyarrowは列指向形式の入出力でのみ必要なため、使用時に読み込む
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.ipc
+    except ImportError:
+        raise ImportError("Parquet/Arrow形式の入出力にはpyarrowが必要です（pip install pyarrow）")
+    return pyarrow
+
+
+def _arrow_schema(pa, text_column, fields, with_embeddings):
+    types = {
+        'string': pa.string(),
+        'int32': pa.int32(),
+        'float64': pa.float64(),
+        'bool': pa.bool_(),
+        'timestamp': pa.timestamp('us')
+    }
+    columns = [pa.field('id', pa.string(), nullable=False), pa.field(text_column, pa.string())]
+    columns += [pa.field(name, types[type_name]) for name, type_name, _ in fields]
+    columns.append(pa.field(EXTRA_METADATA_COLUMN, pa.string()))
+    if with_embeddings:
+        columns.append(pa.field('embedding', pa.list_(pa.float32())))
+    return pa.schema(columns)
+
+
+def _parse_timestamp(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def _arrow_value(type_name, value):
+    """
+    メタデータの値を列の型に変換
+
+    Returns:
+        tuple: (変換した値, 変換できたか)。変換すると元の値に戻せない場合は変換できないものとする
+    """
+    if value is None:
+        return None, True
+    if type_name == 'timestamp':
+        parsed = _parse_timestamp(value)
+        # タイムゾーン付きの値や表記の異なる値は、読み込み時に同じ文字列に戻らない
+        if parsed is None or parsed.tzinfo is not None or parsed.isoformat() != value:
+            return None, False
+        return parsed, True
+    if type_name == 'int32':
+        if isinstance(value, bool) or not isinstance(value, int) or not -2**31 <= value < 2**31:
+            return None, False
+        return value, True
+    if type_name == 'float64':
+        return (value, True) if isinstance(value, float) else (None, False)
+    if type_name == 'bool':
+        return (value, True) if isinstance(value, bool) else (None, False)
+    return (value, True) if isinstance(value, str) else (None, False)
+
 class DatabaseExporter:
     def __init__(self):
-        # データベースの保存ディレクトリを指定
-        self.DB_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'fireworks_db')
+        # ChromaDBの初期化（プロセス全体で共有するクライアントを使用）
+        self.store = ChromaStore.get()
+        self.DB_DIR = self.store.path
+        
+        # コレクションの取得（空のストアへの一括登録にも使うため、存在しない場合は作成）
+        self.collection = self.store.get_collection("fireworks_information", create=True)
+        self.unanswered_collection = self.store.get_collection("unanswered_questions", create=True)
+        
+        # 出力ディレクトリ
+        self.output_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'exports')
+        
+        # 差分出力の保存先と前回出力位置（ハイウォーターマーク）の記録ファイル
+        self.incremental_dir = os.path.join(self.output_dir, 'incremental')
+        self.state_path = os.path.join(self.incremental_dir, 'state.json')
+    
+    def _open_output(self, path, compress):
+        # Excelで開けるようにBOM付きUTF-8で出力
+        if compress:
+            return gzip.open(path, 'wt', encoding='utf-8-sig', newline='')
+        return open(path, 'w', encoding='utf-8-sig', newline='')
+    
+    def _write_rows(self, path, columns, rows, compress):
+        """
+        行をCSVファイルに逐次書き出す
         
-        # ChromaDBの初期化
-        self.client = chromadb.PersistentClient(path=self.DB_DIR)
+        Args:
+            path (str): 出力先のパス
+            columns (list): 列名
+            rows (iterable): 行（辞書）のイテラブル
+            compress (bool): gzip圧縮するか
         
-        # コレクションの取得
-        self.collection = self.client.get_collection(name="fireworks_information")
-        self.unanswered_collection = self.client.get_collection(name="unanswered_questions")
+        Returns:
+            int: 書き出した行数
+        """
+        count = 0
+        with self._open_output(path, compress) as f:
+            writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        return count
+    
+    def _iter_records(self, collection, page_size, where=None, ids=None):
+        """コレクション全体（ids を指定した場合はそのレコードだけ）をページ単位で読み出す"""
+        if ids is None:
+            yield from iter_collection(collection, page_size, where=where)
+            return
+        for start in range(0, len(ids), page_size):
+            page = collection.get(ids=ids[start:start + page_size], include=['documents', 'metadatas'])
+            for record_id, document, metadata in zip(page['ids'], page['documents'], page['metadatas']):
+                yield {'id': record_id, 'document': document, 'metadata': metadata}
+    
+    def iter_main_rows(self, page_size=DEFAULT_PAGE_SIZE, where=None, ids=None):
+        """メインコレクションの行をページ単位で読み出す"""
+        for record in self._iter_records(self.collection, page_size, where, ids):
+            metadata = record['metadata'] or {}
+            yield {
+                'id': record['id'],
+                'content': record['document'],
+                'source': metadata.get('source', ''),
+                'timestamp': metadata.get('timestamp', ''),
+                'modified_at': metadata.get('modified_at', '')
+            }
     
-    def export_to_csv(self):
+    def iter_unanswered_rows(self, page_size=DEFAULT_PAGE_SIZE, where=None, ids=None):
+        """未回答の質問コレクションの行をページ単位で読み出す"""
+        for record in self._iter_records(self.unanswered_collection, page_size, where, ids):
+            metadata = record['metadata'] or {}
+            yield {
+                'id': record['id'],
+                'question': record['document'],
+                'keywords': metadata.get('keywords', ''),
+                'timestamp': metadata.get('timestamp', ''),
+                'hit_count': metadata.get('hit_count', 1),
+                'modified_at': metadata.get('modified_at', '')
+            }
+    
+    def export_to_csv(self, page_size=DEFAULT_PAGE_SIZE, compress=False):
         """
         データベースの内容をCSVファイルに出力
+        
+        コレクションをページ単位で読み出して逐次書き出すため、メモリ使用量はコーパスの大きさによらず一定。
+        
+        Args:
+            page_size (int): 1回に読み出す件数
+            compress (bool): gzip圧縮して出力するか
         """
         try:
-            # メインコレクションのデータを取得
-            main_results = self.collection.get()
-            
-            # 未回答の質問コレクションのデータを取得
-            unanswered_results = self.unanswered_collection.get()
-            
-            # メインコレクションのデータをDataFrameに変換
-            main_data = []
-            for doc, metadata, doc_id in zip(main_results['documents'], main_results['metadatas'], main_results['ids']):
-                main_data.append({
-                    'id': doc_id,
-                    'content': doc,
-                    'source': metadata.get('source', ''),
-                    'timestamp': metadata.get('timestamp', '')
-                })
-            
-            main_df = pd.DataFrame(main_data)
-            
-            # 未回答の質問のデータをDataFrameに変換
-            unanswered_data = []
-            for doc, metadata, doc_id in zip(unanswered_results['documents'], unanswered_results['metadatas'], unanswered_results['ids']):
-                unanswered_data.append({
-                    'id': doc_id,
-                    'question': doc,
-                    'keywords': metadata.get('keywords', ''),
-                    'timestamp': metadata.get('timestamp', '')
-                })
-            
-            unanswered_df = pd.DataFrame(unanswered_data)
-            
             # 出力ディレクトリの作成
-            output_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'exports')
-            os.makedirs(output_dir, exist_ok=True)
+            os.makedirs(self.output_dir, exist_ok=True)
             
             # タイムスタンプ付きのファイル名を生成
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            main_csv_path = os.path.join(output_dir, f'fireworks_information_{timestamp}.csv')
-            unanswered_csv_path = os.path.join(output_dir, f'unanswered_questions_{timestamp}.csv')
+            extension = 'csv.gz' if compress else 'csv'
+            main_csv_path = os.path.join(self.output_dir, f'fireworks_information_{timestamp}.{extension}')
+            unanswered_csv_path = os.path.join(self.output_dir, f'unanswered_questions_{timestamp}.{extension}')
             
             # CSVファイルに出力
-            main_df.to_csv(main_csv_path, index=False, encoding='utf-8-sig')
-            unanswered_df.to_csv(unanswered_csv_path, index=False, encoding='utf-8-sig')
+            main_count = self._write_rows(main_csv_path, MAIN_COLUMNS, self.iter_main_rows(page_size), compress)
+            unanswered_count = self._write_rows(
+                unanswered_csv_path, UNANSWERED_COLUMNS, self.iter_unanswered_rows(page_size), compress
+            )
             
             print(f"メインコレクションのデータを出力しました: {main_csv_path}")
             print(f"未回答の質問のデータを出力しました: {unanswered_csv_path}")
             
             # データの概要を表示
             print("\n=== データの概要 ===")
-            print(f"メインコレクションのドキュメント数: {len(main_df)}")
-            print(f"未回答の質問の数: {len(unanswered_df)}")
+            print(f"メインコレクションのドキュメント数: {main_count}")
+            print(f"未回答の質問の数: {unanswered_count}")
             
         except Exception as e:
             print(f"データの出力中にエラーが発生しました: {str(e)}")
 
-if __name__ == "__main__":
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def _save_state(self, state):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+    
+    def _incremental_targets(self):
+        # コレクション名 → (コレクション, 行の読み出し関数, 列)
+        return {
+            'fireworks_information': (self.collection, self.iter_main_rows, MAIN_DELTA_COLUMNS),
+            'unanswered_questions': (self.unanswered_collection, self.iter_unanswered_rows, UNANSWERED_DELTA_COLUMNS)
+        }
+    
+    def _ids_path(self, name):
+        return os.path.join(self.incremental_dir, f'{name}_ids.txt')
+    
+    def _load_exported_ids(self, name):
+        """前回までに出力したレコードのID（記録がない場合はNone）"""
+        path = self._ids_path(name)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return {line.rstrip('\n') for line in f if line.strip()}
+    
+    def _save_exported_ids(self, name, ids):
+        path = self._ids_path(name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record_id in sorted(ids):
+                f.write(f"{record_id}\n")
+        os.replace(tmp_path, path)
+    
+    def _append_exported_ids(self, name, ids):
+        # 通常の差分出力では一覧を書き直さず、出力したIDを追記する（重複は読み込み時に除く）
+        with open(self._ids_path(name), 'a', encoding='utf-8') as f:
+            for record_id in ids:
+                f.write(f"{record_id}\n")
+    
+    def _scan_ids(self, collection, page_size):
+        """コレクションの全IDを読み出す（本文・メタデータは読まない）"""
+        return {record['id'] for record in iter_collection(collection, page_size, ())}
+    
+    def export_incremental(self, page_size=DEFAULT_PAGE_SIZE, compress=False, full_scan=False):
+        """
+        前回の出力以降に追加・変更されたレコードだけを差分ファイルに出力
+        
+        modified_at（変更時刻のエポック秒）が前回出力時の最大値より新しいレコードだけを
+        where 条件で読み出すため、コストは変更の件数に比例する。出力したIDは一覧に追記する。
+        初回（ハイウォーターマークがない場合）は全件を出力する。
+        
+        modified_at を持たないレコード、古い modified_at のまま復元したレコード、削除されたレコードは
+        変更時刻では検出できない。full_scan を指定した場合だけ全件のIDを前回までの一覧と比較し、
+        
+        - 一覧にないIDは出力する
+        - 一覧にあって現在は存在しないIDは、削除の印（deleted=1）の行として出力する
+        
+        Args:
+            page_size (int): 1回に読み出す件数
+            compress (bool): gzip圧縮して出力するか
+            full_scan (bool): 全件のIDを読み、変更時刻で検出できない追加と削除も出力するか
+        
+        Returns:
+            dict: コレクション名 → 出力した件数
+        """
+        os.makedirs(self.incremental_dir, exist_ok=True)
+        state = self._load_state()
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        extension = 'csv.gz' if compress else 'csv'
+        counts = {}
+        
+        for name, (collection, iter_rows, columns) in self._incremental_targets().items():
+            high_water_mark = state.get(name)
+            where = {'modified_at': {'$gt': high_water_mark}} if high_water_mark is not None else None
+            current = None
+            missing, deleted = [], []
+            if full_scan and high_water_mark is not None:
+                exported_ids = self._load_exported_ids(name) or set()
+                current = self._scan_ids(collection, page_size)
+                missing = sorted(current - exported_ids)
+                deleted = sorted(exported_ids - current)
+            exported = []
+            latest = [high_water_mark]
+            
+            def rows():
+                for row in iter_rows(page_size, where=where):
+                    exported.append(row['id'])
+                    modified_at = row.get('modified_at')
+                    if isinstance(modified_at, (int, float)) and not isinstance(modified_at, bool):
+                        if latest[0] is None or modified_at > latest[0]:
+                            latest[0] = modified_at
+                    yield row
+                # 変更時刻で出力済みのものを除き、一覧になかったIDを出力
+                changed = set(exported)
+                yield from iter_rows(page_size, ids=[i for i in missing if i not in changed])
+                for record_id in deleted:
+                    yield {'id': record_id, 'deleted': 1}
+            
+            path = os.path.join(self.incremental_dir, f'{name}_delta_{timestamp}.{extension}')
+            count = self._write_rows(path, columns, rows(), compress)
+            if count == 0:
+                os.remove(path)
+            else:
+                print(f"{name}: {count}件の差分を出力しました（うち削除 {len(deleted)}件）: {path}")
+            
+            # 変更時刻を持つレコードがない場合も、次回から差分のみになるよう現在時刻を記録
+            state[name] = latest[0] if latest[0] is not None else datetime.now().timestamp()
+            if current is not None:
+                self._save_exported_ids(name, current)
+            else:
+                self._append_exported_ids(name, exported)
+            counts[name] = count
+        
+        self._save_state(state)
+        return counts
+    
+    def _read_rows(self, path):
+        """CSV（gzip圧縮を含む）の行を読み出す"""
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8-sig', newline='') as f:
+            yield from csv.DictReader(f)
+    
+    @staticmethod
+    def _read_run(run):
+        # 読み終えたランの一時ファイルは閉じると削除される
+        with run:
+            for line in run:
+                yield tuple(json.loads(line))
+    
+    def _sorted_runs(self, paths, run_size):
+        """
+        ファイルを run_size 行ずつIDで並べ替えた一時ファイル（ラン）に分ける
+        
+        Yields:
+            iterator: (ID, ファイルの順番, 行番号, 行) をIDの順に返すイテレーター
+        """
+        for order, path in enumerate(paths):
+            rows = self._read_rows(path)
+            position = 0
+            while True:
+                chunk = []
+                for row in rows:
+                    chunk.append((row['id'], order, position, row))
+                    position += 1
+                    if len(chunk) >= run_size:
+                        break
+                if not chunk:
+                    break
+                chunk.sort(key=lambda item: item[:3])
+                run = tempfile.TemporaryFile('w+', encoding='utf-8', dir=self.incremental_dir)
+                for item in chunk:
+                    run.write(json.dumps(item, ensure_ascii=False) + '\n')
+                run.seek(0)
+                yield self._read_run(run)
+                if len(chunk) < run_size:
+                    break
+    
+    def compact_incremental(self, compress=False, run_size=COMPACT_RUN_SIZE):
+        """
+        ベースファイルと差分ファイルを1つのベースファイルにまとめる
+        
+        同じIDのレコードは新しいファイルの内容で上書きし、削除の印の行はそのIDを取り除く。
+        各ファイルを run_size 行ずつIDで並べ替えてからマージするため、メモリ使用量は件数によらない。
+        まとめたベースファイルはIDの順に並ぶ。まとめた差分ファイルは削除する。
+        
+        Args:
+            compress (bool): gzip圧縮して出力するか
+            run_size (int): 並べ替えのために1度にメモリに載せる行数
+        
+        Returns:
+            dict: コレクション名 → まとめた後の件数
+        """
+        if not os.path.isdir(self.incremental_dir):
+            print("差分ファイルがありません。")
+            return {}
+        
+        files = sorted(os.listdir(self.incremental_dir))
+        extension = 'csv.gz' if compress else 'csv'
+        counts = {}
+        
+        for name, (_, _, columns) in self._incremental_targets().items():
+            deltas = [f for f in files if f.startswith(f'{name}_delta_')]
+            bases = [f for f in files if f.startswith(f'{name}_base.')]
+            if not deltas:
+                continue
+            
+            # IDごとに、ファイル名の時刻順で最後の行を採用する
+            paths = [os.path.join(self.incremental_dir, f) for f in bases + deltas]
+            runs = list(self._sorted_runs(paths, run_size))
+            merged = heapq.merge(*runs, key=lambda item: item[:3])
+            count = 0
+            base_path = os.path.join(self.incremental_dir, f'{name}_base.{extension}')
+            tmp_path = f"{base_path}.tmp"
+            with self._open_output(tmp_path, compress) as f:
+                writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+                writer.writeheader()
+                for _, items in groupby(merged, key=lambda item: item[0]):
+                    row = list(items)[-1][3]
+                    if row.get('deleted') != '1':
+                        writer.writerow(row)
+                        count += 1
+            os.replace(tmp_path, base_path)
+            
+            for path in paths:
+                if path != base_path:
+                    os.remove(path)
+            
+            print(f"{name}: {len(deltas)}個の差分をまとめました（{count}件）: {base_path}")
+            counts[name] = count
+        
+        return counts
+    
+    def _arrow_columns(self, records, text_column, fields, with_embeddings):
+        """レコードのリストを列ごとのリストに変換"""
+        columns = {'id': [], text_column: []}
+        for name, _, _ in fields:
+            columns[name] = []
+        columns[EXTRA_METADATA_COLUMN] = []
+        if with_embeddings:
+            columns['embedding'] = []
+        
+        typed_keys = {key for _, _, key in fields}
+        for record in records:
+            metadata = record['metadata'] or {}
+            columns['id'].append(record['id'])
+            columns[text_column].append(record['document'])
+            # 列定義にないキーは失わないようにJSONの列にまとめる
+            extra = {key: value for key, value in metadata.items() if key not in typed_keys}
+            for name, type_name, key in fields:
+                value, converted = _arrow_value(type_name, metadata.get(key))
+                if not converted:
+                    extra[key] = metadata[key]
+                columns[name].append(value)
+            columns[EXTRA_METADATA_COLUMN].append(json.dumps(extra, ensure_ascii=False) if extra else None)
+            if with_embeddings:
+                embedding = record.get('embedding')
+                columns['embedding'].append(list(embedding) if embedding is not None else None)
+        return columns
+    
+    def export_collection_columnar(self, collection_name, path, file_format='parquet',
+                                   with_embeddings=False, page_size=DEFAULT_PAGE_SIZE,
+                                   row_group_size=DEFAULT_ROW_GROUP_SIZE):
+        """
+        コレクションを列指向形式（Parquet または Arrow IPC）で出力
+        
+        行グループ単位で逐次書き出すため、メモリ使用量は行グループの大きさで決まる。
+        列定義にないメタデータと列の型に変換できない値は extra_metadata 列にJSONで保持し、
+        import_columnar() で元のメタデータに戻す。
+        
+        Args:
+            collection_name (str): コレクション名
+            path (str): 出力先のパス
+            file_format (str): 'parquet' または 'arrow'
+            with_embeddings (bool): 埋め込みベクトルの列を含めるか
+            page_size (int): 1回に読み出す件数
+            row_group_size (int): 1行グループあたりの行数
+        
+        Returns:
+            int: 書き出した行数
+        """
+        pa = _require_pyarrow()
+        text_column, fields = ARROW_LAYOUTS[collection_name]
+        schema = _arrow_schema(pa, text_column, fields, with_embeddings)
+        collection = self.store.get_collection(collection_name)
+        
+        include = ('documents', 'metadatas', 'embeddings') if with_embeddings else ('documents', 'metadatas')
+        if file_format == 'parquet':
+            writer = pa.parquet.ParquetWriter(path, schema, compression='zstd')
+        elif file_format == 'arrow':
+            writer = pa.ipc.new_file(path, schema)
+        else:
+            raise ValueError(f"未対応の形式です: {file_format}")
+        
+        count = 0
+        buffer = []
+        
+        def flush():
+            columns = self._arrow_columns(buffer, text_column, fields, with_embeddings)
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            buffer.clear()
+        
+        try:
+            for record in iter_collection(collection, page_size, include):
+                buffer.append(record)
+                count += 1
+                if len(buffer) >= row_group_size:
+                    flush()
+            if buffer:
+                flush()
+        finally:
+            writer.close()
+        return count
+    
+    def export_to_columnar(self, file_format='parquet', with_embeddings=False, page_size=DEFAULT_PAGE_SIZE,
+                           row_group_size=DEFAULT_ROW_GROUP_SIZE):
+        """
+        データベースの内容を列指向形式（Parquet または Arrow IPC）で出力
+        
+        Args:
+            file_format (str): 'parquet' または 'arrow'
+            with_embeddings (bool): 埋め込みベクトルの列を含めるか
+            page_size (int): 1回に読み出す件数
+            row_group_size (int): 1行グループあたりの行数
+        """
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            
+            print("\n=== データの概要 ===")
+            for collection_name in ARROW_LAYOUTS:
+                path = os.path.join(self.output_dir, f'{collection_name}_{timestamp}.{file_format}')
+                count = self.export_collection_columnar(
+                    collection_name, path, file_format, with_embeddings, page_size, row_group_size
+                )
+                print(f"{collection_name}: {count}件を出力しました: {path}")
+        
+        except Exception as e:
+            print(f"データの出力中にエラーが発生しました: {str(e)}")
+    
+    def _iter_columnar_batches(self, path, batch_size):
+        """列指向形式のファイルをバッチ単位で読み出す"""
+        pa = _require_pyarrow()
+        if path.endswith('.parquet'):
+            yield from pa.parquet.ParquetFile(path).iter_batches(batch_size=batch_size)
+        else:
+            with pa.memory_map(path, 'r') as source:
+                reader = pa.ipc.open_file(source)
+                for i in range(reader.num_record_batches):
+                    yield reader.get_batch(i)
+    
+    def import_columnar(self, path, collection_name=None, batch_size=DEFAULT_PAGE_SIZE):
+        """
+        列指向形式のファイルからコレクションに一括登録
+        
+        埋め込みベクトルの列があればそのまま登録するため、再スクレイピングや再計算は不要。
+        
+        Args:
+            path (str): 入力ファイルのパス（.parquet または .arrow）
+            collection_name (str, optional): 登録先のコレクション名（未指定の場合はファイル名から判定）
+            batch_size (int): 1回に登録する件数
+        
+        Returns:
+            int: 登録した件数
+        """
+        if collection_name is None:
+            collection_name = next(
+                (name for name in ARROW_LAYOUTS if os.path.basename(path).startswith(name)), None
+            )
+            if collection_name is None:
+                raise ValueError(f"登録先のコレクションを判定できません: {path}")
+        
+        text_column, fields = ARROW_LAYOUTS[collection_name]
+        collection = self.store.get_collection(collection_name, create=True)
+        
+        count = 0
+        for batch in self._iter_columnar_batches(path, batch_size):
+            columns = batch.to_pydict()
+            metadatas = []
+            extras = columns.get(EXTRA_METADATA_COLUMN, [None] * batch.num_rows)
+            for i in range(batch.num_rows):
+                metadata = json.loads(extras[i]) if extras[i] else {}
+                for name, type_name, key in fields:
+                    value = columns.get(name, [None] * batch.num_rows)[i]
+                    if value is None:
+                        continue
+                    metadata[key] = value.isoformat() if type_name == 'timestamp' else value
+                metadatas.append(metadata)
+            
+            kwargs = {
+                'ids': columns['id'],
+                'documents': columns[text_column],
+                'metadatas': metadatas
+            }
+            embeddings = columns.get('embedding')
+            if embeddings is not None and all(e is not None for e in embeddings):
+                kwargs['embeddings'] = embeddings
+            
+            # 同じIDは上書きする（再実行しても重複しない）
+            collection.upsert(**kwargs)
+            count += batch.num_rows
+            print(f"{count}件を登録しました")
+        
+        return count
+
+def main():
+    parser = argparse.ArgumentParser(description='ChromaDBの内容をファイルに出力')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE, help='1回に読み出す件数')
+    parser.add_argument('--gzip', action='store_true', help='gzip圧縮して出力する（CSVのみ）')
+    parser.add_argument('--format', choices=['csv', 'parquet', 'arrow'], default='csv', help='出力形式')
+    parser.add_argument('--embeddings', action='store_true', help='埋め込みベクトルを含める（Parquet/Arrowのみ）')
+    parser.add_argument('--import', dest='import_path', help='Parquet/Arrowファイルをコレクションに登録する')
+    parser.add_argument('--collection', help='登録先のコレクション名（--importと併用）')
+    parser.add_argument('--incremental', action='store_true', help='前回の出力以降の差分だけを出力する')
+    parser.add_argument('--full-scan', action='store_true',
+                        help='差分の出力時に全件のIDを読み、削除と変更時刻を持たないレコードも検出する')
+    parser.add_argument('--compact', action='store_true', help='差分ファイルをベースファイルにまとめる')
+    args = parser.parse_args()
+    
     exporter = DatabaseExporter()
-    exporter.export_to_csv() 
\ No newline at end of file
+    if args.compact:
+        exporter.compact_incremental(compress=args.gzip)
+    elif args.incremental:
+        exporter.export_incremental(page_size=args.page_size, compress=args.gzip, full_scan=args.full_scan)
+    elif args.import_path:
+        count = exporter.import_columnar(args.import_path, args.collection, args.page_size)
+        print(f"登録が完了しました: {count}件")
+    elif args.format == 'csv':
+        exporter.export_to_csv(page_size=args.page_size, compress=args.gzip)
+    else:
+        exporter.export_to_columnar(args.format, args.embeddings, args.page_size)
+
+if __name__ == "__main__":
+    main()
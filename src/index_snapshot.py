@@ -0,0 +1,201 @@
+import time
+import threading
+from contextlib import contextmanager
+from metrics import REGISTRY
+
+SNAPSHOT_VERSION_METRIC = 'rag_index_snapshot_version'
+SNAPSHOT_DRAINING_METRIC = 'rag_index_snapshots_draining'
+SNAPSHOT_BUILD_METRIC = 'rag_index_snapshot_build_seconds'
+
+
+class IndexSnapshot:
+    """
+    公開後は変更しない検索インデックスのスナップショット
+
+    読み取り側は acquire() で参照を保持し、差し替え後も処理が終わるまで同じ版を使う。
+    """
+
+    def __init__(self, version, index, params=None):
+        self.version = version
+        self.index = index
+        self.params = dict(params or {})
+        self.built_at = time.time()
+        self.readers = 0
+        self.retired = False
+
+
+class IndexSnapshotManager:
+    """
+    インデックススナップショットのバージョン管理と差し替え
+
+    新しいスナップショットはバックグラウンドで構築し、参照の入れ替えだけで公開する。
+    差し替え前の版は読み取り中のリクエストがすべて終わった時点で解放する。
+    同時に構築するスナップショットは1つまでとし、前の版の解放を待ってから次を構築する。
+    """
+
+    def __init__(self, builder, **params):
+        """
+        Args:
+            builder (callable): キーワード引数を受け取り検索インデックスを返す関数
+            **params: 初回構築時に builder に渡す引数
+        """
+        self._builder = builder
+        self._lock = threading.Lock()
+        self._drained = threading.Condition(self._lock)
+        self._build_lock = threading.Lock()
+        self._retired = []
+        self._last_error = None
+        self._current = self._build(1, params)
+        self._publish_metrics()
+
+    def _build(self, version, params):
+        start = time.perf_counter()
+        index = self._builder(**params)
+        REGISTRY.observe(SNAPSHOT_BUILD_METRIC, time.perf_counter() - start,
+                         help_text='Time to build an index snapshot')
+        return IndexSnapshot(version, index, params)
+
+    def _publish_metrics(self):
+        REGISTRY.set_gauge(SNAPSHOT_VERSION_METRIC, self._current.version,
+                           help_text='Version of the published index snapshot')
+        REGISTRY.set_gauge(SNAPSHOT_DRAINING_METRIC, len(self._retired),
+                           help_text='Retired snapshots still held by in-flight requests')
+
+    @property
+    def current(self):
+        """公開中のスナップショット"""
+        return self._current
+
+    @property
+    def index(self):
+        """公開中のスナップショットの検索インデックス（単発の参照用）"""
+        return self._current.index
+
+    def retired_indexes(self):
+        """
+        差し替え後も読み取り中のリクエストが参照している旧版の検索インデックス
+
+        Returns:
+            list: 解放前の検索インデックスのリスト
+        """
+        with self._lock:
+            return [s.index for s in self._retired if s.index is not None]
+
+    @contextmanager
+    def acquire(self):
+        """
+        公開中のスナップショットを取得し、ブロックを抜けるまで保持
+
+        Yields:
+            検索インデックス
+        """
+        with self._lock:
+            snapshot = self._current
+            snapshot.readers += 1
+        try:
+            yield snapshot.index
+        finally:
+            with self._lock:
+                snapshot.readers -= 1
+                if snapshot.retired and snapshot.readers == 0:
+                    self._release(snapshot)
+
+    @staticmethod
+    def _close(index):
+        # 検索インデックスが持つスレッドプールやメモリマップを解放
+        close = getattr(index, 'close', None)
+        if close is not None:
+            close()
+
+    def _release(self, snapshot):
+        """読み取りが終わった旧スナップショットを解放（ロック保持中に呼び出す）"""
+        self._close(snapshot.index)
+        snapshot.index = None
+        if snapshot in self._retired:
+            self._retired.remove(snapshot)
+        self._publish_metrics()
+        self._drained.notify_all()
+
+    def _swap(self, snapshot):
+        with self._lock:
+            previous = self._current
+            self._current = snapshot
+            previous.retired = True
+            if previous.readers == 0:
+                self._close(previous.index)
+                previous.index = None
+            else:
+                self._retired.append(previous)
+            self._publish_metrics()
+        print(f"インデックスのスナップショットを差し替えました: v{previous.version} → v{snapshot.version}")
+
+    def rebuild(self, drain_timeout=None, **params):
+        """
+        新しいスナップショットを構築して公開（同期実行）
+
+        Args:
+            drain_timeout (float, optional): 前の版の解放を待つ最大秒数
+            **params: builder に渡す引数（未指定の場合は現在の版と同じ引数）
+
+        Returns:
+            int: 公開したスナップショットのバージョン
+        """
+        with self._build_lock:
+            return self._rebuild_locked(drain_timeout, params)
+
+    def _rebuild_locked(self, drain_timeout, params):
+        # 旧スナップショットの解放を待ってから構築し、メモリ上の版を最大2つに抑える
+        with self._lock:
+            if not self._drained.wait_for(lambda: not self._retired, timeout=drain_timeout):
+                raise TimeoutError("旧スナップショットの解放待ちがタイムアウトしました")
+            version = self._current.version + 1
+            build_params = params if params else self._current.params
+
+        snapshot = self._build(version, build_params)
+        self._swap(snapshot)
+        return snapshot.version
+
+    def rebuild_async(self, **params):
+        """
+        バックグラウンドでスナップショットを再構築
+
+        Args:
+            **params: builder に渡す引数
+
+        Returns:
+            bool: 構築を開始した場合はTrue（既に構築中の場合はFalse）
+        """
+        if not self._build_lock.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                self._rebuild_locked(None, params)
+                self._last_error = None
+            except Exception as e:
+                self._last_error = str(e)
+                print(f"インデックスの再構築中にエラーが発生しました: {str(e)}")
+            finally:
+                self._build_lock.release()
+
+        threading.Thread(target=run, name='index-rebuild', daemon=True).start()
+        return True
+
+    def status(self):
+        """
+        スナップショットの状態を取得
+
+        Returns:
+            dict: 公開中のバージョン、構築中かどうか、解放待ちの版など
+        """
+        with self._lock:
+            return {
+                'version': self._current.version,
+                'built_at': self._current.built_at,
+                'readers': self._current.readers,
+                'building': self._build_lock.locked(),
+                'draining': [
+                    {'version': s.version, 'readers': s.readers} for s in self._retired
+                ],
+                'last_error': self._last_error
+            }
@@ -1,14 +1,36 @@
 import os
 import json
-import chromadb
+from chroma_store import ChromaStore
 from datetime import datetime
 import requests
 from bs4 import BeautifulSoup
 import time
+import uuid
+import threading
 from urllib.parse import urljoin
-import re
 from googleapiclient.discovery import build
 from dotenv import load_dotenv
+from text_chunker import iter_chunks
+from metrics import timed
+from pipeline import Pipeline, Stage, HostRateLimiter
+from search_cache import SearchResultCache, normalize_keywords
+
+# ウェブページ取得時のリクエストヘッダー
+REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# パイプライン実行時のステージごとのワーカー数
+DEFAULT_PIPELINE_WORKERS = {
+    'search': 2,
+    'fetch': 8,
+    'parse': 2,
+    'index': 1,
+    'mark': 1
+}
+
+# 同じホストへのアクセス間隔（秒）
+HOST_MIN_INTERVAL = 2.0
 
 class KnowledgeUpdater:
     def __init__(self):
@@ -22,28 +44,40 @@ class KnowledgeUpdater:
         if not self.api_key or not self.cse_id:
             raise ValueError("GOOGLE_API_KEYとGOOGLE_CSE_IDが設定されていません。.envファイルを確認してください。")
         
-        # Custom Search APIサービスの初期化
-        self.search_service = build('customsearch', 'v1', developerKey=self.api_key)
+        # Custom Search APIサービスの初期化（パイプラインの検索ワーカーはスレッドごとに生成する）
+        self._search_services = threading.local()
+        self.search_service
         
-        # データベースの保存ディレクトリを指定
-        self.DB_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'fireworks_db')
+        # 検索結果の永続キャッシュ（同じキーワードの組では再検索しない）
+        self.search_cache = SearchResultCache()
         
-        # ChromaDBの初期化
-        self.client = chromadb.PersistentClient(path=self.DB_DIR)
+        # ChromaDBの初期化（プロセス全体で共有するクライアントを使用）
+        self.store = ChromaStore.get()
+        self.DB_DIR = self.store.path
         
         # コレクションの取得
-        self.collection = self.client.get_collection(name="fireworks_information")
-        self.unanswered_collection = self.client.get_collection(name="unanswered_questions")
+        self.collection = self.store.get_collection("fireworks_information")
+        self.unanswered_collection = self.store.get_collection("unanswered_questions")
         
         print(f"データベースディレクトリ: {self.DB_DIR}")
         print("コレクションの初期化が完了しました")
     
+    @property
+    def search_service(self):
+        """呼び出したスレッド専用のCustom Search APIサービス（httplib2.Http はスレッドセーフではない）"""
+        service = getattr(self._search_services, 'service', None)
+        if service is None:
+            # build() は呼び出しごとに新しい httplib2.Http を作る
+            service = build('customsearch', 'v1', developerKey=self.api_key)
+            self._search_services.service = service
+        return service
+    
     def get_unanswered_questions(self):
         """
         未回答の質問を取得（知識更新済みの質問は除外）
         
         Returns:
-            list: 未回答の質問のリスト
+            list: 未回答の質問のリスト（ヒット数の多い順）
         """
         try:
             # メタデータでフィルタリング
@@ -51,6 +85,15 @@ class KnowledgeUpdater:
                 where={"is_updated": {"$ne": True}}  # 知識更新済みでない質問のみを取得
             )
             print(f"未回答の質問を取得しました: {len(results['ids'])}件")
+            
+            # ヒット数（同じ質問が寄せられた回数）の多い順に並べ替え
+            order = sorted(
+                range(len(results['ids'])),
+                key=lambda i: int((results['metadatas'][i] or {}).get('hit_count', 1)),
+                reverse=True
+            )
+            for field in ('ids', 'documents', 'metadatas'):
+                results[field] = [results[field][i] for i in order]
             return results
         except Exception as e:
             print(f"未回答の質問の取得中にエラーが発生しました: {str(e)}")
@@ -67,6 +110,11 @@ class KnowledgeUpdater:
         Returns:
             list: 検索結果のURLリスト
         """
+        cached = self.search_cache.get(keywords)
+        if cached is not None:
+            print(f"キャッシュ済みの検索結果を使用: {' '.join(keywords)}")
+            return cached
+        
         try:
             # キーワードを結合
             query = ' '.join(keywords)
@@ -88,12 +136,47 @@ class KnowledgeUpdater:
                         urls.append(url)
             
             print(f"検索結果のURL: {urls}")
+            self.search_cache.put(keywords, urls)
             return urls
             
         except Exception as e:
             print(f"Google検索中にエラーが発生しました: {str(e)}")
             return []
     
+    def fetch_page(self, url):
+        """
+        ウェブページのHTMLを取得
+        
+        Args:
+            url (str): 取得するURL
+        
+        Returns:
+            str: HTML
+        """
+        response = requests.get(url, headers=REQUEST_HEADERS, timeout=10)
+        response.raise_for_status()  # エラーチェック
+        return response.text
+    
+    def parse_chunks(self, html):
+        """
+        HTMLから本文を抽出してチャンクに分割
+        
+        Args:
+            html (str): HTML
+        
+        Returns:
+            list: テキストのチャンクリスト
+        """
+        soup = BeautifulSoup(html, 'html.parser')
+        
+        # 不要な要素の削除
+        for element in soup.find_all(['script', 'style', 'nav', 'footer', 'header']):
+            element.decompose()
+        
+        # 文境界・見出し・リスト項目を尊重してチャンクに分割
+        root = soup.body if soup.body else soup
+        return list(iter_chunks(root))
+    
     def scrape_webpage(self, url):
         """
         ウェブページをスクレイピング
@@ -107,29 +190,7 @@ class KnowledgeUpdater:
         try:
             print(f"ウェブページをスクレイピング: {url}")
             
-            # ヘッダーの設定
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            
-            # ページの取得
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()  # エラーチェック
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # 不要な要素の削除
-            for element in soup.find_all(['script', 'style', 'nav', 'footer', 'header']):
-                element.decompose()
-            
-            # テキストの抽出
-            text = soup.get_text()
-            
-            # テキストのクリーニング
-            text = re.sub(r'\s+', ' ', text).strip()
-            
-            # テキストをチャンクに分割（1000文字ごと）
-            chunks = [text[i:i+1000] for i in range(0, len(text), 1000)]
+            chunks = self.parse_chunks(self.fetch_page(url))
             
             print(f"スクレイピングしたテキストを{len(chunks)}個のチャンクに分割しました")
             return chunks
@@ -159,17 +220,19 @@ class KnowledgeUpdater:
             metadata = {
                 'source': source,
                 'timestamp': datetime.now().isoformat(),
+                'modified_at': time.time(),
                 'original_question': original_question if original_question else ''
             }
             
             print(f"知識を追加します: ID={doc_id}, ソース={source}")
             
             # コレクションに追加
-            self.collection.add(
-                documents=[text],
-                metadatas=[metadata],
-                ids=[doc_id]
-            )
+            with timed('chroma_write'):
+                self.collection.add(
+                    documents=[text],
+                    metadatas=[metadata],
+                    ids=[doc_id]
+                )
             
             # 追加の確認
             added_doc = self.collection.get(ids=[doc_id])
@@ -194,13 +257,67 @@ class KnowledgeUpdater:
                 ids=[doc_id],
                 metadatas=[{
                     'is_updated': True,
-                    'updated_at': datetime.now().isoformat()
+                    'updated_at': datetime.now().isoformat(),
+                    'modified_at': time.time()
                 }]
             )
             print(f"質問を知識更新済みとしてマークしました: {doc_id}")
         except Exception as e:
             print(f"質問の更新状態の変更中にエラーが発生しました: {str(e)}")
     
+    def group_questions(self, results):
+        """
+        未回答の質問を正規化したキーワードの組ごとにまとめる
+        
+        Args:
+            results (dict): get_unanswered_questions の結果
+        
+        Returns:
+            list: グループのリスト（キーワードと質問のリストを含む）
+        """
+        groups = {}
+        for doc, metadata, doc_id in zip(results['documents'], results['metadatas'], results['ids']):
+            try:
+                keywords = json.loads(metadata['keywords'])
+            except Exception as e:
+                print(f"キーワードの読み込み中にエラーが発生しました: {doc_id}: {str(e)}")
+                continue
+            key = normalize_keywords(keywords)
+            group = groups.setdefault(key, {'keywords': keywords, 'questions': [], 'demand': 0})
+            group['questions'].append({'id': doc_id, 'document': doc, 'metadata': metadata})
+            group['demand'] += int(metadata.get('hit_count', 1))
+        
+        print(f"{len(results['ids'])}件の質問を{len(groups)}個のキーワードグループにまとめました")
+        
+        # 需要（ヒット数の合計）の多いグループから処理する
+        return sorted(groups.values(), key=lambda g: g['demand'], reverse=True)
+    
+    def add_chunks(self, chunks, source, original_question):
+        """
+        1ページ分のチャンクをまとめてデータベースに追加
+        
+        Args:
+            chunks (list): テキストのチャンクリスト
+            source (str): 情報源のURL
+            original_question (str): 元の質問
+        """
+        timestamp = datetime.now()
+        prefix = f"doc_{timestamp.strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        with timed('chroma_write'):
+            self.collection.add(
+                documents=chunks,
+                metadatas=[{
+                    'source': source,
+                    'timestamp': timestamp.isoformat(),
+                    'modified_at': timestamp.timestamp(),
+                    'original_question': original_question,
+                    'chunk_index': i,
+                    'total_chunks': len(chunks)
+                } for i in range(len(chunks))],
+                ids=[f"{prefix}_{i}" for i in range(len(chunks))]
+            )
+        print(f"{len(chunks)}個のチャンクを追加しました: {source}")
+    
     def update_knowledge(self):
         """
         未回答の質問の知識を更新
@@ -211,14 +328,19 @@ class KnowledgeUpdater:
             print("未回答の質問はありません。")
             return
         
-        # 各質問について処理
-        for doc, metadata, doc_id in zip(results['documents'], results['metadatas'], results['ids']):
+        # 同じキーワードの組の質問はまとめて1回だけ検索し、URLは1回の実行で1度だけ取得する
+        scraped_urls = set()
+        
+        # 各グループについて処理
+        for group in self.group_questions(results):
             try:
-                print(f"\n質問の処理を開始: {doc_id}")
-                print(f"質問内容: {doc}")
+                question_ids = [q['id'] for q in group['questions']]
+                representative = group['questions'][0]['document']
+                print(f"\n質問グループの処理を開始: {question_ids}")
+                print(f"質問内容: {representative}")
                 
                 # キーワードを取得
-                keywords = json.loads(metadata['keywords'])
+                keywords = group['keywords']
                 print(f"抽出されたキーワード: {keywords}")
                 
                 # Google検索を実行
@@ -228,43 +350,135 @@ class KnowledgeUpdater:
                     print("検索結果が見つかりませんでした")
                     continue
                 
-                # 各URLについてスクレイピング
+                # 各URLについてスクレイピング（この実行で取得済みのURLは除く）
+                fetched = False
                 for url in urls:
+                    if url in scraped_urls:
+                        print(f"取得済みのURLのためスキップ: {url}")
+                        continue
+                    scraped_urls.add(url)
+                    fetched = True
+                    
                     chunks = self.scrape_webpage(url)
                     if chunks:
-                        # 各チャンクを知識として追加
-                        for i, chunk in enumerate(chunks):
-                            # チャンク番号をメタデータに追加
-                            chunk_metadata = {
-                                'source': url,
-                                'timestamp': datetime.now().isoformat(),
-                                'original_question': doc,
-                                'chunk_index': i,
-                                'total_chunks': len(chunks)
-                            }
-                            
-                            # ドキュメントIDの生成（チャンク番号を含める）
-                            chunk_id = f"doc_{datetime.now().strftime('%Y%m%d%H%M%S')}_{i}"
-                            
-                            # コレクションに追加
-                            self.collection.add(
-                                documents=[chunk],
-                                metadatas=[chunk_metadata],
-                                ids=[chunk_id]
-                            )
-                            
-                            print(f"チャンク {i+1}/{len(chunks)} を追加しました")
+                        self.add_chunks(chunks, url, representative)
                 
                 # 質問を知識更新済みとしてマーク
-                self.mark_question_as_updated(doc_id)
+                for question_id in question_ids:
+                    self.mark_question_as_updated(question_id)
                 
                 # サーバーに負荷をかけないように待機
-                time.sleep(2)
+                if fetched:
+                    time.sleep(2)
             
             except Exception as e:
                 print(f"質問の処理中にエラーが発生しました: {str(e)}")
                 continue
 
+    def update_knowledge_pipelined(self, workers=None, host_interval=HOST_MIN_INTERVAL):
+        """
+        未回答の質問の知識をパイプラインで並行に更新
+        
+        検索 → 取得 → 解析・分割 → 登録 → 更新済みマーク の各ステージを有界キューでつなぎ、
+        ステージごとのワーカー数で並行に処理する。アクセス間隔はホスト単位で制御する。
+        
+        Args:
+            workers (dict, optional): ステージ名 → ワーカー数
+            host_interval (float): 同じホストへのアクセス間隔（秒）
+        
+        Returns:
+            dict: ステージごとの処理件数・エラー件数
+        """
+        results = self.get_unanswered_questions()
+        if not results or not results['ids']:
+            print("未回答の質問はありません。")
+            return {}
+        
+        stage_workers = dict(DEFAULT_PIPELINE_WORKERS)
+        stage_workers.update(workers or {})
+        rate_limiter = HostRateLimiter(host_interval)
+        
+        # グループごとに未完了のURL数を数え、すべて登録し終えたら更新済みにする
+        groups = self.group_questions(results)
+        pending_urls = {}
+        claimed_urls = set()
+        pending_lock = threading.Lock()
+        
+        def mark_group(group_index):
+            for question in groups[group_index]['questions']:
+                self.mark_question_as_updated(question['id'])
+        
+        def search(group_index):
+            group = groups[group_index]
+            urls = self.search_google(group['keywords'])
+            if not urls:
+                print(f"検索結果が見つかりませんでした: {group['keywords']}")
+                return []
+            
+            # URLは1回の実行で1度だけ取得する（他のグループが取得済みのURLは除く）
+            with pending_lock:
+                new_urls = [url for url in dict.fromkeys(urls) if url not in claimed_urls]
+                claimed_urls.update(new_urls)
+                pending_urls[group_index] = len(new_urls)
+            if not new_urls:
+                mark_group(group_index)
+                return []
+            return [{'group': group_index, 'url': url} for url in new_urls]
+        
+        def fetch(job):
+            rate_limiter.wait(job['url'])
+            print(f"ウェブページをスクレイピング: {job['url']}")
+            try:
+                job['html'] = self.fetch_page(job['url'])
+            except Exception as e:
+                print(f"ウェブページの取得中にエラーが発生しました: {str(e)}")
+                job['html'] = None
+            return [job]
+        
+        def parse(job):
+            try:
+                job['chunks'] = self.parse_chunks(job.pop('html')) if job['html'] else []
+            except Exception as e:
+                print(f"ウェブページの解析中にエラーが発生しました: {str(e)}")
+                job['chunks'] = []
+            return [job]
+        
+        def index(job):
+            chunks = job.pop('chunks')
+            if chunks:
+                # 1ページ分のチャンクをまとめて登録（埋め込みもまとめて計算される）
+                representative = groups[job['group']]['questions'][0]['document']
+                self.add_chunks(chunks, job['url'], representative)
+            return [job['group']]
+        
+        def mark(group_index):
+            with pending_lock:
+                pending_urls[group_index] -= 1
+                done = pending_urls[group_index] == 0
+            if done:
+                mark_group(group_index)
+            return None
+        
+        pipeline = Pipeline([
+            Stage('search', search, stage_workers['search']),
+            Stage('fetch', fetch, stage_workers['fetch']),
+            Stage('parse', parse, stage_workers['parse']),
+            Stage('index', index, stage_workers['index']),
+            Stage('mark', mark, stage_workers['mark'])
+        ])
+        
+        stats = pipeline.run(range(len(groups)))
+        
+        print("\n=== パイプラインの処理結果 ===")
+        for name, counts in stats.items():
+            print(f"{name}: 処理 {counts['processed']}件, エラー {counts['errors']}件")
+        return stats
+
 if __name__ == "__main__":
+    import sys
+    
     updater = KnowledgeUpdater()
-    updater.update_knowledge() 
\ No newline at end of file
+    if '--pipeline' in sys.argv:
+        updater.update_knowledge_pipelined()
+    else:
+        updater.update_knowledge() 
\ No newline at end of file
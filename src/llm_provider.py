@@ -0,0 +1,233 @@
+import os
+import re
+import math
+import time
+import random
+import threading
+from abc import ABC, abstractmethod
+from dotenv import load_dotenv
+
+# 環境変数の読み込み
+load_dotenv()
+
+# 既定のGeminiモデル名
+DEFAULT_GEMINI_MODEL = 'gemini-1.5-pro'
+
+# プロンプトから質問文を取り出すためのパターン
+KEYWORD_QUESTION_PATTERN = re.compile(r'質問文:\s*(.+)')
+ANSWER_QUESTION_PATTERN = re.compile(r'質問:\s*(.+)')
+ANSWER_CONTEXT_PATTERN = re.compile(r'参考情報:\s*(.*?)\s*質問:', re.S)
+KEYWORD_TOKEN_PATTERN = re.compile(r'[一-龥ァ-ヶー]{2,}|[A-Za-z0-9]{2,}')
+
+# 疑似LLMの既定の乱数シード（指定しなくても遅延・疑似エラーの系列が再現する）
+DEFAULT_FAKE_SEED = 0
+
+
+class LLMResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class LLMProvider(ABC):
+    """
+    LLMバックエンドのインターフェース
+
+    generate_content(prompt) は `.text` 属性を持つ応答を返す。
+    """
+    name = 'base'
+
+    @abstractmethod
+    def generate_content(self, prompt):
+        """プロンプトに対する応答（LLMResponse）を生成"""
+
+
+class GeminiProvider(LLMProvider):
+    name = 'gemini'
+
+    def __init__(self, model_name=DEFAULT_GEMINI_MODEL, api_key=None):
+        import google.generativeai as genai
+
+        # Google APIキーの設定
+        api_key = api_key or os.getenv('GOOGLE_API_KEY')
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEYが設定されていません。.envファイルを確認してください。")
+
+        # Gemini APIの初期化
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate_content(self, prompt):
+        response = self.model.generate_content(prompt)
+        return LLMResponse(response.text)
+
+
+class LatencyDistribution:
+    """
+    疑似的な応答遅延の分布
+
+    指定形式: "fixed:秒", "uniform:最小,最大", "normal:平均,標準偏差", "lognormal:中央値,シグマ"
+    """
+    KINDS = ('fixed', 'uniform', 'normal', 'lognormal')
+
+    # 分布ごとのパラメータ数
+    PARAM_COUNTS = {'fixed': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2}
+
+    def __init__(self, kind='fixed', params=(0.0,), seed=None):
+        if kind not in self.KINDS:
+            raise ValueError(f"未対応の遅延分布です: {kind}")
+        try:
+            params = tuple(float(p) for p in params)
+        except (TypeError, ValueError):
+            raise ValueError(f"遅延分布のパラメータが数値ではありません: {params}")
+        if len(params) != self.PARAM_COUNTS[kind]:
+            raise ValueError(f"{kind} のパラメータは{self.PARAM_COUNTS[kind]}個です: {params}")
+        if any(math.isnan(p) or math.isinf(p) for p in params):
+            raise ValueError(f"遅延分布のパラメータが不正です: {params}")
+        if kind == 'fixed' and params[0] < 0:
+            raise ValueError(f"固定の遅延は0以上にしてください: {params[0]}")
+        if kind == 'uniform' and not 0 <= params[0] <= params[1]:
+            raise ValueError(f"uniform は 0 <= 最小 <= 最大 で指定してください: {params}")
+        if kind in ('normal', 'lognormal') and params[1] < 0:
+            raise ValueError(f"{kind} の標準偏差・シグマは0以上にしてください: {params[1]}")
+        if kind == 'lognormal' and params[0] <= 0:
+            raise ValueError(f"lognormal の中央値は正の値にしてください: {params[0]}")
+        self.kind = kind
+        self.params = params
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec, seed=None):
+        """
+        文字列から遅延分布を生成
+
+        Args:
+            spec (str): 分布の指定（例: "lognormal:0.8,0.5"）
+            seed (int, optional): 乱数シード
+
+        Returns:
+            LatencyDistribution: 遅延分布
+
+        Raises:
+            ValueError: 分布の種類・パラメータの数・値が不正な場合
+        """
+        if not spec:
+            return cls('fixed', (0.0,), seed)
+        kind, _, params = spec.partition(':')
+        values = [p for p in params.split(',') if p.strip()] or ['0']
+        return cls(kind.strip(), values, seed)
+
+    def sample(self):
+        """遅延（秒）をサンプリング"""
+        with self._lock:
+            if self.kind == 'fixed':
+                value = self.params[0]
+            elif self.kind == 'uniform':
+                value = self._random.uniform(self.params[0], self.params[1])
+            elif self.kind == 'normal':
+                value = self._random.gauss(self.params[0], self.params[1])
+            else:
+                value = self._random.lognormvariate(math.log(self.params[0]), self.params[1])
+        return max(0.0, value)
+
+
+class FakeLLMProvider(LLMProvider):
+    """
+    ネットワークを使わない決定的なローカルLLM
+
+    負荷試験・ベンチマーク・CI用。遅延は分布からサンプリングし、
+    出力は固定応答またはテンプレートから生成する。
+    """
+    name = 'fake'
+
+    KEYWORD_TEMPLATE = '{keywords}'
+    ANSWER_TEMPLATE = '【テスト応答】「{question}」について、参考情報（{context_chars}文字）に基づいて回答します。'
+
+    def __init__(self, latency=None, responses=None, keyword_template=None, answer_template=None,
+                 error_rate=0.0, seed=DEFAULT_FAKE_SEED):
+        """
+        Args:
+            latency (LatencyDistribution or str, optional): 応答遅延の分布
+            responses (dict, optional): プロンプトに含まれる文字列 → 固定応答
+            keyword_template (str, optional): キーワード抽出プロンプトへの応答テンプレート
+            answer_template (str, optional): 回答生成プロンプトへの応答テンプレート
+            error_rate (float): 例外を発生させる確率（障害の再現用）
+            seed (int): 乱数シード
+        """
+        if latency is None or isinstance(latency, str):
+            latency = LatencyDistribution.parse(latency, seed)
+        self.latency = latency
+        self.responses = responses or {}
+        self.keyword_template = keyword_template or self.KEYWORD_TEMPLATE
+        self.answer_template = answer_template or self.ANSWER_TEMPLATE
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.call_count = 0
+
+    @classmethod
+    def from_env(cls):
+        """
+        環境変数から設定を読み込んで生成
+
+        FAKE_LLM_LATENCY, FAKE_LLM_ERROR_RATE, FAKE_LLM_SEED を参照する。
+        """
+        seed = os.getenv('FAKE_LLM_SEED')
+        seed = int(seed) if seed else DEFAULT_FAKE_SEED
+        return cls(
+            latency=LatencyDistribution.parse(os.getenv('FAKE_LLM_LATENCY', ''), seed),
+            error_rate=float(os.getenv('FAKE_LLM_ERROR_RATE', '0')),
+            seed=seed
+        )
+
+    def _render(self, prompt):
+        """プロンプトに応じた応答テキストを生成"""
+        for pattern, text in self.responses.items():
+            if pattern in prompt:
+                return text
+
+        # キーワード抽出プロンプト
+        match = KEYWORD_QUESTION_PATTERN.search(prompt)
+        if match:
+            question = match.group(1).strip()
+            keywords = KEYWORD_TOKEN_PATTERN.findall(question)[:3] or [question]
+            return self.keyword_template.format(keywords=','.join(keywords), question=question)
+
+        # 回答生成プロンプト
+        match = ANSWER_QUESTION_PATTERN.search(prompt)
+        if match:
+            question = match.group(1).strip()
+            context = ANSWER_CONTEXT_PATTERN.search(prompt)
+            context_chars = len(context.group(1)) if context else 0
+            return self.answer_template.format(question=question, context_chars=context_chars)
+
+        return 'こんにちは'
+
+    def generate_content(self, prompt):
+        with self._lock:
+            self.call_count += 1
+            fail = self.error_rate > 0 and self._random.random() < self.error_rate
+
+        time.sleep(self.latency.sample())
+        if fail:
+            raise RuntimeError("FakeLLMProviderの疑似エラー")
+        return LLMResponse(self._render(prompt))
+
+
+def create_llm_provider(name=None):
+    """
+    名前（または環境変数 LLM_PROVIDER）からLLMプロバイダーを生成
+
+    Args:
+        name (str, optional): 'gemini' または 'fake'
+
+    Returns:
+        LLMProvider: LLMプロバイダー
+    """
+    name = (name or os.getenv('LLM_PROVIDER', 'gemini')).lower()
+    if name == 'gemini':
+        return GeminiProvider(os.getenv('GEMINI_MODEL', DEFAULT_GEMINI_MODEL))
+    if name == 'fake':
+        return FakeLLMProvider.from_env()
+    raise ValueError(f"未対応のLLMプロバイダーです: {name}")
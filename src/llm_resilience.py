@@ -0,0 +1,248 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from llm_provider import LLMProvider
+
+# ステージごとの既定の締め切り（秒）
+DEFAULT_STAGE_DEADLINES = {
+    'startup': 30.0,
+    'keywords': 8.0,
+    'generate': 30.0,
+    'default': 30.0
+}
+
+# ヘッジリクエストを送るために必要な遅延サンプル数
+HEDGE_MIN_SAMPLES = 20
+
+# 遅延サンプルの保持数
+LATENCY_WINDOW = 200
+
+
+class LLMTimeoutError(Exception):
+    """LLM呼び出しが締め切りまでに完了しなかった"""
+
+
+class CircuitOpenError(Exception):
+    """サーキットブレーカーが開いているため呼び出しを行わなかった"""
+
+
+class LLMOverloadedError(Exception):
+    """同時実行中のLLM呼び出しが上限に達している"""
+
+
+class CircuitBreaker:
+    """
+    直近の呼び出しのエラー率に基づくサーキットブレーカー
+
+    closed: 通常状態。エラー率が閾値を超えるとopenに遷移
+    open: すべての呼び出しを即座に失敗させる。一定時間後にhalf_openに遷移
+    half_open: 試行呼び出しを1件だけ許可し、成功すればclosed、失敗すればopenに戻る
+    """
+
+    def __init__(self, failure_threshold=0.5, window=20, min_calls=5, open_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self._outcomes = deque(maxlen=window)
+        self._state = 'closed'
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def _refresh(self):
+        if self._state == 'open' and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = 'half_open'
+            self._trial_in_flight = False
+
+    def allow(self):
+        """
+        呼び出しを許可するかを判定
+
+        Returns:
+            bool: 許可する場合はTrue
+        """
+        with self._lock:
+            self._refresh()
+            if self._state == 'closed':
+                return True
+            if self._state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def release(self):
+        """結果を記録せずに試行呼び出しの枠を解放"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record(self, success):
+        """呼び出し結果を記録"""
+        with self._lock:
+            if self._state == 'half_open':
+                if success:
+                    self._state = 'closed'
+                    self._outcomes.clear()
+                else:
+                    self._state = 'open'
+                    self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+                return
+
+            self._outcomes.append(success)
+            if len(self._outcomes) >= self.min_calls:
+                failures = self._outcomes.count(False)
+                if failures / len(self._outcomes) >= self.failure_threshold:
+                    self._state = 'open'
+                    self._opened_at = time.monotonic()
+
+
+class ResilientLLM(LLMProvider):
+    """
+    締め切り・ヘッジリクエスト・サーキットブレーカーを備えたLLMプロバイダーのラッパー
+
+    呼び出しは専用のスレッドプールで実行し、呼び出し元は締め切りで待機を打ち切る。
+    """
+
+    def __init__(self, provider, deadlines=None, hedge=False, max_in_flight=16,
+                 breaker=None, fallback=None):
+        """
+        Args:
+            provider (LLMProvider): ラップするプロバイダー
+            deadlines (dict, optional): ステージ名 → 締め切り（秒）
+            hedge (bool): p95遅延を超えた呼び出しに2本目のリクエストを送るか
+            max_in_flight (int): 同時に実行するLLM呼び出しの上限
+            breaker (CircuitBreaker, optional): サーキットブレーカー
+            fallback (LLMProvider, optional): ブレーカーが開いている間に使うプロバイダー
+        """
+        self.provider = provider
+        self.name = provider.name
+        self.deadlines = dict(DEFAULT_STAGE_DEADLINES)
+        self.deadlines.update(deadlines or {})
+        self.hedge = hedge
+        self.max_in_flight = max_in_flight
+        self.breaker = breaker if breaker else CircuitBreaker()
+        self.fallback = fallback
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='llm')
+        self._in_flight = 0
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def _record_latency(self, stage, seconds):
+        with self._lock:
+            samples = self._latencies.setdefault(stage, deque(maxlen=LATENCY_WINDOW))
+            samples.append(seconds)
+
+    def hedge_delay(self, stage):
+        """
+        ステージのp95遅延を返す（サンプル不足の場合はNone）
+
+        Args:
+            stage (str): ステージ名
+
+        Returns:
+            float: ヘッジリクエストを送るまでの待機時間（秒）
+        """
+        with self._lock:
+            samples = sorted(self._latencies.get(stage, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def _submit(self, prompt, stage):
+        """呼び出しをスレッドプールに投入（同時実行数の上限を超える場合は即座に失敗）"""
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                raise LLMOverloadedError("LLM呼び出しの同時実行数が上限に達しています")
+            self._in_flight += 1
+
+        def call():
+            start = time.monotonic()
+            try:
+                response = self.provider.generate_content(prompt)
+            finally:
+                self._release_slot()
+            self._record_latency(stage, time.monotonic() - start)
+            return response
+
+        future = self._executor.submit(call)
+        # 実行前にキャンセルされた呼び出しの枠を解放
+        future.add_done_callback(lambda f: f.cancelled() and self._release_slot())
+        return future
+
+    def _release_slot(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _call(self, prompt, stage):
+        deadline = time.monotonic() + self.deadlines.get(stage, self.deadlines['default'])
+        futures = [self._submit(prompt, stage)]
+
+        # p95を超えても完了しない場合は2本目のリクエストを送る
+        delay = self.hedge_delay(stage) if self.hedge else None
+        if delay is not None:
+            done, _ = wait(futures, timeout=min(delay, max(0.0, deadline - time.monotonic())))
+            if not done and time.monotonic() < deadline:
+                try:
+                    futures.append(self._submit(prompt, stage))
+                except LLMOverloadedError:
+                    pass
+
+        # 最初に成功した応答を採用
+        pending = set(futures)
+        error = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                error = future.exception()
+
+        for future in pending:
+            future.cancel()
+        if pending or error is None:
+            raise LLMTimeoutError(f"LLM呼び出しが締め切りを超えました（ステージ: {stage}）")
+        raise error
+
+    def close(self):
+        """スレッドプールを停止（実行前の呼び出しは取り消す）"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def generate_content(self, prompt, stage='default'):
+        """
+        締め切り付きでLLMを呼び出す
+
+        Args:
+            prompt (str): プロンプト
+            stage (str): 締め切りとヘッジ判定に使うステージ名
+
+        Returns:
+            応答（`.text` 属性を持つ）
+        """
+        if not self.breaker.allow():
+            if self.fallback:
+                return self.fallback.generate_content(prompt)
+            raise CircuitOpenError("LLMのサーキットブレーカーが開いています")
+
+        try:
+            response = self._call(prompt, stage)
+        except LLMOverloadedError:
+            # 過負荷はプロバイダーの障害ではないためブレーカーには記録しない
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record(False)
+            raise
+        self.breaker.record(True)
+        return response
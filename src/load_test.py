@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import requests
+from benchmark import load_questions, build_query_set, latency_summary, DEFAULT_QUESTIONS_PATH
+from chroma_store import DEFAULT_DB_DIR
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+
+# 結果の保存先
+DEFAULT_RESULTS_DIR = os.path.join(BASE_DIR, 'data', 'load_tests')
+
+# エンドポイントごとのリクエストの割合
+DEFAULT_MIX = {'search': 0.5, 'query': 0.5}
+
+# 起動するサービスの疑似LLMの遅延（Geminiの応答時間に近い対数正規分布）
+DEFAULT_FAKE_LLM_LATENCY = 'lognormal:0.8,0.5'
+
+# リクエストのタイムアウト（秒）
+REQUEST_TIMEOUT = 30.0
+
+# サービスの起動を待つ最大秒数
+STARTUP_TIMEOUT = 120.0
+
+_local = threading.local()
+
+
+def _session():
+    # requests.Session はスレッド間で共有しない
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+
+def start_service(port, llm_latency=DEFAULT_FAKE_LLM_LATENCY, db_dir=None, extra_env=None):
+    """
+    疑似LLMに接続したサービスを子プロセスで起動
+
+    Args:
+        port (int): 待ち受けポート
+        llm_latency (str): 疑似LLMの遅延分布の指定
+        db_dir (str, optional): サービスが使うChromaDBの保存ディレクトリ
+        extra_env (dict, optional): 追加の環境変数（ADMISSION_* など）
+
+    Returns:
+        subprocess.Popen: サービスのプロセス
+    """
+    env = dict(os.environ)
+    env.update({
+        'LLM_PROVIDER': 'fake',
+        'FAKE_LLM_LATENCY': llm_latency,
+        'FAKE_LLM_SEED': env.get('FAKE_LLM_SEED', '0')
+    })
+    if db_dir:
+        env['CHROMA_DB_DIR'] = db_dir
+    env.update(extra_env or {})
+    # デバッグモードのリローダーを使わずにスレッドモードで起動する
+    code = f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"サービスの起動に失敗しました（終了コード {process.returncode}）")
+        try:
+            if requests.get(f'{url}/index/status', timeout=1).ok:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("サービスの起動がタイムアウトしました")
+
+
+def _send(url, endpoint, payload, scheduled_at, records, lock):
+    # 遅延は予定時刻から計測する（送信側の遅れも含め、協調的な欠落を避ける）
+    status = None
+    try:
+        response = _session().post(f'{url}/{endpoint}', json=payload, timeout=REQUEST_TIMEOUT)
+        status = response.status_code
+    except requests.RequestException:
+        pass
+    latency = time.perf_counter() - scheduled_at
+    with lock:
+        records.append((endpoint, status, latency))
+
+
+def run_step(url, rate, duration, queries, questions, mix=DEFAULT_MIX, poisson=True, seed=0, max_workers=512):
+    """
+    一定の到着率でリクエストを送り続ける（オープンループ）
+
+    応答を待たずに予定時刻どおりに送信するため、サービスが遅くなっても到着率は下がらない。
+
+    Args:
+        url (str): サービスのURL
+        rate (float): 1秒あたりの到着数
+        duration (float): 送信を続ける秒数
+        queries (list): /search に送る検索クエリ
+        questions (list): /query に送る質問
+        mix (dict): エンドポイント → 割合
+        poisson (bool): 到着間隔を指数分布にする（Falseの場合は等間隔）
+        seed (int): 乱数シード
+        max_workers (int): 同時に応答を待つリクエスト数の上限
+
+    Returns:
+        dict: エンドポイントごとの集計結果
+    """
+    rng = random.Random(seed)
+    endpoints = list(mix)
+    weights = [mix[e] for e in endpoints]
+    records = []
+    lock = threading.Lock()
+
+    start = time.perf_counter()
+    next_at = start
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while next_at - start < duration:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            endpoint = rng.choices(endpoints, weights)[0]
+            if endpoint == 'search':
+                payload = {'query': rng.choice(queries), 'count': 3}
+            else:
+                payload = {'query': rng.choice(questions)}
+            executor.submit(_send, url, endpoint, payload, next_at, records, lock)
+            next_at += rng.expovariate(rate) if poisson else 1.0 / rate
+    elapsed = time.perf_counter() - start
+
+    return summarize(records, rate, elapsed)
+
+
+def summarize(records, rate, elapsed):
+    """
+    エンドポイントごとにスループット・遅延・エラー率を集計
+
+    Args:
+        records (list): (エンドポイント, ステータス, 遅延) のリスト
+        rate (float): 目標の到着率
+        elapsed (float): 計測にかかった秒数
+
+    Returns:
+        dict: エンドポイント → 集計結果
+    """
+    summary = {}
+    for endpoint in sorted({r[0] for r in records}):
+        rows = [r for r in records if r[0] == endpoint]
+        ok = [r[2] for r in rows if r[1] is not None and r[1] < 400]
+        shed = sum(1 for r in rows if r[1] == 503)
+        failed = sum(1 for r in rows if r[1] is None or (r[1] >= 400 and r[1] != 503))
+        stats = latency_summary(ok, elapsed) if ok else {'count': 0, 'qps': 0.0}
+        summary[endpoint] = {
+            'target_rate': rate,
+            'sent': len(rows),
+            'ok': len(ok),
+            'throughput': len(ok) / elapsed if elapsed > 0 else 0.0,
+            'p50_ms': stats.get('p50_ms'),
+            'p95_ms': stats.get('p95_ms'),
+            'p99_ms': stats.get('p99_ms'),
+            'shed_rate': shed / len(rows),
+            'error_rate': failed / len(rows)
+        }
+    return summary
+
+
+def print_step(rate, summary):
+    for endpoint, s in summary.items():
+        p50 = f"{s['p50_ms']:.0f}" if s['p50_ms'] is not None else '-'
+        p95 = f"{s['p95_ms']:.0f}" if s['p95_ms'] is not None else '-'
+        p99 = f"{s['p99_ms']:.0f}" if s['p99_ms'] is not None else '-'
+        print(f"{rate:>7.1f} {endpoint:<7} {s['sent']:>6} {s['throughput']:>8.1f} {p50:>8} {p95:>8} {p99:>8} "
+              f"{s['shed_rate']:>7.1%} {s['error_rate']:>7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='/query と /search にオープンループで負荷をかける')
+    parser.add_argument('--url', help='既に起動しているサービスのURL（未指定の場合は疑似LLMで起動する）')
+    parser.add_argument('--port', type=int, default=5001, help='起動するサービスのポート')
+    parser.add_argument('--rates', type=float, nargs='+', default=[2, 5, 10, 20],
+                        help='到着率（件/秒）。指定した順に段階的に実行する')
+    parser.add_argument('--duration', type=float, default=30, help='1段階あたりの秒数')
+    parser.add_argument('--mix', default='search=0.5,query=0.5', help='エンドポイントの割合')
+    parser.add_argument('--uniform', action='store_true', help='到着間隔を等間隔にする（既定はポアソン到着）')
+    parser.add_argument('--llm-latency', default=DEFAULT_FAKE_LLM_LATENCY, help='疑似LLMの遅延分布')
+    parser.add_argument('--questions', default=DEFAULT_QUESTIONS_PATH, help='送信する質問のファイル')
+    parser.add_argument('--seed', type=int, default=0, help='乱数シード')
+    parser.add_argument('--output-dir', default=DEFAULT_RESULTS_DIR, help='結果の保存先')
+    args = parser.parse_args()
+
+    mix = {}
+    for item in args.mix.split(','):
+        endpoint, _, weight = item.partition('=')
+        mix[endpoint.strip()] = float(weight or 1)
+
+    questions = load_questions(args.questions)
+    queries = build_query_set(questions)
+
+    process = None
+    db_dir = None
+    url = args.url
+    if not url:
+        # 負荷試験中に保存される未回答の質問で本番のデータベースを汚さないよう、複製を使う
+        db_dir = tempfile.mkdtemp(prefix='rag_load_test_')
+        if os.path.isdir(DEFAULT_DB_DIR):
+            shutil.copytree(DEFAULT_DB_DIR, db_dir, dirs_exist_ok=True)
+        print(f"疑似LLM（{args.llm_latency}）でサービスを起動しています...")
+        try:
+            process = start_service(args.port, args.llm_latency, db_dir)
+        except Exception:
+            shutil.rmtree(db_dir, ignore_errors=True)
+            raise
+        url = f'http://127.0.0.1:{args.port}'
+
+    results = {
+        'created_at': datetime.now().isoformat(),
+        'url': url,
+        'config': {
+            'rates': args.rates,
+            'duration': args.duration,
+            'mix': mix,
+            'arrival': 'uniform' if args.uniform else 'poisson',
+            'llm_latency': args.llm_latency if process else None
+        },
+        'steps': []
+    }
+    try:
+        print(f"\n{'rate':>7} {'target':<7} {'sent':>6} {'ok/s':>8} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8} "
+              f"{'shed':>7} {'error':>7}")
+        for i, rate in enumerate(args.rates):
+            summary = run_step(url, rate, args.duration, queries, questions, mix,
+                               poisson=not args.uniform, seed=args.seed + i)
+            print_step(rate, summary)
+            results['steps'].append({'rate': rate, 'endpoints': summary})
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if db_dir:
+            shutil.rmtree(db_dir, ignore_errors=True)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"load_test_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n結果を保存しました: {path}")
+
+
+if __name__ == "__main__":
+    main()
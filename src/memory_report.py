@@ -0,0 +1,209 @@
+import sys
+import time
+import random
+import argparse
+from metrics import REGISTRY
+
+MEMORY_METRIC = 'rag_memory_bytes'
+
+# 要素数がこれを超えるコンテナは、sample を指定した場合に標本から推定する
+SAMPLE_THRESHOLD = 10000
+
+
+def deep_sizeof(obj, seen=None, sample=None):
+    """
+    オブジェクトが参照するものを含めたバイト数を算出
+
+    同じオブジェクトは1回だけ数える（seen を共有すれば構造をまたいだ重複も除ける）。
+    numpy配列・scipyの疎行列は nbytes を使う。
+
+    Args:
+        obj: 対象のオブジェクト
+        seen (set, optional): 計上済みのオブジェクトのid
+        sample (int, optional): 大きなコンテナを推定する際の標本数（未指定の場合は全件を数える）
+
+    Returns:
+        int: バイト数
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if hasattr(obj, 'indptr') and hasattr(obj, 'data'):
+        return int(obj.data.nbytes + obj.indices.nbytes + obj.indptr.nbytes)
+    if hasattr(obj, 'nbytes') and hasattr(obj, 'dtype'):
+        return sys.getsizeof(obj) if obj.base is not None else int(obj.nbytes) + sys.getsizeof(obj)
+    if hasattr(obj, 'memory_usage') and callable(obj.memory_usage) and not isinstance(obj, type):
+        return sum(obj.memory_usage().values())
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        items = list(obj.items())
+        children = [x for pair in items for x in pair]
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        children = list(obj)
+    else:
+        return size
+
+    if sample and len(children) > SAMPLE_THRESHOLD:
+        # 標本の平均から全体を推定（共有されたオブジェクトの重複は標本内でのみ除く）
+        picked = random.Random(0).sample(children, min(sample, len(children)))
+        total = sum(deep_sizeof(child, seen, sample) for child in picked)
+        return size + int(total * len(children) / len(picked))
+    return size + sum(deep_sizeof(child, seen, sample) for child in children)
+
+
+def index_memory_report(index, seen=None, sample=None):
+    """
+    TF-IDF検索システムが保持するメモリの内訳
+
+    Args:
+        index (TFIDFSearch): 検索システム
+        seen (set, optional): 計上済みのオブジェクトのid
+        sample (int, optional): 大きなコンテナを推定する際の標本数
+
+    Returns:
+        dict: 構成要素 → バイト数
+    """
+    seen = seen if seen is not None else set()
+    report = {}
+    matrix = index.tfidf_matrix
+    report['matrix.data'] = int(matrix.data.nbytes)
+    report['matrix.indices'] = int(matrix.indices.nbytes)
+    report['matrix.indptr'] = int(matrix.indptr.nbytes)
+    seen.update({id(matrix), id(matrix.data), id(matrix.indices), id(matrix.indptr)})
+    if getattr(matrix, 'row_scale', None) is not None:
+        # 8ビット量子化した行列の行ごとのスケール
+        report['matrix.row_scale'] = int(matrix.row_scale.nbytes)
+
+    vectorizer = index.vectorizer
+    if id(vectorizer) in seen:
+        # シャード間で共有するベクトライザーは最初のシャードでだけ数える
+        vectorizer = None
+    else:
+        seen.add(id(vectorizer))
+    report['vectorizer.vocabulary'] = deep_sizeof(getattr(vectorizer, 'vocabulary_', {}), seen, sample)
+    # max_features で切り捨てた語は stop_words_ に残り、語彙より大きくなることがある
+    report['vectorizer.stop_words'] = deep_sizeof(getattr(vectorizer, 'stop_words_', set()), seen, sample)
+    idf = getattr(getattr(vectorizer, '_tfidf', None), 'idf_', None) if vectorizer is not None else None
+    report['vectorizer.idf'] = int(idf.nbytes) if idf is not None else 0
+
+    metadata_index = getattr(index, 'metadata_index', None)
+    if metadata_index is not None:
+        report['metadata_index'] = metadata_index.nbytes
+
+    store = getattr(index, 'store', None)
+    if store is not None:
+        report.update(store.memory_usage())
+    else:
+        for name in ('documents', 'metadatas', 'ids'):
+            if hasattr(index, name):
+                report[name] = deep_sizeof(getattr(index, name), seen, sample)
+    return report
+
+
+def index_parts(index, prefix='index'):
+    """
+    検索システムを構成する TFIDFSearch を列挙
+
+    複数ドメインをまとめた検索システムはドメインごとに、シャードに分けた検索システムはシャードごとに分ける。
+
+    Args:
+        index: TFIDFSearch, ShardedTFIDFSearch または FederatedIndex
+        prefix (str): 名前の接頭辞
+
+    Returns:
+        list: (名前, TFIDFSearch) のリスト（例: 'index.fireworks.shard0'）
+    """
+    if hasattr(index, 'indexes'):
+        return [item for name, domain_index in index.indexes.items()
+                for item in index_parts(domain_index, f'{prefix}.{name}')]
+    if hasattr(index, 'shards'):
+        return [(f'{prefix}.shard{i}', shard) for i, shard in enumerate(index.shards)]
+    return [(prefix, index)]
+
+
+def rag_memory_report(rag_system, sample=None):
+    """
+    RAGシステム全体（公開中・解放待ちのインデックス、各キャッシュ）のメモリの内訳
+
+    Args:
+        rag_system (FireworksRAGSystem): RAGシステム
+        sample (int, optional): 大きなコンテナを推定する際の標本数
+
+    Returns:
+        dict: セクション → (構成要素 → バイト数)
+    """
+    seen = set()
+    manager = rag_system.index_manager
+    report = {}
+    for name, index in index_parts(manager.index):
+        report[name] = index_memory_report(index, seen, sample)
+
+    # 差し替え後も読み取り中のリクエストが参照している旧版
+    retired = manager.retired_indexes()
+    if retired:
+        report['retired_index'] = {}
+        for old in retired:
+            for _, index in index_parts(old):
+                for key, value in index_memory_report(index, seen, sample).items():
+                    report['retired_index'][key] = report['retired_index'].get(key, 0) + value
+
+    report['caches'] = {
+        f'unanswered_store.{name}': deep_sizeof(value, seen, sample) if value is not None else 0
+        for name, value in rag_system.unanswered_store.memory_parts().items()
+    }
+    return report
+
+
+def publish_memory_metrics(report, registry=REGISTRY):
+    """メモリの内訳をゲージとして公開"""
+    for section, components in report.items():
+        for component, value in components.items():
+            registry.set_gauge(MEMORY_METRIC, value, labels={'section': section, 'component': component},
+                               help_text='Bytes held by in-memory structures')
+
+
+def format_memory_report(report):
+    """
+    メモリの内訳を表に整形
+
+    Returns:
+        str: 表
+    """
+    lines = [f"{'section':<14} {'component':<30} {'MiB':>10} {'share':>7}"]
+    total = sum(sum(components.values()) for components in report.values()) or 1
+    for section, components in report.items():
+        for component, value in sorted(components.items(), key=lambda item: item[1], reverse=True):
+            lines.append(f"{section:<14} {component:<30} {value / 2**20:>10.2f} {value / total:>7.1%}")
+    lines.append(f"{'total':<14} {'':<30} {total / 2**20:>10.2f} {1:>7.0%}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TF-IDFインデックスとキャッシュのメモリ内訳を表示')
+    parser.add_argument('--collection', default='fireworks_information', help='インデックスを構築するコレクション')
+    parser.add_argument('--synthetic', type=int, help='コレクションの代わりに合成コーパス（チャンク数）で構築する')
+    parser.add_argument('--sample', type=int, help='大きなコンテナを標本数から推定する（例: 1000）')
+    args = parser.parse_args()
+
+    from tfidf_search import TFIDFSearch
+
+    start = time.perf_counter()
+    if args.synthetic:
+        from benchmark import generate_corpus, load_questions
+        documents, metadatas, ids = generate_corpus(args.synthetic, load_questions())
+        index = TFIDFSearch.from_documents(documents, metadatas, ids)
+        del documents, metadatas, ids
+    else:
+        from chroma_store import ChromaStore
+        index = TFIDFSearch(ChromaStore.get().get_collection(args.collection))
+    print(f"インデックスを構築しました（{len(index.ids):,}件, {time.perf_counter() - start:.1f}秒）\n")
+
+    print(format_memory_report({'index': index_memory_report(index, sample=args.sample)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from urllib.parse import urlparse
+import numpy as np
+from metrics import record_cache
+
+# 完全一致で絞り込む項目（値ごとの行番号の配列を事前に作る）
+CATEGORICAL_FIELDS = ('host', 'source', 'original_question')
+
+# 範囲で絞り込む項目（値でソートした配列を事前に作る）
+NUMERIC_FIELDS = ('timestamp', 'modified_at', 'chunk_index')
+
+# 絞り込みの構築に使うメタデータのキー（host は source から求める）
+METADATA_KEYS = ('source', 'original_question', 'timestamp', 'modified_at', 'chunk_index')
+
+# 同じ条件のマスクを再利用する件数
+MASK_CACHE_SIZE = 64
+
+# 使用できる演算子（ChromaDBの where と同じ表記）
+EQUALITY_OPERATORS = ('$eq', '$in')
+RANGE_OPERATORS = ('$gt', '$gte', '$lt', '$lte')
+
+
+def _to_epoch(value):
+    """ISO形式の日時または数値をエポック秒に変換（変換できない場合はNaN）"""
+    if value is None or value == '':
+        return float('nan')
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return float('nan')
+
+
+def _to_number(value):
+    """数値に変換（変換できない場合はNaN）"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+def _is_scalar(value):
+    # ChromaDBの where と同じく、比較する値は文字列・数値・真偽値のみ
+    return isinstance(value, (str, int, float, bool))
+
+
+def _numeric_value(field, value):
+    # チャンク番号以外の範囲項目は日時として扱う
+    return _to_number(value) if field == 'chunk_index' else _to_epoch(value)
+
+
+class _Postings:
+    """値ごとの行番号（行番号の昇順）をまとめて保持"""
+
+    def __init__(self, values):
+        table = {}
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            codes[i] = table.setdefault(value or '', len(table))
+        self.table = table
+        order = np.argsort(codes, kind='stable')
+        self.rows = order.astype(np.int32)
+        self.offsets = np.zeros(len(table) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=len(table)), out=self.offsets[1:])
+
+    def rows_for(self, value):
+        code = self.table.get(value)
+        if code is None:
+            return self.rows[:0]
+        return self.rows[self.offsets[code]:self.offsets[code + 1]]
+
+    @property
+    def nbytes(self):
+        return int(self.rows.nbytes + self.offsets.nbytes)
+
+
+class _SortedValues:
+    """値でソートした配列と行番号（欠損値は末尾）"""
+
+    def __init__(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        order = np.argsort(values, kind='stable')
+        self.values = values[order]
+        self.rows = order.astype(np.int32)
+        # NaN はソートで末尾に集まるため、範囲検索の対象から外す
+        self.valid = int(np.count_nonzero(~np.isnan(self.values)))
+
+    def rows_between(self, low=None, high=None, low_inclusive=True, high_inclusive=True):
+        values = self.values[:self.valid]
+        start = 0 if low is None else np.searchsorted(values, low, side='left' if low_inclusive else 'right')
+        end = self.valid if high is None else np.searchsorted(values, high, side='right' if high_inclusive else 'left')
+        return self.rows[start:max(start, end)]
+
+    @property
+    def nbytes(self):
+        return int(self.values.nbytes + self.rows.nbytes)
+
+
+class MetadataIndex:
+    """
+    メタデータによる事前絞り込み用のインデックス
+
+    ホスト・ソース・元の質問は値ごとの行番号の配列、日時・チャンク番号は値でソートした配列として
+    構築時に作っておき、検索時は条件に合う行だけを真にしたマスクを作る。
+    条件の表記はChromaDBの where と同じ（例: {"host": "example.jp", "timestamp": {"$gte": "2025-06-01"}}）。
+    """
+
+    def __init__(self, metadatas):
+        """
+        Args:
+            metadatas (list): メタデータのリスト（METADATA_KEYS 以外のキーは使わない）
+        """
+        self.size = len(metadatas)
+        sources = [(m or {}).get('source') or '' for m in metadatas]
+        self._categorical = {
+            'host': _Postings([urlparse(s).netloc for s in sources]),
+            'source': _Postings(sources),
+            'original_question': _Postings([(m or {}).get('original_question') for m in metadatas])
+        }
+        self._numeric = {
+            field: _SortedValues([_numeric_value(field, (m or {}).get(field)) for m in metadatas])
+            for field in NUMERIC_FIELDS
+        }
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        """事前計算した配列の合計バイト数"""
+        return sum(p.nbytes for p in self._categorical.values()) + sum(s.nbytes for s in self._numeric.values())
+
+    def _field_rows(self, field, condition):
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+
+        if field in self._categorical:
+            postings = self._categorical[field]
+            unknown = set(condition) - set(EQUALITY_OPERATORS)
+            if unknown:
+                raise ValueError(f"{field} に使用できない演算子です: {', '.join(sorted(unknown))}")
+            values = condition.get('$in', [])
+            if not isinstance(values, list) or not all(_is_scalar(v) for v in values):
+                raise ValueError(f"{field} の $in は文字列・数値のリストで指定してください")
+            values = list(values)
+            if '$eq' in condition:
+                if not _is_scalar(condition['$eq']):
+                    raise ValueError(f"{field} の値は文字列・数値で指定してください（複数の値は $in を使用）")
+                values.append(condition['$eq'])
+            if len(values) == 1:
+                return postings.rows_for(values[0])
+            return np.concatenate([postings.rows_for(v) for v in values]) if values else postings.rows[:0]
+
+        if field in self._numeric:
+            unknown = set(condition) - set(RANGE_OPERATORS) - {'$eq'}
+            if unknown:
+                raise ValueError(f"{field} に使用できない演算子です: {', '.join(sorted(unknown))}")
+            if not all(_is_scalar(value) for value in condition.values()):
+                raise ValueError(f"{field} の値は文字列・数値で指定してください")
+            convert = lambda value: _numeric_value(field, value)
+            if '$eq' in condition:
+                value = convert(condition['$eq'])
+                return self._numeric[field].rows_between(value, value)
+            low = high = None
+            low_inclusive = high_inclusive = True
+            if '$gt' in condition:
+                low, low_inclusive = convert(condition['$gt']), False
+            if '$gte' in condition:
+                low, low_inclusive = convert(condition['$gte']), True
+            if '$lt' in condition:
+                high, high_inclusive = convert(condition['$lt']), False
+            if '$lte' in condition:
+                high, high_inclusive = convert(condition['$lte']), True
+            return self._numeric[field].rows_between(low, high, low_inclusive, high_inclusive)
+
+        fields = ', '.join(CATEGORICAL_FIELDS + NUMERIC_FIELDS)
+        raise ValueError(f"絞り込みに使用できない項目です: {field}（使用できる項目: {fields}）")
+
+    def mask(self, where):
+        """
+        条件に合う行を真にしたマスクを作成（条件はすべて AND で結合）
+
+        Args:
+            where (dict): 項目 → 値 または {演算子: 値}
+
+        Returns:
+            numpy.ndarray: 行数分の真偽値の配列
+        
+        Raises:
+            ValueError: 条件の形式が不正な場合
+        """
+        if not isinstance(where, dict):
+            raise ValueError("絞り込みの条件は辞書で指定してください")
+        key = _freeze(where)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+        record_cache('metadata_mask', cached is not None)
+        if cached is not None:
+            return cached
+
+        mask = self._build_mask(where)
+        with self._lock:
+            self._cache[key] = mask
+            if len(self._cache) > MASK_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return mask
+
+    def _build_mask(self, where):
+        mask = None
+        for field, condition in where.items():
+            field_mask = np.zeros(self.size, dtype=bool)
+            field_mask[self._field_rows(field, condition)] = True
+            mask = field_mask if mask is None else mask & field_mask
+        if mask is None:
+            mask = np.ones(self.size, dtype=bool)
+        mask.flags.writeable = False
+        return mask
+
+
+def validate_where(where):
+    """
+    絞り込みの条件の形式を検証（インデックスの構成によらず使える）
+
+    Args:
+        where (dict): MetadataIndex.mask() と同じ条件
+
+    Raises:
+        ValueError: 条件の形式が不正な場合
+    """
+    if not isinstance(where, dict):
+        raise ValueError("絞り込みの条件は辞書で指定してください")
+    # キャッシュのヒット率に数えないよう、キャッシュを通さずに検証する
+    MetadataIndex([])._build_mask(where)
+
+
+def _freeze(value):
+    # 条件の辞書をマスクのキャッシュのキーにする
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
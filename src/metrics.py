@@ -0,0 +1,216 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# レイテンシ用ヒストグラムの既定のバケット境界（秒）
+DEFAULT_LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{escaped}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    プロセス内のメトリクスを保持し、Prometheusのテキスト形式で出力する
+
+    メトリクスは (名前, ラベル) ごとに集計する。ラベルは辞書で指定する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._types = {}
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def _register(self, name, metric_type, help_text):
+        if name not in self._types:
+            self._types[name] = metric_type
+            self._help[name] = help_text
+
+    def inc(self, name, value=1, labels=None, help_text=''):
+        """カウンターを加算"""
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._register(name, 'counter', help_text)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, labels=None, help_text=''):
+        """ゲージの値を設定"""
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._register(name, 'gauge', help_text)
+            self._gauges[key] = value
+
+    def add_gauge(self, name, delta, labels=None, help_text=''):
+        """ゲージの値を増減"""
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._register(name, 'gauge', help_text)
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, name, value, labels=None, buckets=DEFAULT_LATENCY_BUCKETS, help_text=''):
+        """ヒストグラムに観測値を追加"""
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._register(name, 'histogram', help_text)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def get_counter(self, name, labels=None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def get_gauge(self, name, labels=None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            return self._gauges.get(key, 0)
+
+    def histogram_snapshot(self, name, labels=None):
+        """
+        ヒストグラムの集計値を取得
+
+        Returns:
+            dict: count, sum, buckets（境界 → 累積件数）。未観測の場合はNone
+        """
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                return None
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(list(histogram.buckets) + [float('inf')], histogram.counts):
+                cumulative += count
+                buckets[bound] = cumulative
+            return {'count': histogram.count, 'sum': histogram.total, 'buckets': buckets}
+
+    def render(self):
+        """
+        Prometheusのテキスト形式で出力
+
+        Returns:
+            str: エクスポジション形式のテキスト
+        """
+        lines = []
+        with self._lock:
+            series = {}
+            for (name, labels), value in self._counters.items():
+                series.setdefault(name, []).append((labels, value))
+            for (name, labels), value in self._gauges.items():
+                series.setdefault(name, []).append((labels, value))
+            for (name, labels), histogram in self._histograms.items():
+                series.setdefault(name, []).append((labels, histogram))
+
+            for name in sorted(series):
+                if self._help.get(name):
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} {self._types[name]}')
+                for labels, value in sorted(series[name], key=lambda item: item[0]):
+                    if isinstance(value, _Histogram):
+                        cumulative = 0
+                        bounds = list(value.buckets) + [float('inf')]
+                        for bound, count in zip(bounds, value.counts):
+                            cumulative += count
+                            bucket_labels = labels + (('le', _format_value(bound)),)
+                            lines.append(f'{name}_bucket{_format_labels(bucket_labels)} {cumulative}')
+                        lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(value.total)}')
+                        lines.append(f'{name}_count{_format_labels(labels)} {value.count}')
+                    else:
+                        lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# プロセス全体で共有するレジストリ
+REGISTRY = MetricsRegistry()
+
+STAGE_METRIC = 'rag_stage_duration_seconds'
+CACHE_METRIC = 'rag_cache_requests_total'
+CACHE_RATIO_METRIC = 'rag_cache_hit_ratio'
+IN_FLIGHT_METRIC = 'rag_in_flight_requests'
+REQUEST_METRIC = 'rag_http_request_duration_seconds'
+
+
+@contextmanager
+def timed(stage, registry=REGISTRY):
+    """
+    処理ステージの所要時間をヒストグラムに記録
+
+    Args:
+        stage (str): ステージ名（例: 'keyword_extraction', 'tfidf_transform'）
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(STAGE_METRIC, time.perf_counter() - start, {'stage': stage},
+                         help_text='Duration of each RAG pipeline stage')
+
+
+def record_cache(cache, hit, registry=REGISTRY):
+    """
+    キャッシュのヒット／ミスを記録し、ヒット率を更新
+
+    Args:
+        cache (str): キャッシュ名
+        hit (bool): ヒットした場合はTrue
+    """
+    registry.inc(CACHE_METRIC, labels={'cache': cache, 'result': 'hit' if hit else 'miss'},
+                 help_text='Cache lookups by result')
+    hits = registry.get_counter(CACHE_METRIC, {'cache': cache, 'result': 'hit'})
+    misses = registry.get_counter(CACHE_METRIC, {'cache': cache, 'result': 'miss'})
+    registry.set_gauge(CACHE_RATIO_METRIC, hits / (hits + misses), {'cache': cache},
+                       help_text='Cache hit ratio since process start')
+
+
+@contextmanager
+def track_request(endpoint, registry=REGISTRY):
+    """
+    エンドポイントの処理中リクエスト数と所要時間を記録
+
+    Args:
+        endpoint (str): エンドポイント名
+    """
+    registry.add_gauge(IN_FLIGHT_METRIC, 1, {'endpoint': endpoint},
+                       help_text='Requests currently being processed')
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.add_gauge(IN_FLIGHT_METRIC, -1, {'endpoint': endpoint})
+        registry.observe(REQUEST_METRIC, time.perf_counter() - start, {'endpoint': endpoint},
+                         help_text='HTTP request latency by endpoint')
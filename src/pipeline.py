@@ -0,0 +1,120 @@
+import time
+import queue
+import threading
+from urllib.parse import urlparse
+
+# 上流のステージが終了したことを下流に伝える番兵
+_DONE = object()
+
+
+class HostRateLimiter:
+    """
+    ホスト単位のアクセス間隔制御
+
+    同じホストへのリクエストは min_interval 秒以上の間隔を空け、異なるホストへは並行してアクセスする。
+    """
+
+    def __init__(self, min_interval=2.0):
+        self.min_interval = min_interval
+        self._next_allowed = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        """
+        URLのホストにアクセスしてよい時刻まで待機
+
+        Args:
+            url (str): アクセスするURL
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_allowed.get(host, now))
+            self._next_allowed[host] = slot + self.min_interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Stage:
+    def __init__(self, name, func, workers=1):
+        """
+        Args:
+            name (str): ステージ名
+            func (callable): 1件の入力を受け取り、下流に渡す出力のイテラブル（またはNone）を返す関数
+            workers (int): ワーカースレッド数
+        """
+        self.name = name
+        self.func = func
+        self.workers = workers
+
+
+class Pipeline:
+    """
+    有界キューでつないだステージを、それぞれのワーカー数で並行に実行するパイプライン
+    """
+
+    def __init__(self, stages, queue_size=32):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stats = {}
+
+    def _worker(self, stage, inbox, outbox, stats, lock):
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                return
+            try:
+                outputs = stage.func(item)
+                with lock:
+                    stats['processed'] += 1
+                if outputs is not None and outbox is not None:
+                    for output in outputs:
+                        outbox.put(output)
+            except Exception as e:
+                with lock:
+                    stats['errors'] += 1
+                print(f"ステージ {stage.name} の処理中にエラーが発生しました: {str(e)}")
+
+    def run(self, items):
+        """
+        入力をパイプラインに流し、すべてのステージが終わるまで待機
+
+        Args:
+            items (iterable): 先頭ステージへの入力
+
+        Returns:
+            dict: ステージ名 → 処理件数・エラー件数
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        lock = threading.Lock()
+        self.stats = {stage.name: {'processed': 0, 'errors': 0} for stage in self.stages}
+
+        threads = []
+        for i, stage in enumerate(self.stages):
+            outbox = queues[i + 1] if i + 1 < len(queues) else None
+            workers = [
+                threading.Thread(
+                    target=self._worker,
+                    args=(stage, queues[i], outbox, self.stats[stage.name], lock),
+                    name=f'{stage.name}-{n}',
+                    daemon=True
+                )
+                for n in range(stage.workers)
+            ]
+            for worker in workers:
+                worker.start()
+            threads.append(workers)
+
+        # 入力の投入（キューが満杯の間は待機）
+        for item in items:
+            queues[0].put(item)
+
+        # 上流から順に終了させる
+        for i, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                queues[i].put(_DONE)
+            for worker in threads[i]:
+                worker.join()
+
+        return self.stats
@@ -0,0 +1,254 @@
+import os
+import sys
+import math
+import time
+import random
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from metrics import REGISTRY
+
+# 折りたたみスタック（flamegraph.pl / speedscope 形式）の保存先
+DEFAULT_PROFILE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'profiles')
+
+# リクエスト単位の採取間隔（秒）。これより短いリクエストでは採取数が0になることがある
+DEFAULT_INTERVAL = 0.001
+
+# プロセス全体のライブプロファイルの既定の採取間隔（秒）
+DEFAULT_LIVE_INTERVAL = 0.005
+
+# 採取間隔の下限（秒）。これより短いと採取ループがGILを占有する
+MIN_INTERVAL = 0.001
+
+# 1回のライブプロファイルで採取できる最大秒数
+MAX_PROFILE_SECONDS = 60
+
+PROFILED_METRIC = 'rag_profiled_requests_total'
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def collapse_stack(frame):
+    """
+    フレームを呼び出し元から順に ';' で連結した折りたたみ形式に変換
+
+    Args:
+        frame: 最も内側のフレーム
+
+    Returns:
+        str: 折りたたみ形式のスタック
+    """
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+def format_collapsed(stacks):
+    """
+    スタックごとの採取数を折りたたみ形式のテキストに整形
+
+    Args:
+        stacks (Counter): スタック → 採取数
+
+    Returns:
+        str: 1行に「スタック 採取数」を並べたテキスト
+    """
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def write_collapsed(stacks, name, output_dir=DEFAULT_PROFILE_DIR):
+    """
+    折りたたみ形式のスタックをファイルに保存
+
+    Returns:
+        str: 保存したファイルのパス
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.folded")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(format_collapsed(stacks))
+    return path
+
+
+class StackSampler:
+    """
+    登録したスレッドのスタックを一定間隔で採取するサンプリングプロファイラ
+
+    採取は専用のスレッドで sys._current_frames() を読むだけなので、対象のスレッドには
+    トレース関数を設定しない。登録中のスレッドがない間は採取スレッドは待機する。
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = max(interval, MIN_INTERVAL)
+        self._cond = threading.Condition()
+        self._targets = {}
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._targets:
+                    self._cond.wait()
+                targets = dict(self._targets)
+            frames = sys._current_frames()
+            sampled = [(thread_id, stacks, collapse_stack(frames[thread_id]))
+                       for thread_id, stacks in targets.items() if thread_id in frames]
+            del frames
+            # stop() が返した後の集計を書き換えないよう、登録中の集計にだけロック内で加算する
+            with self._cond:
+                for thread_id, stacks, stack in sampled:
+                    if self._targets.get(thread_id) is stacks:
+                        stacks[stack] += 1
+            time.sleep(self.interval)
+
+    def start(self, thread_id):
+        """
+        スレッドの採取を開始
+
+        Args:
+            thread_id (int): threading.get_ident() の値
+        """
+        with self._cond:
+            self._targets[thread_id] = Counter()
+            self._ensure_started()
+            self._cond.notify_all()
+
+    def stop(self, thread_id):
+        """
+        スレッドの採取を終了
+
+        Returns:
+            Counter: スタック → 採取数
+        """
+        with self._cond:
+            return self._targets.pop(thread_id, Counter())
+
+
+class RequestProfiler:
+    """
+    一部のリクエストだけをサンプリングしてプロファイルする
+
+    sample_rate が0の場合は何もせず、オーバーヘッドは乱数1回分もかからない。
+    """
+
+    def __init__(self, sample_rate=0.0, output_dir=DEFAULT_PROFILE_DIR, interval=DEFAULT_INTERVAL):
+        """
+        Args:
+            sample_rate (float): プロファイルするリクエストの割合（0〜1）
+            output_dir (str): 折りたたみスタックの保存先
+            interval (float): スタックを採取する間隔（秒。MIN_INTERVAL 未満は MIN_INTERVAL にする）
+        """
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.sampler = StackSampler(interval)
+        self._live_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """
+        環境変数から設定を読み込んで生成
+
+        PROFILE_SAMPLE_RATE, PROFILE_DIR, PROFILE_INTERVAL を参照する。
+        """
+        return cls(
+            sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', '0')),
+            output_dir=os.getenv('PROFILE_DIR', DEFAULT_PROFILE_DIR),
+            interval=float(os.getenv('PROFILE_INTERVAL', str(DEFAULT_INTERVAL)))
+        )
+
+    def should_sample(self):
+        """このリクエストをプロファイルするか"""
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def begin(self):
+        """現在のスレッドの採取を開始（should_sample() が真の場合のみ呼ぶ）"""
+        self.sampler.start(threading.get_ident())
+
+    def end(self, name):
+        """
+        現在のスレッドの採取を終了して保存
+
+        Args:
+            name (str): ファイル名の接頭辞（エンドポイント名など）
+
+        Returns:
+            str: 保存したファイルのパス（スタックを採取できなかった場合はNone）
+        """
+        stacks = self.sampler.stop(threading.get_ident())
+        REGISTRY.inc(PROFILED_METRIC, labels={'endpoint': name},
+                     help_text='Requests sampled by the profiler')
+        if not stacks:
+            return None
+        try:
+            return write_collapsed(stacks, name, self.output_dir)
+        except Exception as e:
+            print(f"プロファイルの保存中にエラーが発生しました: {str(e)}")
+            return None
+
+    @contextmanager
+    def profile(self, name):
+        """
+        サンプリング対象の場合だけブロック内をプロファイル
+
+        Args:
+            name (str): ファイル名の接頭辞
+        """
+        if not self.should_sample():
+            yield
+            return
+        self.begin()
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def profile_process(self, seconds, interval=None):
+        """
+        プロセス内のすべてのスレッドを指定秒数だけプロファイル
+
+        呼び出したスレッドで採取するため、指定秒数の間ブロックする。同時に実行できるのは1つまで。
+
+        Args:
+            seconds (float): 採取する秒数（MAX_PROFILE_SECONDS まで）
+            interval (float, optional): 採取間隔（秒。未指定の場合は DEFAULT_LIVE_INTERVAL）
+
+        Returns:
+            tuple: (スタック → 採取数, 保存したファイルのパス)。実行中の場合は None
+
+        Raises:
+            ValueError: 秒数が正の有限な値でない場合、採取間隔が MIN_INTERVAL 未満の場合
+        """
+        if not (math.isfinite(seconds) and seconds > 0):
+            raise ValueError(f"seconds は正の数で指定してください: {seconds}")
+        if interval is not None and not (math.isfinite(interval) and interval >= MIN_INTERVAL):
+            raise ValueError(f"interval は{MIN_INTERVAL}秒以上で指定してください: {interval}")
+        if not self._live_lock.acquire(blocking=False):
+            return None
+        try:
+            interval = interval or DEFAULT_LIVE_INTERVAL
+            own_ids = {threading.get_ident()}
+            if self.sampler._thread is not None:
+                own_ids.add(self.sampler._thread.ident)
+
+            stacks = Counter()
+            deadline = time.monotonic() + min(seconds, MAX_PROFILE_SECONDS)
+            while time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id not in own_ids:
+                        stacks[collapse_stack(frame)] += 1
+                time.sleep(interval)
+            path = write_collapsed(stacks, 'live', self.output_dir) if stacks else None
+            return stacks, path
+        finally:
+            self._live_lock.release()
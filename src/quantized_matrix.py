@@ -0,0 +1,229 @@
+import time
+import argparse
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# 行列の保持形式（float64 は TfidfVectorizer の出力をそのまま使う）
+MATRIX_DTYPES = ('float64', 'float32', 'uint8')
+
+# 8ビット量子化の最大値
+QUANTIZED_MAX = 255
+
+# 行インデックスを uint16 で持つための行ブロックの大きさ
+BLOCK_ROWS = 65536
+
+
+class ScoringMatrix:
+    """
+    TF-IDF行列を列方向（語 → ドキュメント）の転置インデックスとして保持し、直接スコアを計算する
+
+    float32 は重みをそのまま単精度で、uint8 は行ごとの最大値を255とする8ビット値と
+    行ごとのスケールで保持する。行は BLOCK_ROWS 行ずつのブロックに分け、ブロック内の
+    行番号を uint16 で持つため、1要素あたりの大きさは float64 の CSR（値8 + 行番号4バイト）に対して
+    float32 で6バイト（約0.50倍）、uint8 で3バイト（約0.25倍）になる。語数 × ブロック数の
+    indptr と uint8 の行スケールが加わるため、実際の比率はこれより少し大きい。
+    スコアリングではクエリに含まれる語の列だけを読むため、クエリの語数に比例した計算量で済み、
+    行列全体を倍精度に戻すことはない。
+    TfidfVectorizer の既定（norm='l2'）で正規化されている前提で、内積がそのままコサイン類似度になる。
+    """
+
+    def __init__(self, data, indices, indptr, shape, row_scale=None, block_rows=BLOCK_ROWS):
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+        self.shape = shape
+        self.row_scale = row_scale
+        self.block_rows = block_rows
+
+    @classmethod
+    def from_csr(cls, matrix, dtype='float32', block_rows=BLOCK_ROWS):
+        """
+        CSR形式のTF-IDF行列から生成
+
+        Args:
+            matrix: scipy の疎行列（ドキュメント × 語）
+            dtype (str): 'float32' または 'uint8'
+            block_rows (int): 行ブロックの大きさ（BLOCK_ROWS 以下）
+
+        Returns:
+            ScoringMatrix: スコアリング用の行列
+        """
+        if dtype not in ('float32', 'uint8'):
+            raise ValueError(f"未対応の保持形式です: {dtype}")
+        if not 0 < block_rows <= BLOCK_ROWS:
+            raise ValueError(f"block_rows は1以上{BLOCK_ROWS}以下で指定してください: {block_rows}")
+        matrix = csr_matrix(matrix)
+        n_rows, n_cols = matrix.shape
+        row_scale = None
+        if dtype == 'float32':
+            data = matrix.data.astype(np.float32, copy=False)
+        else:
+            # 行ごとの最大値で割って0〜255に丸める
+            row_max = np.asarray(matrix.max(axis=1).todense()).ravel().astype(np.float32)
+            row_scale = row_max / QUANTIZED_MAX
+            rows = np.repeat(np.arange(n_rows), np.diff(matrix.indptr))
+            safe_scale = np.where(row_scale > 0, row_scale, 1.0)[rows]
+            data = np.clip(np.rint(matrix.data / safe_scale), 0, QUANTIZED_MAX).astype(np.uint8)
+            del rows, safe_scale
+        converted = csr_matrix((data, matrix.indices, matrix.indptr), shape=matrix.shape)
+        del data
+
+        # ブロックごとに列方向へ並べ替え、(ブロック, 語) の順に連結する
+        # 一度に転置するのは1ブロック分だけなので、行列全体の複製は作らない
+        blocks_data, blocks_indices = [], []
+        indptr = np.zeros(max(1, -(-n_rows // block_rows)) * n_cols + 1, dtype=np.int64)
+        offset = 0
+        for block, start in enumerate(range(0, max(n_rows, 1), block_rows)):
+            transposed = converted[start:start + block_rows].tocsc()
+            blocks_data.append(transposed.data)
+            blocks_indices.append(transposed.indices.astype(np.uint16))
+            indptr[block * n_cols + 1:(block + 1) * n_cols + 1] = transposed.indptr[1:] + offset
+            offset += transposed.nnz
+            del transposed
+        return cls(
+            np.concatenate(blocks_data),
+            np.concatenate(blocks_indices),
+            indptr,
+            matrix.shape,
+            row_scale,
+            block_rows
+        )
+
+    @property
+    def nnz(self):
+        return int(self.indptr[-1])
+
+    @property
+    def nbytes(self):
+        total = self.data.nbytes + self.indices.nbytes + self.indptr.nbytes
+        if self.row_scale is not None:
+            total += self.row_scale.nbytes
+        return int(total)
+
+    def _blocks(self, term):
+        """語の列をブロックごとに (先頭行, 開始位置, 終了位置) で返す"""
+        n_cols = self.shape[1]
+        for position in range(term, len(self.indptr) - 1, n_cols):
+            start, end = self.indptr[position], self.indptr[position + 1]
+            if start != end:
+                yield position // n_cols * self.block_rows, start, end
+
+    def column_sums(self):
+        """
+        語ごとの重みの合計（uint8 は行スケールを戻した値）
+
+        Returns:
+            numpy.ndarray: 語ごとの合計
+        """
+        n_cols = self.shape[1]
+        positions = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+        values = self.data.astype(np.float32)
+        if self.row_scale is not None:
+            rows = positions // n_cols * self.block_rows + self.indices
+            values *= self.row_scale[rows]
+        return np.bincount(positions % n_cols, weights=values, minlength=n_cols)
+
+    def score(self, query_vector):
+        """
+        クエリベクトルとの類似度を計算
+
+        Args:
+            query_vector: vectorizer.transform() の結果（1 × 語）
+
+        Returns:
+            numpy.ndarray: ドキュメントごとの類似度（float32）
+        """
+        query_vector = csr_matrix(query_vector)
+        scores = np.zeros(self.shape[0], dtype=np.float32)
+        for term, weight in zip(query_vector.indices, query_vector.data):
+            weight = np.float32(weight)
+            for first_row, start, end in self._blocks(term):
+                # 1つの列の中で同じ行は重複しないため、インデックス代入で加算できる
+                block = scores[first_row:first_row + self.block_rows]
+                block[self.indices[start:end]] += self.data[start:end] * weight
+        if self.row_scale is not None:
+            scores *= self.row_scale
+        return scores
+
+
+def recall_report(index, queries, k=10, dtypes=('float32', 'uint8')):
+    """
+    保持形式ごとのメモリと、float64 の上位k件に対する再現率を比較
+
+    Args:
+        index (TFIDFSearch): float64 で構築した検索システム
+        queries (list): 検索クエリ
+        k (int): 比較する上位件数
+        dtypes (tuple): 比較する保持形式
+
+    Returns:
+        list: 保持形式ごとの結果（bytes, recall, max_score_error, mean_ms）
+    """
+    reference = index.tfidf_matrix
+    vectors = [index.vectorizer.transform([q]) for q in queries]
+
+    def top_k(scores):
+        positive = np.flatnonzero(scores > 0)
+        if positive.size > k:
+            positive = positive[np.argpartition(-scores[positive], k)[:k]]
+        return set(positive.tolist())
+
+    start = time.perf_counter()
+    baseline_scores = [np.asarray((reference @ v.T).todense()).ravel() for v in vectors]
+    baseline_ms = (time.perf_counter() - start) * 1000 / max(1, len(vectors))
+    baseline_top = [top_k(s) for s in baseline_scores]
+
+    rows = [{
+        'dtype': 'float64',
+        'bytes': int(reference.data.nbytes + reference.indices.nbytes + reference.indptr.nbytes),
+        'recall': 1.0,
+        'max_score_error': 0.0,
+        'mean_ms': baseline_ms
+    }]
+    for dtype in dtypes:
+        matrix = ScoringMatrix.from_csr(reference, dtype)
+        start = time.perf_counter()
+        scores = [matrix.score(v) for v in vectors]
+        mean_ms = (time.perf_counter() - start) * 1000 / max(1, len(vectors))
+
+        found = relevant = 0
+        max_error = 0.0
+        for expected, baseline, actual in zip(baseline_top, baseline_scores, scores):
+            relevant += len(expected)
+            found += len(expected & top_k(actual))
+            if baseline.size:
+                max_error = max(max_error, float(np.abs(baseline - actual).max()))
+        rows.append({
+            'dtype': dtype,
+            'bytes': matrix.nbytes,
+            'recall': found / relevant if relevant else 1.0,
+            'max_score_error': max_error,
+            'mean_ms': mean_ms
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TF-IDF行列の保持形式ごとのメモリと再現率を比較')
+    parser.add_argument('--synthetic', type=int, default=100000, help='合成コーパスのチャンク数（0でコレクションを使用）')
+    parser.add_argument('--k', type=int, default=10, help='比較する上位件数')
+    args = parser.parse_args()
+
+    from benchmark import generate_corpus, load_questions, build_query_set
+    from tfidf_search import TFIDFSearch
+
+    questions = load_questions()
+    if args.synthetic:
+        index = TFIDFSearch.from_documents(*generate_corpus(args.synthetic, questions), matrix_dtype='float64')
+    else:
+        index = TFIDFSearch(matrix_dtype='float64')
+    rows = recall_report(index, build_query_set(questions), args.k)
+
+    print(f"{'dtype':<8} {'MiB':>9} {'ratio':>6} {'recall@' + str(args.k):>10} {'max_err':>9} {'mean_ms':>8}")
+    for row in rows:
+        print(f"{row['dtype']:<8} {row['bytes'] / 2**20:>9.2f} {row['bytes'] / rows[0]['bytes']:>6.2f} "
+              f"{row['recall']:>10.4f} {row['max_score_error']:>9.5f} {row['mean_ms']:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
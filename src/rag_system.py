@@ -1,54 +1,78 @@
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
-from tfidf_search import TFIDFSearch
-import chromadb
-import json
-from datetime import datetime
+from llm_provider import create_llm_provider
+from llm_resilience import ResilientLLM
+from sharded_search import create_search_index
+from index_snapshot import IndexSnapshotManager
+from domain_registry import DomainRegistry
+from unanswered_store import UnansweredQuestionStore
+from context_packer import ContextPacker
+from metrics import timed
+from chroma_store import ChromaStore
 
 # 環境変数の読み込み
 load_dotenv()
 
 class FireworksRAGSystem:
-    def __init__(self):
-        # Google APIキーの設定
-        api_key = os.getenv('GOOGLE_API_KEY')
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEYが設定されていません。.envファイルを確認してください。")
-        
-        # Gemini APIの初期化
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-pro')
+    def __init__(self, llm_provider=None, store=None, index_builder=None, domains=None):
+        """
+        Args:
+            llm_provider (LLMProvider, optional): LLMプロバイダー（未指定の場合は環境変数 LLM_PROVIDER に従う）
+            store (ChromaStore, optional): ChromaDBのストア（未指定の場合はプロセス共有のストア）
+            index_builder (callable, optional): 検索インデックスを構築する関数（ベンチマーク用の差し替え）
+            domains (DomainRegistry, optional): 複数ドメインを検索する場合の登録簿
+                （未指定の場合は環境変数 DOMAINS_CONFIG に従い、未設定なら花火情報のみ）
+        """
+        # LLMプロバイダーの初期化（未指定の場合は環境変数 LLM_PROVIDER に従う）
+        provider = llm_provider if llm_provider else create_llm_provider()
         
-        # データベースの保存ディレクトリを指定
-        self.DB_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'fireworks_db')
+        # 締め切り・ヘッジリクエスト・サーキットブレーカーでLLM呼び出しを保護
+        # （失敗時は各メソッドのローカルなフォールバックに切り替わる）
+        self.model = ResilientLLM(provider, hedge=os.getenv('LLM_HEDGE') == '1')
         
-        # ChromaDBの初期化
-        self.client = chromadb.PersistentClient(path=self.DB_DIR)
+        # ChromaDBの初期化（プロセス全体で共有するクライアントを使用）
+        self.store = store if store else ChromaStore.get()
+        self.DB_DIR = self.store.path
         
         # 既存のコレクションを取得または作成
-        try:
-            self.collection = self.client.get_collection(name="fireworks_information")
-        except:
-            self.collection = self.client.create_collection(name="fireworks_information")
+        self.collection = self.store.get_collection("fireworks_information", create=True)
         
         # 未回答の質問を保存するコレクションを取得または作成
-        try:
-            self.unanswered_collection = self.client.get_collection(name="unanswered_questions")
-        except:
-            self.unanswered_collection = self.client.create_collection(name="unanswered_questions")
+        self.unanswered_collection = self.store.get_collection("unanswered_questions", create=True)
         
-        # TF-IDF検索システムの初期化
-        self.search_system = TFIDFSearch()
+        # 未回答の質問はクラスタ単位で保存し、重複した質問はヒット数として集約
+        self.unanswered_store = UnansweredQuestionStore(self.unanswered_collection)
+        
+        # TF-IDF検索システムの初期化（スナップショット単位で無停止に差し替え可能）
+        self.domains = domains if domains else DomainRegistry.from_env()
+        if index_builder:
+            self.index_manager = IndexSnapshotManager(index_builder)
+        elif self.domains:
+            # ドメインごとのインデックスをまとめ、クエリごとに振り分けて検索
+            self.index_manager = IndexSnapshotManager(self.domains.build_index)
+        else:
+            self.index_manager = IndexSnapshotManager(create_search_index, collection=self.collection)
+        
+        # 参考情報の圧縮（トークン予算内にクエリ関連の文だけを詰める）
+        self.context_packer = ContextPacker()
         
         # テスト応答の生成
         try:
-            response = self.model.generate_content("こんにちは")
-            print("Gemini APIの初期化に成功しました")
+            response = self.model.generate_content("こんにちは", stage='startup')
+            print(f"LLMプロバイダー({self.model.name})の初期化に成功しました")
         except Exception as e:
-            print(f"Gemini APIの初期化中にエラーが発生しました: {str(e)}")
+            print(f"LLMプロバイダー({self.model.name})の初期化中にエラーが発生しました: {str(e)}")
             raise
     
+    def close(self):
+        """LLM呼び出しのスレッドプールを停止"""
+        self.model.close()
+    
+    @property
+    def search_system(self):
+        """公開中のスナップショットのTF-IDF検索システム"""
+        return self.index_manager.index
+    
     def extract_keywords(self, query):
         """
         質問文から重要なキーワードを抽出
@@ -75,20 +99,23 @@ class FireworksRAGSystem:
             出力: 花火,種類,特徴
             """
             
-            response = self.model.generate_content(prompt)
+            with timed('keyword_extraction'):
+                response = self.model.generate_content(prompt, stage='keywords')
             keywords = [kw.strip() for kw in response.text.split(',')]
             return keywords
         except Exception as e:
             print(f"キーワード抽出中にエラーが発生しました: {str(e)}")
             return query.split()  # エラー時は単純な分割を使用
     
-    def get_relevant_documents(self, query, n_results=3):
+    def get_relevant_documents(self, query, n_results=3, index=None, where=None):
         """
         クエリに関連するドキュメントを検索
         
         Args:
             query (str): 検索クエリ
             n_results (int): 返す結果の数
+            index (TFIDFSearch, optional): 使用する検索インデックス（未指定の場合は公開中の版）
+            where (dict, optional): メタデータによる絞り込み条件
         
         Returns:
             list: 関連ドキュメントのリスト
@@ -100,49 +127,36 @@ class FireworksRAGSystem:
             
             # キーワードを結合して検索クエリを作成
             search_query = ' '.join(keywords)
-            results = self.search_system.search(search_query, n_results)
+            index = index if index else self.search_system
+            results = index.search(search_query, n_results, where=where)
             return results
         except Exception as e:
             print(f"ドキュメント検索中にエラーが発生しました: {str(e)}")
             return []
     
-    def save_unanswered_question(self, query, keywords):
+    def save_unanswered_question(self, query, keywords, extra_metadata=None):
         """
-        未回答の質問を保存
+        未回答の質問を保存（類似する未対応の質問があればそのクラスタに集約）
         
         Args:
             query (str): ユーザーの質問
             keywords (list): 抽出されたキーワード
+            extra_metadata (dict, optional): 追加のメタデータ
         """
         try:
-            # メタデータの作成
-            metadata = {
-                'query': query,
-                'keywords': json.dumps(keywords, ensure_ascii=False),
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            # ドキュメントIDの生成
-            doc_id = f"unanswered_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-            
-            # コレクションに追加
-            self.unanswered_collection.add(
-                documents=[query],
-                metadatas=[metadata],
-                ids=[doc_id]
-            )
-            
-            print(f"未回答の質問を保存しました: {query}")
+            self.unanswered_store.record(query, keywords, extra_metadata)
         except Exception as e:
             print(f"未回答の質問の保存中にエラーが発生しました: {str(e)}")
     
-    def generate_response(self, query, relevant_docs):
+    def generate_response(self, query, relevant_docs, keywords=None, index=None):
         """
         クエリと関連ドキュメントに基づいて応答を生成
         
         Args:
             query (str): ユーザーの質問
             relevant_docs (list): 関連ドキュメントのリスト
+            keywords (list, optional): 参考情報の選択に使用するキーワード
+            index (TFIDFSearch, optional): 文のスコアリングに使用する検索インデックス
         
         Returns:
             str: 生成された応答
@@ -152,8 +166,16 @@ class FireworksRAGSystem:
             if not relevant_docs:
                 return "ごめんね、わかりません😭"
             
-            # プロンプトの作成
-            context = "\n\n".join([doc['content'] for doc in relevant_docs])
+            # プロンプトの作成（クエリに関連する文だけを予算内で選択）
+            with timed('prompt_build'):
+                scoring_query = ' '.join([query] + list(keywords or []))
+                index = index if index else self.search_system
+                if hasattr(index, 'vectorizer_for'):
+                    vectorizer = index.vectorizer_for(relevant_docs)
+                else:
+                    vectorizer = index.vectorizer
+                context = self.context_packer.pack(scoring_query, relevant_docs, vectorizer)
+            
             prompt = f"""
             以下の情報を参考に、質問に答えてください。
             
@@ -168,35 +190,41 @@ class FireworksRAGSystem:
             """
             
             # 応答の生成
-            response = self.model.generate_content(prompt)
+            with timed('generation'):
+                response = self.model.generate_content(prompt, stage='generate')
             return response.text
         except Exception as e:
             print(f"応答生成中にエラーが発生しました: {str(e)}")
             return "申し訳ありません。回答の生成中にエラーが発生しました。"
     
-    def process_query(self, query):
+    def process_query(self, query, save_unanswered=True, where=None):
         """
         ユーザーのクエリを処理し、応答を生成
         
         Args:
             query (str): ユーザーの質問
+            save_unanswered (bool): 関連ドキュメントがない場合に未回答の質問として保存するか
+            where (dict, optional): メタデータによる絞り込み条件（例: {"host": "example.jp"}）
         
         Returns:
             dict: 処理結果（応答、関連ドキュメント、キーワードを含む）
         """
         try:
-            # キーワードの抽出
-            keywords = self.extract_keywords(query)
-            
-            # 関連ドキュメントの取得
-            relevant_docs = self.get_relevant_documents(query)
-            
-            # 関連ドキュメントがない場合、質問を保存
-            if not relevant_docs:
-                self.save_unanswered_question(query, keywords)
-            
-            # 応答の生成
-            response = self.generate_response(query, relevant_docs)
+            # リクエストの間は同じスナップショットを使い続ける
+            with self.index_manager.acquire() as index:
+                # キーワードの抽出
+                keywords = self.extract_keywords(query)
+                
+                # 関連ドキュメントの取得
+                relevant_docs = self.get_relevant_documents(query, index=index, where=where)
+                
+                # 関連ドキュメントがない場合、質問を保存
+                # （絞り込みで0件になった場合は知識の不足とは限らないため保存しない）
+                if not relevant_docs and save_unanswered and not where:
+                    self.save_unanswered_question(query, keywords)
+                
+                # 応答の生成
+                response = self.generate_response(query, relevant_docs, keywords, index=index)
             
             return {
                 'response': response,
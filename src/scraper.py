@@ -1,10 +1,10 @@
 import requests
 from bs4 import BeautifulSoup
-import chromadb
-from chromadb.config import Settings
 import os
 from dotenv import load_dotenv
 import time
+from text_chunker import iter_chunks
+from chroma_store import ChromaStore
 
 # 環境変数の読み込み
 load_dotenv()
@@ -50,12 +50,10 @@ def scrape_website(url):
         
         # メインコンテンツの取得（より具体的なセレクタを使用）
         main_content = soup.find('div', class_='article-body')
-        if main_content:
-            content = main_content.get_text(strip=True)
-        else:
-            content = soup.get_text(strip=True)
-            
-        return content
+        root = main_content if main_content else soup
+        
+        # 文境界・見出し・リスト項目を尊重してチャンクに分割
+        return list(iter_chunks(root))
     except requests.exceptions.RequestException as e:
         print(f"Error scraping {url}: {str(e)}")
         return None
@@ -65,31 +63,25 @@ def scrape_website(url):
 
 def create_vector_db():
     # ChromaDBの初期化
-    client = chromadb.PersistentClient(path=DB_DIR)
+    store = ChromaStore.get(DB_DIR)
     
     # 既存のコレクションを削除（存在する場合）
-    try:
-        client.delete_collection(name="fireworks_information")
-    except:
-        pass
+    store.delete_collection("fireworks_information")
     
     # コレクションの作成
-    collection = client.create_collection(name="fireworks_information")
+    collection = store.get_collection("fireworks_information", create=True)
     
     # 各Webサイトから情報を取得してベクトル化
     successful_scrapes = 0
     for i, url in enumerate(FIREWORKS_WEBSITES):
         print(f"Scraping {url}...")
-        content = scrape_website(url)
-        if content:
-            # テキストをチャンクに分割（簡易的な実装）
-            chunks = [content[i:i+1000] for i in range(0, len(content), 1000)]
-            
+        chunks = scrape_website(url)
+        if chunks:
             # 各チャンクをベクトルDBに追加
             for j, chunk in enumerate(chunks):
                 collection.add(
                     documents=[chunk],
-                    metadatas=[{"source": url}],
+                    metadatas=[{"source": url, "modified_at": time.time()}],
                     ids=[f"doc_{i}_{j}"]
                 )
             successful_scrapes += 1
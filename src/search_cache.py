@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import threading
+import unicodedata
+from metrics import record_cache
+
+# キャッシュファイルの保存先
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'cache', 'cse_cache.json')
+
+# キャッシュの有効期間（秒）
+DEFAULT_TTL = 7 * 24 * 60 * 60
+
+
+def normalize_keywords(keywords):
+    """
+    キーワードの組を正規化（NFKC正規化・小文字化・重複除去・ソート）
+
+    Args:
+        keywords (list): キーワードのリスト
+
+    Returns:
+        tuple: 正規化したキーワードのタプル
+    """
+    normalized = set()
+    for keyword in keywords:
+        keyword = unicodedata.normalize('NFKC', str(keyword)).strip().lower()
+        if keyword:
+            normalized.add(keyword)
+    return tuple(sorted(normalized))
+
+
+class SearchResultCache:
+    """
+    Custom Searchの検索結果をキーワードの組ごとに保存する永続キャッシュ
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"検索キャッシュの読み込み中にエラーが発生しました: {str(e)}")
+            return {}
+
+    def _save(self):
+        # 一時ファイルに書き出してから置き換える
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _key(keywords):
+        return '\x1f'.join(normalize_keywords(keywords))
+
+    def get(self, keywords):
+        """
+        キャッシュされた検索結果を取得
+
+        Args:
+            keywords (list): 検索キーワード
+
+        Returns:
+            list: URLのリスト（未登録または期限切れの場合はNone）
+        """
+        key = self._key(keywords)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry['fetched_at'] > self.ttl:
+                del self._entries[key]
+                entry = None
+        record_cache('cse', entry is not None)
+        return list(entry['urls']) if entry is not None else None
+
+    def put(self, keywords, urls):
+        """
+        検索結果を保存
+
+        Args:
+            keywords (list): 検索キーワード
+            urls (list): 検索結果のURLリスト
+        """
+        key = self._key(keywords)
+        with self._lock:
+            self._entries[key] = {'urls': list(urls), 'fetched_at': time.time()}
+            try:
+                self._save()
+            except Exception as e:
+                print(f"検索キャッシュの保存中にエラーが発生しました: {str(e)}")
+
+    def purge_expired(self):
+        """期限切れのエントリを削除"""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if now - entry['fetched_at'] > self.ttl]
+            for key in expired:
+                del self._entries[key]
+            if expired:
+                self._save()
+        return len(expired)
@@ -0,0 +1,288 @@
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+from chroma_store import ChromaStore, iter_collection
+from tfidf_search import TFIDFSearch, DEFAULT_VECTORIZER_PARAMS, HYDRATE_MODES
+from document_store import _ColumnView
+from metrics import timed
+
+# シャード数の既定値（環境変数 TFIDF_SHARDS。1の場合はシャードに分けない）
+DEFAULT_SHARDS = 1
+
+# 語彙の選択をすべてのシャードの統計で行うため、シャード単位では適用しない設定
+GLOBAL_VOCABULARY_PARAMS = ('max_features', 'min_df', 'max_df', 'vocabulary')
+
+# 重み付けの設定（語の計数には使わず、統合後に TfidfVectorizer と同じ式で適用する）
+WEIGHTING_PARAMS = ('norm', 'use_idf', 'smooth_idf', 'sublinear_tf')
+
+
+def _count_shard(documents, params):
+    """シャードのドキュメントの語を数える（プロセスプールで実行できるようにモジュール直下に置く）"""
+    vectorizer = CountVectorizer(**params)
+    try:
+        counts = vectorizer.fit_transform(documents)
+    except ValueError:
+        # 語が1つもないシャード
+        return {}, csr_matrix((len(documents), 0), dtype=np.int64)
+    return vectorizer.vocabulary_, counts.tocsr()
+
+
+def _document_frequency_limit(value, n_documents):
+    # min_df / max_df は件数（int）または割合（float）
+    return value if isinstance(value, int) else value * n_documents
+
+
+class ShardedTFIDFSearch:
+    """
+    ドキュメントを複数のシャードに分けたTF-IDF検索システム
+
+    語彙とIDFはすべてのシャードの統計から求め、min_df・max_df・max_features による語の選択も
+    TfidfVectorizer と同じ手順（同点の扱いを含む）で行うため、スコアは分割しない場合と
+    浮動小数点の丸め誤差の範囲で一致する。
+    構築時は各シャードの語の計数を並行に行い、検索時は各シャードのスコアリングと上位k件の選択を
+    スレッドプールで並行に行ってから統合する（疎行列の演算はGILを解放する）。
+    """
+
+    def __init__(self, collection=None, vectorizer_params=None, shards=None, workers=None, hydrate=None,
+                 matrix_dtype=None, use_processes=None):
+        """
+        Args:
+            collection (optional): 検索対象のChromaDBコレクション（未指定の場合は花火情報のコレクション）
+            vectorizer_params (dict, optional): TfidfVectorizerの設定（既定値を上書き）
+            shards (int, optional): シャード数（未指定の場合は環境変数 TFIDF_SHARDS）
+            workers (int, optional): 検索・構築の並行数（未指定の場合はシャード数とCPU数の小さい方）
+            hydrate (str, optional): 本文の取得方法（TFIDFSearch と同じ）
+            matrix_dtype (str, optional): 行列の保持形式（TFIDFSearch と同じ）
+            use_processes (bool, optional): 語の計数をプロセスプールで行うか（未指定の場合は環境変数 TFIDF_SHARD_PROCESSES）
+        """
+        if collection is None:
+            collection = ChromaStore.get().get_collection("fireworks_information")
+        self.collection = collection
+
+        self.vectorizer_params = dict(DEFAULT_VECTORIZER_PARAMS)
+        self.vectorizer_params.update(vectorizer_params or {})
+        self.shard_count = max(1, shards or int(os.getenv('TFIDF_SHARDS', str(DEFAULT_SHARDS))))
+        self.workers = workers or min(self.shard_count, os.cpu_count() or 1)
+        self.hydrate_mode = hydrate or os.getenv('TFIDF_HYDRATE', 'memory')
+        if self.hydrate_mode not in HYDRATE_MODES:
+            raise ValueError(f"未対応の取得方法です: {self.hydrate_mode}")
+        self.matrix_dtype = matrix_dtype
+        if use_processes is None:
+            use_processes = os.getenv('TFIDF_SHARD_PROCESSES') == '1'
+        self.use_processes = use_processes
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tfidf-shard')
+        self._build()
+
+    def _fetch_shards(self):
+        """コレクションを連続した範囲に分けて並行に読み出す（各範囲はページ単位で読む）"""
+        total = self.collection.count()
+        bounds = [total * i // self.shard_count for i in range(self.shard_count + 1)]
+
+        def fetch(i):
+            documents, metadatas, ids = [], [], []
+            start, end = bounds[i], bounds[i + 1]
+            for record in iter_collection(self.collection, offset=start, limit=end - start):
+                documents.append(record['document'] or '')
+                metadatas.append(record['metadata'] or {})
+                ids.append(record['id'])
+            return documents, metadatas, ids
+
+        return list(self._executor.map(fetch, range(self.shard_count)))
+
+    def _build(self):
+        shards = self._fetch_shards()
+        count_params = {
+            k: v for k, v in self.vectorizer_params.items()
+            if k not in GLOBAL_VOCABULARY_PARAMS + WEIGHTING_PARAMS
+        }
+        weighting = {k: v for k, v in self.vectorizer_params.items() if k in WEIGHTING_PARAMS}
+
+        # 1. 各シャードの語を並行に数える
+        documents = [documents for documents, _, _ in shards]
+        if self.use_processes and self.shard_count > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                counted = list(pool.map(_count_shard, documents, [count_params] * len(documents)))
+        else:
+            counted = list(self._executor.map(lambda docs: _count_shard(docs, count_params), documents))
+
+        # 2. すべてのシャードの統計から語彙とIDFを決める
+        n_documents = sum(len(docs) for docs in documents)
+        term_frequency = Counter()
+        document_frequency = Counter()
+        for vocabulary, counts in counted:
+            if not vocabulary:
+                continue
+            terms = np.empty(len(vocabulary), dtype=object)
+            for term, column in vocabulary.items():
+                terms[column] = term
+            tf = np.asarray(counts.sum(axis=0)).ravel()
+            df = np.bincount(counts.indices, minlength=len(vocabulary))
+            for term, t, d in zip(terms, tf, df):
+                term_frequency[term] += int(t)
+                document_frequency[term] += int(d)
+
+        # CountVectorizer._limit_features と同じ手順で選ぶ（語はアルファベット順に並べてから
+        # 語頻度の降順に argsort するため、同じ語頻度の語の選ばれ方まで一致する）
+        terms = sorted(term_frequency)
+        tfs = np.array([term_frequency[t] for t in terms], dtype=np.int64)
+        dfs = np.array([document_frequency[t] for t in terms], dtype=np.int64)
+        mask = np.ones(len(terms), dtype=bool)
+        min_df = self.vectorizer_params.get('min_df')
+        max_df = self.vectorizer_params.get('max_df')
+        if max_df is not None:
+            mask &= dfs <= _document_frequency_limit(max_df, n_documents)
+        if min_df is not None:
+            mask &= dfs >= _document_frequency_limit(min_df, n_documents)
+        max_features = self.vectorizer_params.get('max_features')
+        if max_features is not None and mask.sum() > max_features:
+            selected = np.where(mask)[0][(-tfs[mask]).argsort()[:max_features]]
+            mask = np.zeros(len(terms), dtype=bool)
+            mask[selected] = True
+        candidates = [term for term, keep in zip(terms, mask) if keep]
+        if not candidates:
+            raise ValueError("語彙が空です。ドキュメントを確認してください。")
+        vocabulary = {term: i for i, term in enumerate(candidates)}
+
+        # TfidfVectorizer と同じ式（smooth_idf の場合は文書数と文書頻度に1を足す）
+        df = np.array([document_frequency[t] for t in vocabulary], dtype=np.float64)
+        smooth = int(weighting.get('smooth_idf', True))
+        idf = np.log((smooth + n_documents) / (smooth + df)) + 1
+
+        # クエリ用のベクトライザー（語彙とIDFを固定）
+        self.vectorizer = TfidfVectorizer(**count_params, **weighting, vocabulary=vocabulary).fit([''])
+        use_idf = weighting.get('use_idf', True)
+        if use_idf:
+            self.vectorizer.idf_ = idf
+        norm = weighting.get('norm', 'l2')
+
+        # 3. 各シャードの計数を共通の語彙の列に付け替え、TF-IDF行列にする
+        idf_diag = diags(idf)
+
+        def build_shard(i):
+            shard_vocabulary, counts = counted[i]
+            shard_documents, metadatas, ids = shards[i]
+            mapping = np.full(len(shard_vocabulary), -1, dtype=np.int64)
+            for term, column in shard_vocabulary.items():
+                mapping[column] = vocabulary.get(term, -1)
+            coo = counts.tocoo()
+            columns = mapping[coo.col] if mapping.size else coo.col
+            keep = columns >= 0
+            matrix = csr_matrix((coo.data[keep].astype(np.float64), (coo.row[keep], columns[keep])),
+                                shape=(len(ids), len(vocabulary)))
+            if weighting.get('sublinear_tf'):
+                np.log(matrix.data, out=matrix.data)
+                matrix.data += 1
+            if use_idf:
+                matrix = matrix @ idf_diag
+            if norm:
+                matrix = normalize(matrix, norm=norm, copy=False)
+            return TFIDFSearch.from_matrix(
+                csr_matrix(matrix), self.vectorizer, shard_documents, metadatas, ids,
+                collection=self.collection, hydrate=self.hydrate_mode, matrix_dtype=self.matrix_dtype
+            )
+
+        # ドキュメント数がシャード数より少ない場合の空のシャードは持たない
+        built = self._executor.map(build_shard, [i for i, shard in enumerate(shards) if shard[2]])
+        self.shards = list(built)
+        self.offsets = np.cumsum([0] + [len(shard.ids) for shard in self.shards])
+        self.ids = _ColumnView(self._id_at, int(self.offsets[-1]))
+
+    def _id_at(self, position):
+        shard = int(np.searchsorted(self.offsets, position, side='right')) - 1
+        return self.shards[shard].ids[position - int(self.offsets[shard])]
+
+    def search(self, query, n_results=3, hydrate=True, where=None):
+        """
+        すべてのシャードを並行に検索し、上位k件を統合
+
+        Args:
+            query (str): 検索クエリ
+            n_results (int): 返す結果の数
+            hydrate (bool): メタデータと本文を含めるか
+            where (dict, optional): メタデータによる絞り込み条件
+
+        Returns:
+            list: 検索結果のリスト（TFIDFSearch.search と同じ形式）
+        """
+        with timed('tfidf_transform'):
+            query_vector = self.vectorizer.transform([query])
+
+        def search_shard(i):
+            shard = self.shards[i]
+            mask = shard.metadata_index.mask(where) if where else None
+            if mask is not None and not mask.any():
+                return []
+            similarities = shard.score(query_vector, mask)
+            if n_results < similarities.size:
+                top = np.argpartition(-similarities, n_results)[:n_results]
+            else:
+                top = np.arange(similarities.size)
+            return [(float(similarities[j]), i, int(j)) for j in top if similarities[j] > 0]
+
+        with timed('scoring'):
+            candidates = [hit for hits in self._executor.map(search_shard, range(len(self.shards))) for hit in hits]
+
+        with timed('top_k'):
+            candidates.sort(key=lambda hit: hit[0], reverse=True)
+            results = [
+                {'id': self.shards[i].ids[j], 'score': score, 'position': j, 'shard': i}
+                for score, i, j in candidates[:n_results]
+            ]
+        return self.hydrate(results) if hydrate else results
+
+    def hydrate(self, results):
+        """
+        IDとスコアだけの検索結果に、シャードごとにまとめてメタデータと本文を追加
+
+        Args:
+            results (list): search(hydrate=False) の結果
+
+        Returns:
+            list: メタデータとコンテンツを含む検索結果
+        """
+        hydrated = []
+        for i in dict.fromkeys(r['shard'] for r in results):
+            hydrated.extend(self.shards[i].hydrate([r for r in results if r['shard'] == i]))
+        hydrated.sort(key=lambda r: r['score'], reverse=True)
+        return hydrated
+
+    def close(self):
+        """スレッドプールと各シャードの資源を解放（スナップショットの解放時に呼ぶ）"""
+        self._executor.shutdown(wait=False)
+        for shard in self.shards:
+            shard.close()
+
+
+def create_search_index(collection=None, vectorizer_params=None, **params):
+    """
+    環境変数 TFIDF_SHARDS に応じて検索システムを構築（2以上の場合はシャードに分ける）
+
+    IndexSnapshotManager の builder として使う。
+
+    Args:
+        collection (optional): 検索対象のChromaDBコレクション
+        vectorizer_params (dict, optional): TfidfVectorizerの設定
+        **params: 検索システムに渡すその他の引数
+
+    Returns:
+        TFIDFSearch または ShardedTFIDFSearch
+    """
+    shards = params.pop('shards', None) or int(os.getenv('TFIDF_SHARDS', str(DEFAULT_SHARDS)))
+    if shards > 1:
+        return ShardedTFIDFSearch(collection, vectorizer_params, shards=shards, **params)
+    return TFIDFSearch(collection, vectorizer_params, **params)
+
+
+if __name__ == "__main__":
+    # 使用例（シャードに分けない場合と上位の結果が一致することを確認）
+    query = "隅田川花火大会の日程"
+    sharded = ShardedTFIDFSearch(shards=4)
+    single = TFIDFSearch()
+    print(f"シャード数: {len(sharded.shards)}（{len(sharded.ids)}件）")
+    for result, expected in zip(sharded.search(query), single.search(query)):
+        print(f"{result['score']:.4f} / {expected['score']:.4f} {result['metadata'].get('source', '')}")
@@ -0,0 +1,111 @@
+import threading
+import time
+import pytest
+from admission import AdmissionController, AdmissionRejected
+
+
+def _hold(controller, kind, started, release):
+    with controller.admit(kind):
+        started.set()
+        release.wait(5)
+
+
+def _occupy(controller, kind='query'):
+    started, release = threading.Event(), threading.Event()
+    thread = threading.Thread(target=_hold, args=(controller, kind, started, release))
+    thread.start()
+    assert started.wait(5)
+    return release, thread
+
+
+def _wait_for_queue(controller, depth):
+    deadline = time.monotonic() + 5
+    while controller.status()['queued'] < depth:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_rejects_when_queue_is_full():
+    controller = AdmissionController(max_in_flight=1, max_queue=0)
+    release, thread = _occupy(controller)
+    with pytest.raises(AdmissionRejected) as e:
+        with controller.admit('query'):
+            pass
+    assert e.value.retry_after >= 1
+    release.set()
+    thread.join()
+    assert controller.status() == {'in_flight': 0, 'class_in_flight': {'query': 0}, 'queued': 0}
+
+
+def test_waiter_times_out():
+    controller = AdmissionController(max_in_flight=1, max_queue=4, queue_timeout=0.05)
+    release, thread = _occupy(controller)
+    start = time.monotonic()
+    with pytest.raises(AdmissionRejected):
+        with controller.admit('query'):
+            pass
+    assert time.monotonic() - start >= 0.05
+    assert controller.status()['queued'] == 0
+    release.set()
+    thread.join()
+
+
+def test_waiter_runs_when_slot_is_released():
+    controller = AdmissionController(max_in_flight=1, max_queue=4, queue_timeout=5)
+    release, thread = _occupy(controller)
+    admitted = threading.Event()
+
+    def wait():
+        with controller.admit('query'):
+            admitted.set()
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    _wait_for_queue(controller, 1)
+    assert not admitted.is_set()
+    release.set()
+    waiter.join(5)
+    thread.join()
+    assert admitted.is_set()
+
+
+def test_class_limit_leaves_room_for_search():
+    controller = AdmissionController(max_in_flight=4, max_queue=0, class_limits={'query': 1})
+    release, thread = _occupy(controller, 'query')
+    with pytest.raises(AdmissionRejected):
+        with controller.admit('query'):
+            pass
+    with controller.admit('search'):
+        assert controller.status()['class_in_flight'] == {'query': 1, 'search': 1}
+    release.set()
+    thread.join()
+
+
+def test_search_evicts_queued_query_when_queue_is_full():
+    controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=5)
+    release, thread = _occupy(controller)
+    outcome = {}
+
+    def queued_query():
+        try:
+            with controller.admit('query'):
+                outcome['query'] = 'admitted'
+        except AdmissionRejected:
+            outcome['query'] = 'rejected'
+
+    def queued_search():
+        with controller.admit('search'):
+            outcome['search'] = 'admitted'
+
+    query = threading.Thread(target=queued_query)
+    query.start()
+    _wait_for_queue(controller, 1)
+    search = threading.Thread(target=queued_search)
+    search.start()
+    query.join(5)
+    assert outcome == {'query': 'rejected'}
+
+    release.set()
+    search.join(5)
+    thread.join()
+    assert outcome == {'query': 'rejected', 'search': 'admitted'}
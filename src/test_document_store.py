@@ -0,0 +1,30 @@
+import pytest
+
+pytest.importorskip('numpy')
+
+from document_store import CompactDocumentStore
+
+METADATAS = [
+    {'source': 'https://example.jp/a', 'chunk_index': 0, 'score': 1, 'flag': True, 'big': 2**70},
+    {'source': 'https://example.jp/a', 'chunk_index': 1, 'score': 0.5, 'flag': 1, 'big': 3},
+    {'source': 'https://example.jp/b', 'chunk_index': 2, 'score': 'high', 'flag': 1.0},
+    {},
+    {'source': 'https://example.jp/b', 'modified_at': 1748746800.5, 'flag': False}
+]
+
+
+def test_metadata_round_trip_keeps_original_types():
+    ids = [f'doc_{i}' for i in range(len(METADATAS))]
+    store = CompactDocumentStore([f'本文{i}' for i in range(len(METADATAS))], METADATAS, ids)
+    for i, expected in enumerate(METADATAS):
+        actual = store.metadata(i)
+        assert actual == expected
+        assert {k: type(v) for k, v in actual.items()} == {k: type(v) for k, v in expected.items()}
+    assert store.result(1, 0.25) == {'id': 'doc_1', 'score': 0.25, 'metadata': METADATAS[1], 'content': '本文1'}
+
+
+def test_uniform_columns_use_typed_arrays():
+    store = CompactDocumentStore(None, METADATAS, [str(i) for i in range(len(METADATAS))])
+    assert store.column('chunk_index').values.dtype.kind == 'i'
+    assert store.column('modified_at').values.dtype.kind == 'f'
+    assert store.column('source').values == ['https://example.jp/a', 'https://example.jp/b']
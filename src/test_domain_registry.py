@@ -0,0 +1,72 @@
+import pytest
+
+pytest.importorskip('scipy')
+pytest.importorskip('sklearn')
+
+from tfidf_search import TFIDFSearch
+from index_snapshot import IndexSnapshotManager
+from domain_registry import Domain, DomainRouter, DomainRegistry, FederatedIndex
+
+
+def _federated():
+    domains = [
+        Domain('fireworks', 'fireworks_information', keywords=['花火'], default=True),
+        Domain('sushi', 'sushi_information', keywords=['寿司'])
+    ]
+    indexes = {
+        'fireworks': TFIDFSearch.from_documents(
+            ['隅田川 花火 大会 日程', '長岡 花火 大会 信濃川', 'スターマイン 尺玉 打ち上げ'],
+            [{'source': f'https://fireworks.example.jp/{i}'} for i in range(3)]),
+        'sushi': TFIDFSearch.from_documents(
+            ['江戸前 握り 歴史', '回転 寿司 ネタ シャリ'],
+            [{'source': f'https://sushi.example.jp/{i}'} for i in range(2)])
+    }
+    return FederatedIndex(indexes, DomainRouter(domains, indexes))
+
+
+def test_router_falls_back_to_default_domain():
+    index = _federated()
+    assert index.router.route('まったく関係のない質問') == ['fireworks']
+    results = index.search('江戸前 握り', domains=None)
+    assert results and all(r['metadata']['domain'] == 'sushi' for r in results)
+
+
+def test_router_uses_keywords_and_index_terms():
+    router = _federated().router
+    assert router.route('おすすめの寿司') == ['sushi']
+    assert router.route('長岡の尺玉') == ['fireworks']
+
+
+def test_explicit_domains_skip_the_router():
+    index = _federated()
+    results = index.search('江戸前 握り', domains=['fireworks'])
+    assert all(r['metadata']['domain'] == 'fireworks' for r in results)
+
+
+@pytest.mark.parametrize('domains', ['sushi', [], ['sushi', 'ramen'], [1]])
+def test_invalid_domains_raise_value_error(domains):
+    with pytest.raises(ValueError):
+        _federated().search('江戸前 握り', domains=domains)
+
+
+def test_released_snapshot_shuts_down_executor():
+    manager = IndexSnapshotManager(lambda: _federated())
+    with manager.acquire() as old:
+        manager.rebuild()
+        assert not old._executor._shutdown
+    assert old._executor._shutdown
+    assert not manager.index._executor._shutdown
+
+
+class MissingDomain(Domain):
+    """コレクションが存在しないドメイン"""
+
+    def open_collection(self):
+        raise ValueError(f"Collection {self.collection} does not exist.")
+
+
+def test_missing_domains_are_reported(capsys):
+    registry = DomainRegistry([MissingDomain('sushi', 'sushi_information', db_dir='/tmp/sushi_db')])
+    with pytest.raises(ValueError, match='sushi（sushi_information @ /tmp/sushi_db）'):
+        registry.build_index()
+    assert '次のドメインを除外しました: sushi' in capsys.readouterr().out
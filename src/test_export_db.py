@@ -0,0 +1,215 @@
+import os
+import csv
+import gzip
+import pytest
+
+from export_db import DatabaseExporter
+
+
+def _matches(metadata, where):
+    for key, condition in (where or {}).items():
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+        for op, operand in condition.items():
+            if op == '$eq' and value != operand:
+                return False
+            if op == '$ne' and value == operand:
+                return False
+            if op == '$gt' and (value is None or not value > operand):
+                return False
+    return True
+
+
+class InMemoryCollection:
+    """テスト用のコレクション（DatabaseExporter が使う操作だけを持つ）"""
+
+    def __init__(self):
+        self.rows = {}
+
+    def count(self):
+        return len(self.rows)
+
+    def get(self, ids=None, where=None, limit=None, offset=0, include=('documents', 'metadatas')):
+        selected = [i for i in (ids if ids is not None else self.rows)
+                    if i in self.rows and _matches(self.rows[i][1], where)]
+        selected = selected[offset:offset + limit if limit else None]
+        page = {'ids': selected}
+        if 'documents' in include:
+            page['documents'] = [self.rows[i][0] for i in selected]
+        if 'metadatas' in include:
+            page['metadatas'] = [dict(self.rows[i][1]) for i in selected]
+        if 'embeddings' in include:
+            page['embeddings'] = None
+        return page
+
+    def upsert(self, ids, documents, metadatas, embeddings=None):
+        for i, document, metadata in zip(ids, documents, metadatas):
+            self.rows[i] = (document, dict(metadata))
+
+    add = upsert
+
+    def update(self, ids, metadatas):
+        for i, metadata in zip(ids, metadatas):
+            self.rows[i] = (self.rows[i][0], dict(metadata))
+
+
+class InMemoryStore:
+    def __init__(self):
+        self.collections = {}
+
+    def get_collection(self, name, create=False):
+        if name not in self.collections:
+            self.collections[name] = InMemoryCollection()
+        return self.collections[name]
+
+
+def _exporter(tmp_path, store=None):
+    exporter = DatabaseExporter.__new__(DatabaseExporter)
+    exporter.store = store or InMemoryStore()
+    exporter.collection = exporter.store.get_collection('fireworks_information')
+    exporter.unanswered_collection = exporter.store.get_collection('unanswered_questions')
+    exporter.output_dir = str(tmp_path)
+    exporter.incremental_dir = str(tmp_path / 'incremental')
+    exporter.state_path = str(tmp_path / 'incremental' / 'state.json')
+    return exporter
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'arrow'])
+def test_columnar_round_trip_keeps_all_metadata(tmp_path, file_format):
+    pytest.importorskip('pyarrow')
+    source = _exporter(tmp_path)
+    source.collection.upsert(
+        ids=['chunk_1', 'chunk_2'],
+        documents=['隅田川花火大会は7月に開催されます。', '長岡花火の歴史'],
+        metadatas=[
+            {'source': 'https://example.jp/a', 'timestamp': '2025-06-01T12:00:00', 'chunk_index': 0,
+             'total_chunks': 2, 'modified_at': 1748746800.5, 'domain': 'fireworks'},
+            {'source': 'https://example.jp/b', 'timestamp': '2025-06-01', 'chunk_index': 1,
+             'original_question': '長岡花火の歴史は？'}
+        ]
+    )
+    source.unanswered_collection.upsert(
+        ids=['unanswered_1'],
+        documents=['花火大会の駐車場'],
+        metadatas=[{'query': '花火大会の駐車場', 'keywords': '["駐車場"]', 'timestamp': '2025-06-01T09:00:00',
+                    'last_seen': '2025-06-02T10:30:00.250000', 'hit_count': 3, 'is_updated': False,
+                    'modified_at': 1748856600.25, 'persona': '家族連れ'}]
+    )
+
+    restored = _exporter(tmp_path / 'restored')
+    for name in ('fireworks_information', 'unanswered_questions'):
+        path = str(tmp_path / f'{name}.{file_format}')
+        count = source.export_collection_columnar(name, path, file_format)
+        assert restored.import_columnar(path) == count
+        assert restored.store.collections[name].rows == source.store.collections[name].rows
+
+
+def test_csv_export_is_paged_and_gzip_compressed(tmp_path):
+    exporter = _exporter(tmp_path)
+    exporter.collection.upsert(
+        ids=[f'chunk_{i}' for i in range(5)],
+        documents=[f'花火の説明{i}' for i in range(5)],
+        metadatas=[{'source': f'https://example.jp/{i}', 'timestamp': '2025-06-01'} for i in range(5)]
+    )
+    pages = []
+    get = exporter.collection.get
+
+    def paged_get(**kwargs):
+        pages.append(kwargs.get('limit'))
+        return get(**kwargs)
+
+    exporter.collection.get = paged_get
+    exporter.export_to_csv(page_size=2, compress=True)
+
+    assert pages == [2, 2, 2]
+    paths = [f for f in os.listdir(tmp_path) if f.startswith('fireworks_information_')]
+    assert len(paths) == 1 and paths[0].endswith('.csv.gz')
+    with gzip.open(tmp_path / paths[0], 'rt', encoding='utf-8-sig', newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['id'] for row in rows] == [f'chunk_{i}' for i in range(5)]
+    assert rows[3] == {'id': 'chunk_3', 'content': '花火の説明3', 'source': 'https://example.jp/3',
+                       'timestamp': '2025-06-01'}
+
+
+def _delta_rows(exporter, name='fireworks_information'):
+    directory = exporter.incremental_dir
+    latest = sorted(f for f in os.listdir(directory) if f.startswith(f'{name}_delta_'))
+    return list(exporter._read_rows(os.path.join(directory, latest[-1]))) if latest else []
+
+
+def test_incremental_export_uses_watermark(tmp_path):
+    exporter = _exporter(tmp_path)
+    exporter.collection.upsert(
+        ids=['a', 'b'],
+        documents=['A', 'B'],
+        metadatas=[{'source': 's', 'modified_at': 100.0}, {'source': 's', 'modified_at': 200.0}]
+    )
+    assert exporter.export_incremental()['fireworks_information'] == 2
+
+    exporter.collection.update(ids=['a'], metadatas=[{'source': 's', 'modified_at': 300.0}])
+    assert exporter.export_incremental()['fireworks_information'] == 1
+    assert [row['id'] for row in _delta_rows(exporter)] == ['a']
+    assert exporter.export_incremental()['fireworks_information'] == 0
+
+
+def test_incremental_export_reads_only_changed_rows(tmp_path):
+    exporter = _exporter(tmp_path)
+    exporter.collection.upsert(
+        ids=[f'doc_{i}' for i in range(10)],
+        documents=['D'] * 10,
+        metadatas=[{'source': 's', 'modified_at': float(i)} for i in range(10)]
+    )
+    exporter.export_incremental()
+    exporter.collection.update(ids=['doc_3'], metadatas=[{'source': 's', 'modified_at': 50.0}])
+
+    requests = []
+    get = exporter.collection.get
+
+    def recording_get(**kwargs):
+        requests.append(kwargs)
+        return get(**kwargs)
+
+    exporter.collection.get = recording_get
+    assert exporter.export_incremental()['fireworks_information'] == 1
+    assert requests and all(r.get('where') == {'modified_at': {'$gt': 9.0}} for r in requests)
+
+
+def test_full_scan_picks_up_rows_without_a_newer_watermark(tmp_path):
+    exporter = _exporter(tmp_path)
+    exporter.collection.upsert(ids=['a'], documents=['A'], metadatas=[{'source': 's', 'modified_at': 500.0}])
+    exporter.export_incremental()
+
+    # 復元したレコード（古い modified_at）と modified_at を持たないレコードは通常の差分では検出しない
+    exporter.collection.upsert(
+        ids=['restored', 'legacy'],
+        documents=['R', 'L'],
+        metadatas=[{'source': 's', 'modified_at': 10.0}, {'source': 's'}]
+    )
+    assert exporter.export_incremental()['fireworks_information'] == 0
+    assert exporter.export_incremental(full_scan=True)['fireworks_information'] == 2
+    assert sorted(row['id'] for row in _delta_rows(exporter)) == ['legacy', 'restored']
+    assert exporter.export_incremental(full_scan=True)['fireworks_information'] == 0
+
+
+def test_deletions_are_exported_and_compacted(tmp_path):
+    exporter = _exporter(tmp_path)
+    exporter.collection.upsert(
+        ids=['a', 'b', 'c'],
+        documents=['A', 'B', 'C'],
+        metadatas=[{'source': 's', 'modified_at': 1.0}, {'source': 's', 'modified_at': 2.0},
+                   {'source': 's', 'modified_at': 3.0}]
+    )
+    exporter.export_incremental()
+
+    del exporter.collection.rows['b']
+    exporter.collection.update(ids=['c'], metadatas=[{'source': 'changed', 'modified_at': 4.0}])
+    assert exporter.export_incremental(full_scan=True)['fireworks_information'] == 2
+    assert [(row['id'], row['deleted']) for row in _delta_rows(exporter)] == [('c', ''), ('b', '1')]
+
+    # 1つのランに収まらない行数でも、IDごとに最新の行だけが残る
+    counts = exporter.compact_incremental(run_size=2)
+    assert counts['fireworks_information'] == 2
+    base = os.path.join(exporter.incremental_dir, 'fireworks_information_base.csv')
+    assert [(row['id'], row['source']) for row in exporter._read_rows(base)] == [('a', 's'), ('c', 'changed')]
+    assert not [f for f in os.listdir(exporter.incremental_dir) if '_delta_' in f]
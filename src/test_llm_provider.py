@@ -0,0 +1,55 @@
+import pytest
+from llm_provider import LLMProvider, LatencyDistribution, FakeLLMProvider
+
+
+@pytest.mark.parametrize('spec', [
+    'uniform:1',
+    'normal:1,2,3',
+    'lognormal:0,0.5',
+    'lognormal:-1,0.5',
+    'uniform:2,1',
+    'fixed:-1',
+    'fixed:abc',
+    'exponential:1'
+])
+def test_parse_rejects_invalid_specs(spec):
+    with pytest.raises(ValueError):
+        LatencyDistribution.parse(spec)
+
+
+def test_parse_and_sample_valid_specs():
+    assert LatencyDistribution.parse('').sample() == 0.0
+    assert LatencyDistribution.parse('fixed:0.25').sample() == 0.25
+    uniform = LatencyDistribution.parse('uniform:0.1,0.2', seed=0)
+    assert all(0.1 <= uniform.sample() <= 0.2 for _ in range(100))
+    assert LatencyDistribution.parse('lognormal:0.8,0.5', seed=0).sample() > 0
+
+
+def test_fake_provider_extracts_keywords_deterministically():
+    provider = FakeLLMProvider()
+    response = provider.generate_content('質問文: 隅田川花火大会の日程を教えて')
+    assert response.text == '隅田川花火大会,日程'
+    assert provider.call_count == 1
+
+
+def test_fake_provider_is_reproducible_without_seed():
+    def run():
+        provider = FakeLLMProvider(latency='uniform:0,0.001', error_rate=0.5)
+        outcomes = []
+        for _ in range(20):
+            try:
+                provider.generate_content('こんにちは')
+                outcomes.append(True)
+            except RuntimeError:
+                outcomes.append(False)
+        return outcomes
+
+    assert run() == run()
+
+
+def test_provider_without_generate_content_cannot_be_created():
+    class Incomplete(LLMProvider):
+        name = 'incomplete'
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,78 @@
+import pytest
+
+pytest.importorskip('numpy')
+
+from metrics import REGISTRY, CACHE_METRIC
+from metadata_filter import MetadataIndex, validate_where
+
+METADATAS = [
+    {'source': 'https://a.example.jp/sumida', 'timestamp': '2025-05-01T00:00:00', 'chunk_index': 0},
+    {'source': 'https://a.example.jp/sumida', 'timestamp': '2025-06-15T00:00:00', 'chunk_index': 1},
+    {'source': 'https://b.example.jp/nagaoka', 'timestamp': '2025-07-01T00:00:00', 'chunk_index': 0},
+    {'source': '', 'original_question': '花火の歴史は？', 'timestamp': '2025-08-01T00:00:00'},
+    {'source': 'https://c.example.jp/', 'chunk_index': 3}
+]
+
+
+def _rows(where):
+    return MetadataIndex(METADATAS).mask(where).nonzero()[0].tolist()
+
+
+def test_equality_and_in():
+    assert _rows({'host': 'a.example.jp'}) == [0, 1]
+    assert _rows({'source': {'$eq': 'https://b.example.jp/nagaoka'}}) == [2]
+    assert _rows({'host': {'$in': ['b.example.jp', 'c.example.jp']}}) == [2, 4]
+    assert _rows({'original_question': '花火の歴史は？'}) == [3]
+    assert _rows({'host': 'unknown.example.jp'}) == []
+
+
+def test_ranges_exclude_missing_values():
+    assert _rows({'timestamp': {'$gte': '2025-06-01', '$lt': '2025-08-01'}}) == [1, 2]
+    assert _rows({'timestamp': {'$gt': '2025-07-01T00:00:00'}}) == [3]
+    assert _rows({'chunk_index': {'$lte': 1}}) == [0, 1, 2]
+    assert _rows({'chunk_index': 3}) == [4]
+
+
+def test_conditions_are_combined_with_and():
+    assert _rows({'host': 'a.example.jp', 'chunk_index': {'$gte': 1}}) == [1]
+    assert _rows({}) == [0, 1, 2, 3, 4]
+
+
+def test_mask_is_cached_and_read_only():
+    index = MetadataIndex(METADATAS)
+    first = index.mask({'host': {'$in': ['a.example.jp']}})
+    assert index.mask({'host': {'$in': ['a.example.jp']}}) is first
+    assert not first.flags.writeable
+
+
+def test_mask_cache_hit_ratio_is_exported():
+    labels = {'cache': 'metadata_mask', 'result': 'hit'}
+    hits = REGISTRY.get_counter(CACHE_METRIC, labels)
+    index = MetadataIndex(METADATAS)
+    index.mask({'chunk_index': 0})
+    index.mask({'chunk_index': 0})
+    assert REGISTRY.get_counter(CACHE_METRIC, labels) == hits + 1
+    assert 'rag_cache_hit_ratio{cache="metadata_mask"}' in REGISTRY.render()
+
+
+def test_validate_where_does_not_count_as_cache_lookup():
+    labels = {'cache': 'metadata_mask', 'result': 'miss'}
+    misses = REGISTRY.get_counter(CACHE_METRIC, labels)
+    validate_where({'host': 'a.example.jp'})
+    assert REGISTRY.get_counter(CACHE_METRIC, labels) == misses
+
+
+@pytest.mark.parametrize('where', [
+    {'host': ['a.example.jp', 'b.example.jp']},
+    {'host': {'$in': 'a.example.jp'}},
+    {'host': {'$in': [{'$eq': 'a.example.jp'}]}},
+    {'host': {'$eq': ['a.example.jp']}},
+    {'host': {'$gt': 'a'}},
+    {'timestamp': {'$gte': ['2025-06-01']}},
+    {'timestamp': {'$in': ['2025-06-01']}},
+    {'unknown': 'x'},
+    ['host', 'a.example.jp']
+])
+def test_invalid_conditions_raise_value_error(where):
+    with pytest.raises(ValueError):
+        validate_where(where)
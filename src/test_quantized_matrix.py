@@ -0,0 +1,71 @@
+import pytest
+
+pytest.importorskip('scipy')
+pytest.importorskip('sklearn')
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+from quantized_matrix import ScoringMatrix
+
+DOCUMENTS = [
+    '隅田川 花火 大会 日程 七月',
+    '長岡 花火 大会 信濃川 八月',
+    '花火 打ち上げ 数 二万発',
+    '寿司 歴史 江戸 握り',
+    '',
+    '花火 花火 花火 隅田川'
+]
+
+QUERIES = ['隅田川 花火', '長岡 八月 大会', '江戸 寿司', '存在しない 語']
+
+
+def _fit():
+    vectorizer = TfidfVectorizer(token_pattern=r'(?u)\b\w+\b')
+    return vectorizer, vectorizer.fit_transform(DOCUMENTS)
+
+
+def test_float32_scores_match_cosine_similarity():
+    vectorizer, matrix = _fit()
+    scoring = ScoringMatrix.from_csr(matrix, 'float32')
+    for query in QUERIES:
+        vector = vectorizer.transform([query])
+        expected = cosine_similarity(matrix, vector).ravel()
+        np.testing.assert_allclose(scoring.score(vector), expected, atol=1e-6)
+
+
+def test_uint8_scores_are_within_quantization_error():
+    vectorizer, matrix = _fit()
+    scoring = ScoringMatrix.from_csr(matrix, 'uint8')
+    for query in QUERIES:
+        vector = vectorizer.transform([query])
+        expected = cosine_similarity(matrix, vector).ravel()
+        # 各重みの誤差はスケールの半分以下なので、スコアの誤差はクエリの重みの合計倍まで
+        bound = scoring.row_scale / 2 * vector.sum() + 1e-6
+        assert np.all(np.abs(scoring.score(vector) - expected) <= bound)
+        if expected.max() > 0:
+            assert int(np.argmax(scoring.score(vector))) == int(np.argmax(expected))
+
+
+def test_nbytes_shrinks_with_dtype():
+    _, matrix = _fit()
+    float64 = matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+    float32 = ScoringMatrix.from_csr(matrix, 'float32')
+    uint8 = ScoringMatrix.from_csr(matrix, 'uint8')
+    assert uint8.data.nbytes < float32.data.nbytes < matrix.data.nbytes
+    assert float32.nnz == uint8.nnz == matrix.nnz
+    assert uint8.nbytes < float64
+    assert float32.indices.dtype == uint8.indices.dtype == np.uint16
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'uint8'])
+def test_row_blocks_give_the_same_scores(dtype):
+    vectorizer, matrix = _fit()
+    single = ScoringMatrix.from_csr(matrix, dtype)
+    blocked = ScoringMatrix.from_csr(matrix, dtype, block_rows=4)
+    assert blocked.indices.dtype == np.uint16
+    assert len(blocked.indptr) == 2 * matrix.shape[1] + 1
+    for query in QUERIES:
+        vector = vectorizer.transform([query])
+        np.testing.assert_allclose(blocked.score(vector), single.score(vector), atol=1e-6)
+    np.testing.assert_allclose(blocked.column_sums(), np.asarray(matrix.sum(axis=0)).ravel(), atol=1e-2)
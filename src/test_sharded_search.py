@@ -0,0 +1,77 @@
+import random
+import pytest
+
+pytest.importorskip('scipy')
+pytest.importorskip('sklearn')
+
+from chroma_store import iter_collection
+from tfidf_search import TFIDFSearch
+from sharded_search import ShardedTFIDFSearch
+
+WORDS = ['hanabi', 'taikai', 'sumida', 'nagaoka', 'starmine', 'shakudama', 'yukata', 'yatai',
+         'natsu', 'matsuri', 'kawa', 'uchiage', 'nichitei', 'kaijo', 'kotsu', 'chushajo']
+
+QUERIES = ['sumida hanabi', 'nagaoka taikai nichitei', 'yukata yatai matsuri', 'unknown']
+
+
+class ListCollection:
+    """テスト用のコレクション（ShardedTFIDFSearch が使う操作だけを持つ）"""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.ids = [f'doc_{i}' for i in range(len(documents))]
+        self.metadatas = [{'source': f'https://example.jp/{i % 5}'} for i in range(len(documents))]
+        self.requests = []
+
+    def count(self):
+        return len(self.ids)
+
+    def get(self, limit=None, offset=0, include=('documents', 'metadatas'), where=None):
+        self.requests.append((offset, limit))
+        end = offset + limit if limit is not None else None
+        return {
+            'ids': self.ids[offset:end],
+            'documents': self.documents[offset:end],
+            'metadatas': self.metadatas[offset:end]
+        }
+
+
+def _corpus(n=80, seed=0):
+    rng = random.Random(seed)
+    return [' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 8))) for _ in range(n)]
+
+
+@pytest.mark.parametrize('params', [
+    {},
+    {'max_features': 7},
+    {'max_features': 5, 'min_df': 2, 'max_df': 0.5},
+    {'ngram_range': (1, 2), 'max_features': 20, 'sublinear_tf': True}
+])
+def test_sharded_scores_match_unsharded(params):
+    documents = _corpus()
+    collection = ListCollection(documents)
+    single = TFIDFSearch.from_documents(documents, collection.metadatas, collection.ids, vectorizer_params=params)
+    sharded = ShardedTFIDFSearch(collection, params, shards=3, hydrate='memory')
+    try:
+        assert sharded.vectorizer.vocabulary_ == single.vectorizer.vocabulary_
+        for query in QUERIES:
+            expected = {r['id']: r['score'] for r in single.search(query, n_results=len(documents))}
+            actual = {r['id']: r['score'] for r in sharded.search(query, n_results=len(documents))}
+            assert actual.keys() == expected.keys()
+            for doc_id, score in expected.items():
+                assert actual[doc_id] == pytest.approx(score, abs=1e-9)
+    finally:
+        sharded.close()
+
+
+def test_shards_are_read_in_pages():
+    collection = ListCollection(_corpus(n=50))
+    records = list(iter_collection(collection, page_size=7, offset=10, limit=20))
+    assert [r['id'] for r in records] == [f'doc_{i}' for i in range(10, 30)]
+    assert collection.requests == [(10, 7), (17, 7), (24, 6)]
+
+
+def test_close_shuts_down_executor():
+    sharded = ShardedTFIDFSearch(ListCollection(_corpus(n=10)), shards=2, hydrate='memory')
+    sharded.close()
+    assert sharded._executor._shutdown
@@ -0,0 +1,40 @@
+import random
+from bs4 import BeautifulSoup
+from text_chunker import chunk_blocks, iter_blocks, iter_chunks, iter_text_chunks
+
+
+def test_max_size_holds_after_carry_over():
+    text = 'あ' * 90 + '。' + 'い' * 999 + '。'
+    chunks = list(iter_text_chunks(text))
+    assert [len(c) for c in chunks] == [91, 1000]
+
+
+def test_max_size_is_a_hard_cap():
+    rng = random.Random(0)
+    lines = []
+    for _ in range(200):
+        sentences = ['字' * rng.randint(1, 400) + '。' for _ in range(rng.randint(1, 5))]
+        lines.append(''.join(sentences))
+    chunks = list(iter_text_chunks('\n'.join(lines), target_size=300, max_size=400, overlap=80))
+    assert chunks
+    assert max(len(c) for c in chunks) <= 400
+
+
+def test_inline_elements_are_joined_without_spaces():
+    soup = BeautifulSoup('<p>花火<b>大会</b>の歴史について。</p>', 'html.parser')
+    assert list(iter_blocks(soup)) == [('text', '花火大会の歴史について。')]
+
+
+def test_heading_starts_new_chunk():
+    html = '<h2>日程</h2><p>' + '日程の説明。' * 10 + '</p><h2>会場</h2><p>会場の説明。</p>'
+    chunks = list(iter_chunks(BeautifulSoup(html, 'html.parser'), target_size=500))
+    assert len(chunks) == 2
+    assert chunks[0].startswith('日程\n')
+    assert chunks[1] == '会場\n会場の説明。'
+
+
+def test_heading_drops_carried_over_tail():
+    # 前のセクションが目標サイズに達して区切られた後も、その末尾は次のセクションに引き継がない
+    blocks = [('text', 'あ' * 30 + '。'), ('heading', '見出し'), ('text', 'い' * 10 + '。')]
+    chunks = list(chunk_blocks(blocks, target_size=20, max_size=100, overlap=50))
+    assert chunks == ['あ' * 30 + '。', '見出し\n' + 'い' * 10 + '。']
@@ -0,0 +1,30 @@
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('sklearn')
+
+from tfidf_search import validate_vectorizer_params
+
+
+def test_validate_accepts_whitelisted_params():
+    params = validate_vectorizer_params({'max_features': 5000, 'ngram_range': [1, 2], 'min_df': 2})
+    assert params == {'max_features': 5000, 'ngram_range': (1, 2), 'min_df': 2}
+
+
+@pytest.mark.parametrize('params', [
+    {'max_features': 1},
+    {'max_features': '5000'},
+    {'norm': None},
+    {'token_pattern': '.'},
+    {'ngram_range': [2, 1]},
+    {'ngram_range': [1, 10]},
+    {'min_df': 0},
+    {'max_df': 1.5},
+    {'min_df': 0.9, 'max_df': 0.5},
+    {'sublinear_tf': 'yes'},
+    {'stop_words': 'japanese'},
+    ['max_features', 5000]
+])
+def test_validate_rejects_unsafe_params(params):
+    with pytest.raises(ValueError):
+        validate_vectorizer_params(params)
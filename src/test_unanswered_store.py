@@ -0,0 +1,81 @@
+import time
+import pytest
+
+pytest.importorskip('scipy')
+pytest.importorskip('sklearn')
+
+from unanswered_store import UnansweredQuestionStore
+
+
+class InMemoryCollection:
+    """テスト用のコレクション（UnansweredQuestionStore が使う操作だけを持つ）"""
+
+    def __init__(self):
+        self.rows = {}
+
+    def get(self, ids=None, where=None):
+        if ids is not None:
+            selected = [i for i in ids if i in self.rows]
+        else:
+            selected = [i for i, (_, m) in self.rows.items() if m.get('is_updated') is not True]
+        return {
+            'ids': selected,
+            'documents': [self.rows[i][0] for i in selected],
+            'metadatas': [dict(self.rows[i][1]) for i in selected]
+        }
+
+    def add(self, documents, metadatas, ids):
+        for i, document, metadata in zip(ids, documents, metadatas):
+            self.rows[i] = (document, dict(metadata))
+
+    def update(self, ids, metadatas):
+        for i, metadata in zip(ids, metadatas):
+            self.rows[i] = (self.rows[i][0], dict(metadata))
+
+
+def _settle(store):
+    # バックグラウンドの読み直しが終わるまで待つ
+    deadline = time.monotonic() + 5
+    while store._refreshing:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_similar_questions_share_a_cluster():
+    collection = InMemoryCollection()
+    store = UnansweredQuestionStore(collection)
+    first = store.record('隅田川花火大会の有料席の値段は？', ['隅田川花火大会'])
+    _settle(store)
+    second = store.record('隅田川花火大会の有料席の値段は？', ['隅田川花火大会'])
+    assert first == second
+    assert collection.rows[first][1]['hit_count'] == 2
+    assert store.open_clusters() == [(first, '隅田川花火大会の有料席の値段は？', 2)]
+
+
+def test_unrelated_question_opens_a_new_cluster():
+    collection = InMemoryCollection()
+    store = UnansweredQuestionStore(collection)
+    first = store.record('隅田川花火大会の有料席の値段は？', [])
+    second = store.record('回転寿司のおすすめの店', [])
+    _settle(store)
+    assert first != second
+    assert len(store.open_clusters()) == 2
+
+
+def test_cluster_closed_by_another_process_is_not_reused():
+    collection = InMemoryCollection()
+    store = UnansweredQuestionStore(collection)
+    question = '長岡花火の駐車場はどこ？'
+    first = store.record(question, [])
+    _settle(store)
+
+    # KnowledgeUpdater が対応済みにする（このプロセスの一覧はまだ読み直していない）
+    document, metadata = collection.rows[first]
+    collection.rows[first] = (document, dict(metadata, is_updated=True))
+
+    second = store.record(question, [])
+    _settle(store)
+    assert second != first
+    assert collection.rows[first][1]['hit_count'] == 1
+    assert collection.rows[second][1]['is_updated'] is False
+    assert [cluster_id for cluster_id, _, _ in store.open_clusters()] == [second]
@@ -0,0 +1,229 @@
+import re
+from bs4 import Comment, NavigableString
+
+# チャンクサイズの既定値（文字数）
+DEFAULT_TARGET_SIZE = 500
+DEFAULT_MAX_SIZE = 1000
+DEFAULT_OVERLAP = 100
+
+# ブロック要素として扱うタグ
+BLOCK_TAGS = {
+    'p', 'div', 'section', 'article', 'main', 'aside', 'blockquote', 'pre',
+    'li', 'dt', 'dd', 'tr', 'caption', 'figcaption', 'table', 'ul', 'ol', 'dl',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6'
+}
+HEADING_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+LIST_ITEM_TAGS = {'li', 'dt', 'dd'}
+TABLE_ROW_TAGS = {'tr'}
+
+# テキストを取り出さないタグ
+SKIP_TAGS = {'script', 'style', 'noscript', 'template'}
+
+# 文の区切り（句点・感嘆符・疑問符の直後、閉じ括弧を含む）
+SENTENCE_PATTERN = re.compile(r'[^。！？!?]*[。！？!?]+[」』）)]*|[^。！？!?]+')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def _block_of(node, root):
+    """
+    テキストノードが属するブロック要素を取得
+
+    Args:
+        node: テキストノード
+        root: 走査の起点となる要素
+
+    Returns:
+        ブロック要素（スキップ対象のタグ配下の場合はNone）
+    """
+    block = None
+    for parent in node.parents:
+        if parent.name in SKIP_TAGS:
+            return None
+        if block is None and parent.name in BLOCK_TAGS:
+            block = parent
+        if parent is root:
+            break
+    return block if block is not None else root
+
+
+def _block_kind(block):
+    """ブロック要素の種類を判定"""
+    if block.name in HEADING_TAGS:
+        return 'heading'
+    if block.name in LIST_ITEM_TAGS:
+        return 'list'
+    if block.name in TABLE_ROW_TAGS:
+        return 'row'
+    return 'text'
+
+
+def iter_blocks(root):
+    """
+    パース済みDOMを走査し、ブロック単位のテキストを順に生成
+
+    Args:
+        root: BeautifulSoupのオブジェクトまたは要素
+
+    Yields:
+        tuple: (種類, テキスト)。種類は 'heading', 'list', 'row', 'text' のいずれか
+    """
+    current = None
+    pieces = []
+    for node in root.descendants:
+        if not isinstance(node, NavigableString) or isinstance(node, Comment):
+            continue
+        block = _block_of(node, root)
+        if block is None:
+            continue
+        if block is not current:
+            if pieces:
+                text = WHITESPACE_PATTERN.sub(' ', ''.join(pieces)).strip()
+                if text:
+                    yield _block_kind(current), text
+            current = block
+            pieces = []
+        pieces.append(str(node))
+    if pieces:
+        text = WHITESPACE_PATTERN.sub(' ', ''.join(pieces)).strip()
+        if text:
+            yield _block_kind(current), text
+
+
+def split_sentences(text):
+    """
+    テキストを日本語の文単位に分割
+
+    Args:
+        text (str): 分割するテキスト
+
+    Yields:
+        str: 文
+    """
+    for match in SENTENCE_PATTERN.finditer(text):
+        sentence = match.group().strip()
+        if sentence:
+            yield sentence
+
+
+def _split_long(sentence, max_size):
+    """最大サイズを超える文を固定長で分割"""
+    if len(sentence) <= max_size:
+        yield sentence
+        return
+    for i in range(0, len(sentence), max_size):
+        yield sentence[i:i + max_size]
+
+
+def _rendered_size(units):
+    """_render() した場合の文字数（ブロック境界の改行を含む）"""
+    return sum(len(text) for text, _ in units) + sum(1 for _, starts_block in units[1:] if starts_block)
+
+
+def _render(units):
+    """チャンクの構成単位を結合してテキストにする"""
+    parts = []
+    for text, starts_block in units:
+        if parts and starts_block:
+            parts.append('\n')
+        parts.append(text)
+    return ''.join(parts)
+
+
+def chunk_blocks(blocks, target_size=DEFAULT_TARGET_SIZE, max_size=DEFAULT_MAX_SIZE,
+                 overlap=DEFAULT_OVERLAP):
+    """
+    ブロック列を文境界・見出し・リスト項目を尊重したチャンクにまとめる
+
+    Args:
+        blocks (iterable): (種類, テキスト) のイテラブル
+        target_size (int): 目標とするチャンクの文字数
+        max_size (int): チャンクの最大文字数
+        overlap (int): 前のチャンクから引き継ぐ文字数の上限
+
+    Yields:
+        str: チャンクのテキスト
+    """
+    units = []
+    size = 0
+    fresh = 0
+
+    def carry_over():
+        # 末尾の文をoverlap文字数以内で次のチャンクに引き継ぐ
+        tail = []
+        tail_size = 0
+        for text, starts_block in reversed(units):
+            if tail_size + len(text) > overlap:
+                break
+            tail.insert(0, (text, starts_block))
+            tail_size += len(text)
+        return tail, _rendered_size(tail)
+
+    for kind, text in blocks:
+        # 見出しの前で区切り、前のセクションの内容は引き継がない
+        if kind == 'heading' and units:
+            if fresh:
+                yield _render(units)
+            units, size, fresh = [], 0, 0
+
+        starts_block = True
+        for sentence in split_sentences(text):
+            for piece in _split_long(sentence, max_size):
+                separator = 1 if units and starts_block else 0
+                if size + separator + len(piece) > max_size:
+                    if fresh:
+                        yield _render(units)
+                        units, size = carry_over()
+                        fresh = 0
+                    # 引き継いだ末尾を含めると最大サイズを超える場合は、古い文から捨てる
+                    while units and size + int(starts_block) + len(piece) > max_size:
+                        units.pop(0)
+                        size = _rendered_size(units)
+                separator = 1 if units and starts_block else 0
+                units.append((piece, starts_block))
+                size += separator + len(piece)
+                fresh += 1
+                starts_block = False
+
+                # 見出しは直後の本文と同じチャンクに含める
+                if kind != 'heading' and size >= target_size:
+                    yield _render(units)
+                    units, size = carry_over()
+                    fresh = 0
+
+    if fresh:
+        yield _render(units)
+
+
+def iter_chunks(root, target_size=DEFAULT_TARGET_SIZE, max_size=DEFAULT_MAX_SIZE,
+                overlap=DEFAULT_OVERLAP):
+    """
+    パース済みDOMからチャンクをストリーミングで生成
+
+    Args:
+        root: BeautifulSoupのオブジェクトまたは要素
+        target_size (int): 目標とするチャンクの文字数
+        max_size (int): チャンクの最大文字数
+        overlap (int): 前のチャンクから引き継ぐ文字数の上限
+
+    Yields:
+        str: チャンクのテキスト
+    """
+    return chunk_blocks(iter_blocks(root), target_size, max_size, overlap)
+
+
+def iter_text_chunks(text, target_size=DEFAULT_TARGET_SIZE, max_size=DEFAULT_MAX_SIZE,
+                     overlap=DEFAULT_OVERLAP):
+    """
+    プレーンテキストからチャンクを生成（空行・改行をブロック境界として扱う）
+
+    Args:
+        text (str): 分割するテキスト
+        target_size (int): 目標とするチャンクの文字数
+        max_size (int): チャンクの最大文字数
+        overlap (int): 前のチャンクから引き継ぐ文字数の上限
+
+    Yields:
+        str: チャンクのテキスト
+    """
+    blocks = (('text', line.strip()) for line in text.splitlines() if line.strip())
+    return chunk_blocks(blocks, target_size, max_size, overlap)
@@ -1,58 +1,289 @@
-import chromadb
 import os
+from chroma_store import ChromaStore, iter_collection
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
+from metrics import timed
+from document_store import CompactDocumentStore, MmapStringBuffer
+from quantized_matrix import ScoringMatrix, MATRIX_DTYPES
+from metadata_filter import MetadataIndex, METADATA_KEYS
+
+# TF-IDFベクトライザーの既定の設定
+DEFAULT_VECTORIZER_PARAMS = {
+    'max_features': 10000,
+    'stop_words': 'english',
+    'token_pattern': r'(?u)\b\w+\b'
+}
+
+# API（/index/rebuild）から変更できるベクトライザーの設定
+# norm・token_pattern などスコアリングの前提を変える設定は受け付けない
+REBUILD_VECTORIZER_PARAMS = ('max_features', 'min_df', 'max_df', 'ngram_range', 'sublinear_tf', 'stop_words')
+
+# max_features の許容範囲（極端に小さい語彙で検索品質が落ちるのを防ぐ）
+MIN_MAX_FEATURES = 1000
+MAX_MAX_FEATURES = 200000
+
+# ngram_range の上限
+MAX_NGRAM = 3
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def validate_vectorizer_params(params):
+    """
+    APIから受け取ったベクトライザーの設定を検証
+    
+    Args:
+        params (dict): REBUILD_VECTORIZER_PARAMS のキーだけを含む設定
+    
+    Returns:
+        dict: TfidfVectorizer に渡せる形に正規化した設定
+    
+    Raises:
+        ValueError: 未対応のキーまたは範囲外の値を含む場合
+    """
+    if not isinstance(params, dict):
+        raise ValueError("vectorizer_params は辞書で指定してください")
+    unknown = set(params) - set(REBUILD_VECTORIZER_PARAMS)
+    if unknown:
+        raise ValueError(f"変更できない設定です: {', '.join(sorted(unknown))}"
+                         f"（変更できる設定: {', '.join(REBUILD_VECTORIZER_PARAMS)}）")
+    
+    validated = {}
+    for key, value in params.items():
+        if key == 'max_features':
+            if not _is_int(value) or not MIN_MAX_FEATURES <= value <= MAX_MAX_FEATURES:
+                raise ValueError(f"max_features は{MIN_MAX_FEATURES}〜{MAX_MAX_FEATURES}の整数で指定してください")
+        elif key in ('min_df', 'max_df'):
+            # 整数は文書数、小数は文書の割合
+            if _is_int(value):
+                valid = value >= 1
+            else:
+                valid = isinstance(value, float) and 0.0 < value <= 1.0
+            if not valid:
+                raise ValueError(f"{key} は1以上の整数または0より大きく1以下の小数で指定してください")
+        elif key == 'ngram_range':
+            if (not isinstance(value, (list, tuple)) or len(value) != 2 or not all(_is_int(v) for v in value)
+                    or not 1 <= value[0] <= value[1] <= MAX_NGRAM):
+                raise ValueError(f"ngram_range は [最小, 最大]（1〜{MAX_NGRAM}）で指定してください")
+            value = tuple(value)
+        elif key == 'sublinear_tf':
+            if not isinstance(value, bool):
+                raise ValueError("sublinear_tf は真偽値で指定してください")
+        elif key == 'stop_words':
+            if value not in ('english', None):
+                raise ValueError("stop_words は 'english' または null で指定してください")
+        validated[key] = value
+    
+    min_df, max_df = validated.get('min_df'), validated.get('max_df')
+    if isinstance(min_df, float) and isinstance(max_df, float) and min_df > max_df:
+        raise ValueError("min_df は max_df 以下にしてください")
+    return validated
+
+# 検索結果の本文・メタデータの取得方法
+# memory: インデックスが保持, mmap: 本文は一時ファイルをメモリマップ, chroma: 上位k件をChromaDBから一括取得
+HYDRATE_MODES = ('memory', 'mmap', 'chroma')
 
 class TFIDFSearch:
-    def __init__(self):
-        # データベースの保存ディレクトリを指定
-        self.DB_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'fireworks_db')
+    def __init__(self, collection=None, vectorizer_params=None, hydrate=None, matrix_dtype=None):
+        """
+        Args:
+            collection (optional): 検索対象のChromaDBコレクション（未指定の場合は花火情報のコレクション）
+            vectorizer_params (dict, optional): TfidfVectorizerの設定（既定値を上書き）
+            hydrate (str, optional): 本文の取得方法（HYDRATE_MODES。未指定の場合は環境変数 TFIDF_HYDRATE）
+            matrix_dtype (str, optional): 行列の保持形式（MATRIX_DTYPES。未指定の場合は環境変数 TFIDF_MATRIX_DTYPE）
+        """
+        # ChromaDBの初期化（プロセス全体で共有するクライアントを使用）
+        if collection is None:
+            collection = ChromaStore.get().get_collection("fireworks_information")
+        self.collection = collection
+        
+        self.vectorizer_params = dict(DEFAULT_VECTORIZER_PARAMS)
+        self.vectorizer_params.update(vectorizer_params or {})
         
-        # ChromaDBの初期化
-        self.client = chromadb.PersistentClient(path=self.DB_DIR)
-        self.collection = self.client.get_collection(name="fireworks_information")
+        self.hydrate_mode = hydrate or os.getenv('TFIDF_HYDRATE', 'memory')
+        if self.hydrate_mode not in HYDRATE_MODES:
+            raise ValueError(f"未対応の取得方法です: {self.hydrate_mode}")
+        self.matrix_dtype = self._resolve_matrix_dtype(matrix_dtype)
         
         # ドキュメントの取得とTF-IDFベクトライザーの初期化
         self._initialize_tfidf()
     
+    @classmethod
+    def from_documents(cls, documents, metadatas=None, ids=None, vectorizer_params=None, matrix_dtype=None):
+        """
+        ChromaDBを使わずにメモリ上のドキュメントから検索システムを構築（ベンチマーク・評価用）
+        
+        Args:
+            documents (list): ドキュメントのリスト
+            metadatas (list, optional): メタデータのリスト
+            ids (list, optional): ドキュメントIDのリスト
+            vectorizer_params (dict, optional): TfidfVectorizerの設定（既定値を上書き）
+            matrix_dtype (str, optional): 行列の保持形式
+        
+        Returns:
+            TFIDFSearch: 検索システム
+        """
+        search = cls.__new__(cls)
+        search.collection = None
+        search.hydrate_mode = 'memory'
+        search.matrix_dtype = cls._resolve_matrix_dtype(matrix_dtype)
+        search.vectorizer_params = dict(DEFAULT_VECTORIZER_PARAMS)
+        search.vectorizer_params.update(vectorizer_params or {})
+        search._build(
+            list(documents),
+            list(metadatas) if metadatas is not None else [{'source': ''} for _ in documents],
+            list(ids) if ids is not None else [f"doc_{i}" for i in range(len(documents))]
+        )
+        return search
+    
+    @classmethod
+    def from_matrix(cls, matrix, vectorizer, documents, metadatas, ids, collection=None, hydrate='memory',
+                    matrix_dtype=None):
+        """
+        ベクトル化済みの行列から検索システムを構築（シャードの構築用）
+        
+        Args:
+            matrix: TF-IDF行列（行は L2 正規化済み）
+            vectorizer: 行列の作成に使った学習済みのベクトライザー
+            documents (list): ドキュメントのリスト
+            metadatas (list): メタデータのリスト
+            ids (list): ドキュメントIDのリスト
+            collection (optional): 本文を取得するChromaDBコレクション（hydrate='chroma' の場合）
+            hydrate (str): 本文の取得方法
+            matrix_dtype (str, optional): 行列の保持形式
+        
+        Returns:
+            TFIDFSearch: 検索システム
+        """
+        search = cls.__new__(cls)
+        search.collection = collection
+        search.hydrate_mode = hydrate
+        search.matrix_dtype = cls._resolve_matrix_dtype(matrix_dtype)
+        search.vectorizer_params = dict(vectorizer.get_params())
+        search.vectorizer = vectorizer
+        search.tfidf_matrix = matrix
+        if search.matrix_dtype != 'float64':
+            search.tfidf_matrix = ScoringMatrix.from_csr(matrix, search.matrix_dtype)
+        search._store_documents(documents, metadatas, ids)
+        return search
+    
+    @staticmethod
+    def _resolve_matrix_dtype(matrix_dtype):
+        matrix_dtype = matrix_dtype or os.getenv('TFIDF_MATRIX_DTYPE', 'float64')
+        if matrix_dtype not in MATRIX_DTYPES:
+            raise ValueError(f"未対応の行列の保持形式です: {matrix_dtype}")
+        return matrix_dtype
+    
+    def _fit(self, documents):
+        """ベクトライザーを学習し、指定の保持形式でTF-IDF行列を保持"""
+        self.vectorizer = TfidfVectorizer(**self.vectorizer_params)
+        self.tfidf_matrix = self.vectorizer.fit_transform(documents)
+        if self.matrix_dtype != 'float64':
+            # 単精度・8ビット量子化では転置インデックスに変換し、専用のスコアリングを使う
+            self.tfidf_matrix = ScoringMatrix.from_csr(self.tfidf_matrix, self.matrix_dtype)
+    
     def _initialize_tfidf(self):
         """TF-IDFベクトライザーを初期化し、ドキュメントをベクトル化"""
+        if self.hydrate_mode != 'memory':
+            self._build_streaming()
+            return
+        
         # すべてのドキュメントを取得
         results = self.collection.get()
-        self.documents = results['documents']
-        self.metadatas = results['metadatas']
-        self.ids = results['ids']
-        
-        # TF-IDFベクトライザーの初期化
-        self.vectorizer = TfidfVectorizer(
-            max_features=10000,
-            stop_words='english',
-            token_pattern=r'(?u)\b\w+\b'
-        )
+        self._build(results['documents'], results['metadatas'], results['ids'])
+    
+    def _build_streaming(self):
+        """本文をメモリに残さずにTF-IDF行列を構築（本文は上位k件だけChromaDBまたはmmapから読む）"""
+        ids = []
+        metadatas = []
+        text = MmapStringBuffer(os.getenv('TFIDF_MMAP_DIR')) if self.hydrate_mode == 'mmap' else None
+        
+        def documents():
+            # ページ単位で読み出し、ベクトル化したものから順に手放す
+            for record in iter_collection(self.collection):
+                document = record['document'] or ''
+                metadata = record['metadata'] or {}
+                ids.append(record['id'])
+                if text is not None:
+                    text.append(document)
+                    metadatas.append(metadata)
+                else:
+                    # 本文をChromaDBから取得する場合も、絞り込みに使う項目だけは保持する
+                    metadatas.append({key: metadata[key] for key in METADATA_KEYS if key in metadata})
+                yield document
         
-        # ドキュメントをベクトル化
-        self.tfidf_matrix = self.vectorizer.fit_transform(self.documents)
+        self._fit(documents())
+        
+        self.metadata_index = MetadataIndex(metadatas)
+        if text is not None:
+            self.store = CompactDocumentStore(None, metadatas, ids, text=text.finish())
+        else:
+            self.store = CompactDocumentStore(None, None, ids)
+        self.documents = self.store.documents
+        self.metadatas = self.store.metadatas
+        self.ids = self.store.ids
+    
+    def _build(self, documents, metadatas, ids):
+        """TF-IDF行列を構築し、ドキュメントを配列ベースのストアに格納"""
+        # TF-IDFベクトライザーの初期化とドキュメントのベクトル化
+        self._fit(documents)
+        
+        self._store_documents(documents, metadatas, ids)
+    
+    def _store_documents(self, documents, metadatas, ids):
+        """取得方法に応じてドキュメントをストアに格納し、絞り込み用の配列を作成"""
+        # メタデータによる絞り込み用の配列を事前に作成
+        self.metadata_index = MetadataIndex(metadatas)
+        
+        # チャンクごとの str / dict は持たず、検索結果を返すときだけ生成する
+        if self.hydrate_mode == 'memory':
+            self.store = CompactDocumentStore(documents, metadatas, ids)
+        elif self.hydrate_mode == 'mmap':
+            text = MmapStringBuffer(os.getenv('TFIDF_MMAP_DIR'))
+            for document in documents:
+                text.append(document or '')
+            self.store = CompactDocumentStore(None, metadatas, ids, text=text.finish())
+        else:
+            self.store = CompactDocumentStore(None, None, ids)
+        self.documents = self.store.documents
+        self.metadatas = self.store.metadatas
+        self.ids = self.store.ids
     
-    def search(self, query, n_results=3):
+    def search(self, query, n_results=3, hydrate=True, where=None):
         """
         クエリに基づいて関連ドキュメントを検索
         
         Args:
             query (str): 検索クエリ
             n_results (int): 返す結果の数
+            hydrate (bool): メタデータと本文を含めるか（Falseの場合はIDとスコアのみ。後から hydrate() で取得）
+            where (dict, optional): メタデータによる絞り込み条件（例: {"host": "example.jp"}）
         
         Returns:
             list: 検索結果のリスト（ドキュメントID、スコア、メタデータ、コンテンツを含む）
+        
+        Raises:
+            ValueError: 絞り込み条件が不正な場合
         """
+        # 絞り込み条件に合う行のマスク（同じ条件はキャッシュから再利用）
+        mask = self.metadata_index.mask(where) if where else None
+        if mask is not None and not mask.any():
+            return []
+        
         # クエリをベクトル化
-        query_vector = self.vectorizer.transform([query])
+        with timed('tfidf_transform'):
+            query_vector = self.vectorizer.transform([query])
         
         # コサイン類似度を計算
-        similarities = cosine_similarity(query_vector, self.tfidf_matrix).flatten()
+        with timed('scoring'):
+            similarities = self.score(query_vector, mask)
         
         # 上位n_results件のインデックスを取得
-        top_indices = similarities.argsort()[-n_results:][::-1]
+        with timed('top_k'):
+            top_indices = similarities.argsort()[-n_results:][::-1]
         
         # 結果を整形
         results = []
@@ -61,11 +292,70 @@ class TFIDFSearch:
                 results.append({
                     'id': self.ids[idx],
                     'score': float(similarities[idx]),
-                    'metadata': self.metadatas[idx],
-                    'content': self.documents[idx]
+                    'position': int(idx)
                 })
         
-        return results
+        return self.hydrate(results) if hydrate else results
+    
+    def score(self, query_vector, mask=None):
+        """
+        クエリベクトルとすべての行の類似度を計算
+        
+        Args:
+            query_vector: vectorizer.transform() の結果
+            mask (numpy.ndarray, optional): 対象とする行のマスク
+        
+        Returns:
+            numpy.ndarray: 行ごとの類似度（マスク外の行は0）
+        """
+        if isinstance(self.tfidf_matrix, ScoringMatrix):
+            similarities = self.tfidf_matrix.score(query_vector)
+        else:
+            similarities = cosine_similarity(query_vector, self.tfidf_matrix).flatten()
+        if mask is not None:
+            # 上位k件を選ぶ前に条件に合わない行を除外
+            similarities = np.where(mask, similarities, 0)
+        return similarities
+    
+    def hydrate(self, results):
+        """
+        IDとスコアだけの検索結果にメタデータと本文を追加
+        
+        Args:
+            results (list): search(hydrate=False) の結果
+        
+        Returns:
+            list: メタデータとコンテンツを含む検索結果
+        """
+        if not results:
+            return []
+        with timed('hydrate'):
+            if self.store.has_content:
+                return [self.store.result(r['position'], r['score']) for r in results]
+            
+            # 上位k件をまとめて1回で取得（ChromaDBは順序を保証しないためIDで対応付ける）
+            fetched = self.collection.get(ids=[r['id'] for r in results], include=['documents', 'metadatas'])
+            records = {
+                record_id: (document, metadata)
+                for record_id, document, metadata in zip(fetched['ids'], fetched['documents'], fetched['metadatas'])
+            }
+            hydrated = []
+            for r in results:
+                if r['id'] not in records:
+                    # インデックス構築後に削除されたドキュメント
+                    continue
+                document, metadata = records[r['id']]
+                hydrated.append({
+                    'id': r['id'],
+                    'score': r['score'],
+                    'metadata': metadata or {},
+                    'content': document or ''
+                })
+            return hydrated
+    
+    def close(self):
+        """メモリマップした本文を解放（スナップショットの解放時に呼ぶ）"""
+        self.store.close()
 
 if __name__ == "__main__":
     # 使用例
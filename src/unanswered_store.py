@@ -0,0 +1,241 @@
+import json
+import time
+import uuid
+import threading
+from datetime import datetime
+from scipy.sparse import vstack
+from sklearn.feature_extraction.text import TfidfVectorizer
+from metrics import timed
+
+# 同じクラスタとみなす質問どうしのコサイン類似度
+DEFAULT_SIMILARITY_THRESHOLD = 0.6
+
+# 未対応のクラスタをデータベースから読み直す間隔（秒）
+REFRESH_INTERVAL = 300
+
+# 読み直しの間にクラスタが追加された場合に読み直す回数の上限
+REFRESH_ATTEMPTS = 3
+
+
+class UnansweredQuestionStore:
+    """
+    未回答の質問をクラスタ単位で保存するストア
+
+    新しい質問は未対応のクラスタの代表質問とTF-IDF（文字n-gram）で比較し、
+    類似するクラスタがあればそのヒット数を加算する。なければ新しいクラスタとして保存する。
+    別プロセス（KnowledgeUpdater）が対応済みにしたクラスタには集約せず、新しいクラスタを作る。
+    ベクトライザーの学習し直しはバックグラウンドで行い、リクエストの処理中には行わない。
+    """
+
+    def __init__(self, collection, similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD):
+        """
+        Args:
+            collection: 未回答の質問を保存するChromaDBのコレクション
+            similarity_threshold (float): 同じクラスタとみなす類似度
+        """
+        self.collection = collection
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._ids = []
+        self._texts = []
+        self._hit_counts = []
+        self._vectorizer = None
+        self._matrix = None
+        self._loaded_at = 0.0
+        self._generation = 0
+        self._refreshing = False
+        self.refresh()
+
+    def refresh(self):
+        """未対応のクラスタをデータベースから読み直し、ベクトライザーを学習し直す"""
+        for _ in range(REFRESH_ATTEMPTS):
+            with self._lock:
+                generation = self._generation
+            results = self.collection.get(where={"is_updated": {"$ne": True}})
+            ids = list(results['ids'])
+            texts = list(results['documents'])
+            hit_counts = [int((m or {}).get('hit_count', 1)) for m in results['metadatas']]
+            # 学習はロックの外で行い、その間も record() を止めない
+            vectorizer, matrix = self._fit(texts)
+            with self._lock:
+                # 読み直しの間に record() がクラスタを変更した場合は、もう一度読み直す
+                if generation != self._generation:
+                    continue
+                self._install(ids, texts, hit_counts, vectorizer, matrix)
+                return
+        with self._lock:
+            self._install(ids, texts, hit_counts, vectorizer, matrix)
+
+    def _install(self, ids, texts, hit_counts, vectorizer, matrix):
+        # ロック保持中に呼び出す
+        self._ids = ids
+        self._texts = texts
+        self._hit_counts = hit_counts
+        self._vectorizer = vectorizer
+        self._matrix = matrix
+        self._generation += 1
+        self._loaded_at = time.monotonic()
+
+    def refresh_async(self):
+        """
+        バックグラウンドで読み直す（既に実行中の場合は何もしない）
+
+        Returns:
+            bool: 読み直しを開始した場合はTrue
+        """
+        with self._lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"未回答の質問の読み直し中にエラーが発生しました: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name='unanswered-refresh', daemon=True).start()
+        return True
+
+    @staticmethod
+    def _fit(texts):
+        # 日本語の質問は空白で区切られないため文字n-gramで比較する
+        if not texts:
+            return None, None
+        vectorizer = TfidfVectorizer(analyzer='char_wb', ngram_range=(2, 3))
+        return vectorizer, vectorizer.fit_transform(texts)
+
+    def _drop(self, index):
+        """対応済みになったクラスタをメモリ上の一覧から除く（ロック保持中に呼び出す）"""
+        del self._ids[index]
+        del self._texts[index]
+        del self._hit_counts[index]
+        rows = [i for i in range(self._matrix.shape[0]) if i != index]
+        self._matrix = self._matrix[rows] if rows else None
+        if self._matrix is None:
+            self._vectorizer = None
+        self._generation += 1
+
+    def _append(self, cluster_id, query):
+        """新しいクラスタをメモリ上の一覧に追加（ロック保持中に呼び出す）"""
+        self._ids.append(cluster_id)
+        self._texts.append(query)
+        self._hit_counts.append(1)
+        if self._vectorizer is None:
+            self._vectorizer, self._matrix = self._fit([query])
+        else:
+            # 語彙は学習済みのものを使い、学習し直しはバックグラウンドの読み直しに任せる
+            self._matrix = vstack([self._matrix, self._vectorizer.transform([query])], format='csr')
+        self._generation += 1
+
+    def find_cluster(self, query):
+        """
+        質問が属する未対応のクラスタを検索
+
+        Args:
+            query (str): 質問
+
+        Returns:
+            tuple: (クラスタのインデックス, 類似度)。該当しない場合は (None, 類似度)
+        """
+        if self._vectorizer is None:
+            return None, 0.0
+        vector = self._vectorizer.transform([query])
+        similarities = (self._matrix @ vector.T).toarray().ravel()
+        best = int(similarities.argmax())
+        score = float(similarities[best])
+        if score >= self.similarity_threshold:
+            return best, score
+        return None, score
+
+    def record(self, query, keywords, extra_metadata=None):
+        """
+        未回答の質問を記録
+
+        Args:
+            query (str): ユーザーの質問
+            keywords (list): 抽出されたキーワード
+            extra_metadata (dict, optional): 追加のメタデータ（ペルソナなど）
+
+        Returns:
+            str: 質問が属するクラスタのID
+        """
+        if time.monotonic() - self._loaded_at > REFRESH_INTERVAL:
+            self.refresh_async()
+
+        now = datetime.now().isoformat()
+        with self._lock:
+            index, score = self.find_cluster(query)
+            if index is not None:
+                cluster_id = self._ids[index]
+                current = self.collection.get(ids=[cluster_id])
+                metadata = dict(current['metadatas'][0] or {}) if current['ids'] else None
+                if metadata is None or metadata.get('is_updated'):
+                    # 別プロセスで対応済み（または削除）になったクラスタには集約しない
+                    print(f"クラスタは対応済みのため新しいクラスタを作成します: {cluster_id}")
+                    self._drop(index)
+                    index = None
+
+            if index is not None:
+                # 既存のクラスタのヒット数を加算
+                self._hit_counts[index] += 1
+                metadata.update({
+                    'hit_count': self._hit_counts[index],
+                    'last_seen': now,
+                    'modified_at': time.time()
+                })
+                with timed('chroma_write'):
+                    self.collection.update(ids=[cluster_id], metadatas=[metadata])
+                print(f"未回答の質問を既存のクラスタに集約しました: {cluster_id} (類似度 {score:.2f}, "
+                      f"ヒット数 {self._hit_counts[index]})")
+                return cluster_id
+
+            # 新しいクラスタとして保存
+            cluster_id = f"unanswered_{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
+            metadata = {
+                'query': query,
+                'keywords': json.dumps(keywords, ensure_ascii=False),
+                'timestamp': now,
+                'last_seen': now,
+                'modified_at': time.time(),
+                'hit_count': 1,
+                'is_updated': False
+            }
+            metadata.update(extra_metadata or {})
+            with timed('chroma_write'):
+                self.collection.add(documents=[query], metadatas=[metadata], ids=[cluster_id])
+            self._append(cluster_id, query)
+
+        # 追加したクラスタを含めてベクトライザーを学習し直す
+        self.refresh_async()
+        print(f"未回答の質問を新しいクラスタとして保存しました: {cluster_id}")
+        return cluster_id
+
+    def memory_parts(self):
+        """
+        メモリの内訳の算出に使う保持中の構造
+
+        Returns:
+            dict: 構成要素名 → オブジェクト（texts, ids, matrix, vocabulary）
+        """
+        with self._lock:
+            return {
+                'texts': self._texts,
+                'ids': self._ids,
+                'matrix': self._matrix,
+                'vocabulary': getattr(self._vectorizer, 'vocabulary_', {})
+            }
+
+    def open_clusters(self):
+        """
+        未対応のクラスタをヒット数の多い順に取得
+
+        Returns:
+            list: (クラスタID, 代表質問, ヒット数) のリスト
+        """
+        with self._lock:
+            clusters = list(zip(self._ids, self._texts, self._hit_counts))
+        return sorted(clusters, key=lambda c: c[2], reverse=True)